@@ -91,6 +91,114 @@ REST_FRAMEWORK = {
 FERNET_KEY = os.getenv("FERNET_KEY")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
 FB_VERIFY_TOKEN = os.getenv("FB_VERIFY_TOKEN")
+# app secret for verifying X-Hub-Signature-256 on Messenger webhooks (unset: not verified)
+FB_APP_SECRET = os.getenv("FB_APP_SECRET")
+
+# Routing cache (fb/routing.py): webhook keys and page ids resolved in memory for up to
+# ROUTING_CACHE_TTL seconds; model changes bump a version row in the database, which every
+# process checks at most every ROUTING_VERSION_POLL_SECONDS before using its cached routes
+ROUTING_CACHE_TTL = int(os.getenv("ROUTING_CACHE_TTL", "60"))
+ROUTING_VERSION_POLL_SECONDS = float(os.getenv("ROUTING_VERSION_POLL_SECONDS", "1.0"))
+
+# Messenger inbox: webhook events are stored and answered by `manage.py run_inbox_workers`;
+# unless that runs (or FB_INBOX_EMBEDDED_WORKERS > 0), events are never answered (see README.md)
+# worker threads mostly wait on OpenAI/Graph, so the default is a multiple of the core count
+FB_INBOX_WORKERS = int(os.getenv("FB_INBOX_WORKERS", str(min(32, (os.cpu_count() or 1) * 4))))
+FB_INBOX_POLL_INTERVAL = float(os.getenv("FB_INBOX_POLL_INTERVAL", "0.5"))
+FB_INBOX_STALE_SECONDS = int(os.getenv("FB_INBOX_STALE_SECONDS", "300"))
+FB_INBOX_MAX_ATTEMPTS = int(os.getenv("FB_INBOX_MAX_ATTEMPTS", "3"))
+# failed events are retried with exponential backoff; later events of the same sender wait for them
+FB_INBOX_RETRY_BASE_SECONDS = float(os.getenv("FB_INBOX_RETRY_BASE_SECONDS", "5"))
+FB_INBOX_RETRY_MAX_SECONDS = float(os.getenv("FB_INBOX_RETRY_MAX_SECONDS", "300"))
+# in-process inbox workers for dev / single-node setups (on by default only with DEBUG)
+FB_INBOX_EMBEDDED_WORKERS = int(os.getenv("FB_INBOX_EMBEDDED_WORKERS", "1" if DEBUG else "0"))
+
+# Messenger outbox: replies are queued and sent by `manage.py run_outbox_workers`, at most
+# FB_OUTBOX_PAGE_RATE sends per second per page (bursts up to FB_OUTBOX_PAGE_BURST; the limit
+# is kept in the database, so it holds across all worker processes; 0 disables it);
+# failed sends are retried with exponential backoff. Unless run_outbox_workers runs (or
+# FB_OUTBOX_EMBEDDED_WORKERS > 0), Messenger replies are never sent (see README.md)
+FB_OUTBOX_WORKERS = int(os.getenv("FB_OUTBOX_WORKERS", "4"))
+FB_OUTBOX_POLL_INTERVAL = float(os.getenv("FB_OUTBOX_POLL_INTERVAL", "0.5"))
+FB_OUTBOX_STALE_SECONDS = int(os.getenv("FB_OUTBOX_STALE_SECONDS", "120"))
+FB_OUTBOX_MAX_ATTEMPTS = int(os.getenv("FB_OUTBOX_MAX_ATTEMPTS", "5"))
+FB_OUTBOX_RETRY_BASE_SECONDS = float(os.getenv("FB_OUTBOX_RETRY_BASE_SECONDS", "2"))
+FB_OUTBOX_RETRY_MAX_SECONDS = float(os.getenv("FB_OUTBOX_RETRY_MAX_SECONDS", "300"))
+FB_OUTBOX_PAGE_RATE = float(os.getenv("FB_OUTBOX_PAGE_RATE", "10"))
+FB_OUTBOX_PAGE_BURST = int(os.getenv("FB_OUTBOX_PAGE_BURST", "20"))
+# in-process outbox workers for dev / single-node setups (on by default only with DEBUG)
+FB_OUTBOX_EMBEDDED_WORKERS = int(os.getenv("FB_OUTBOX_EMBEDDED_WORKERS", "1" if DEBUG else "0"))
+
+# Outbound HTTP (utils/http.py): one keep-alive pool per upstream, shared by the OpenAI,
+# Qdrant and Graph API clients
+HTTP_POOL_MAX_CONNECTIONS = int(os.getenv("HTTP_POOL_MAX_CONNECTIONS", "100"))
+HTTP_POOL_MAX_KEEPALIVE = int(os.getenv("HTTP_POOL_MAX_KEEPALIVE", "20"))
+HTTP_POOL_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_POOL_KEEPALIVE_EXPIRY", "30"))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "True") == "True"
+OPENAI_HTTP_TIMEOUT = float(os.getenv("OPENAI_HTTP_TIMEOUT", "60"))
+QDRANT_HTTP_TIMEOUT = float(os.getenv("QDRANT_HTTP_TIMEOUT", "10"))
+GRAPH_API_HTTP_TIMEOUT = float(os.getenv("GRAPH_API_HTTP_TIMEOUT", "10"))
+
+# Vector storage: "qdrant" (QDRANT_* env vars, see ingestion/vector_client.py) or "numpy"
+# (in-process memory-mapped index for dev, CI and small single-node installs)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "qdrant")
+NUMPY_VECTOR_DIR = os.getenv("NUMPY_VECTOR_DIR", str(BASE_DIR / "vector_index"))
+
+# Embedding pipeline
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "128"))
+EMBEDDING_BATCH_MAX_TOKENS = int(os.getenv("EMBEDDING_BATCH_MAX_TOKENS", "100000"))
+EMBEDDING_MAX_WORKERS = int(os.getenv("EMBEDDING_MAX_WORKERS", "4"))
+# rate-limited (429) and 5xx embedding requests are retried with exponential backoff
+EMBEDDING_RETRY_ATTEMPTS = int(os.getenv("EMBEDDING_RETRY_ATTEMPTS", "5"))
+EMBEDDING_RETRY_BASE_SECONDS = float(os.getenv("EMBEDDING_RETRY_BASE_SECONDS", "1"))
+EMBEDDING_RETRY_MAX_SECONDS = float(os.getenv("EMBEDDING_RETRY_MAX_SECONDS", "30"))
+EMBEDDING_CACHE_ENABLED = os.getenv("EMBEDDING_CACHE_ENABLED", "True") == "True"
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", str(BASE_DIR / "embedding_cache.sqlite3"))
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "10000"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# Conversation memory (chat/memory_store.py): active conversations are cached in memory and
+# written in batches every CHAT_MEMORY_FLUSH_INTERVAL seconds (0: on every message); needs
+# each conversation served by one process (sticky widget sessions) when running several
+CHAT_MEMORY_MAX_SESSIONS = int(os.getenv("CHAT_MEMORY_MAX_SESSIONS", "10000"))
+CHAT_MEMORY_FLUSH_INTERVAL = float(os.getenv("CHAT_MEMORY_FLUSH_INTERVAL", "2.0"))
+# older turns beyond a chatbot's memory_max_tokens are summarized by these background threads
+CHAT_SUMMARY_MODEL = os.getenv("CHAT_SUMMARY_MODEL", "gpt-4o-mini")
+CHAT_SUMMARY_WORKERS = int(os.getenv("CHAT_SUMMARY_WORKERS", "2"))
+# `manage.py purge_conversations [--every SECONDS]` deletes conversations idle longer than
+# their chatbot's memory_retention_days (archived first when CHAT_PURGE_ARCHIVE_DIR is set),
+# plus expired delivery records, finished Messenger queue rows and abandoned chunked uploads
+CHAT_PURGE_BATCH_SIZE = int(os.getenv("CHAT_PURGE_BATCH_SIZE", "1000"))
+CHAT_PURGE_PAUSE = float(os.getenv("CHAT_PURGE_PAUSE", "0.05"))
+CHAT_PURGE_ARCHIVE_DIR = os.getenv("CHAT_PURGE_ARCHIVE_DIR") or None
+FB_QUEUE_RETENTION_DAYS = int(os.getenv("FB_QUEUE_RETENTION_DAYS", "7"))
+
+# Delivery dedup (chat/dedup.py): Messenger message ids and widget idempotency keys are
+# remembered this long, and the latest replies are also kept in memory
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", "86400"))
+# a key still being processed is taken over by a redelivery after this long (crashed or timed-out request)
+DEDUP_LEASE_SECONDS = int(os.getenv("DEDUP_LEASE_SECONDS", "120"))
+DEDUP_MEMORY_ENTRIES = int(os.getenv("DEDUP_MEMORY_ENTRIES", "10000"))
+
+# Semantic reply cache (per-chatbot threshold and TTL are set on the Chatbot)
+REPLY_CACHE_ENABLED = os.getenv("REPLY_CACHE_ENABLED", "True") == "True"
+REPLY_CACHE_MAX_ENTRIES = int(os.getenv("REPLY_CACHE_MAX_ENTRIES", "500"))
+
+# Background ingestion jobs (run `manage.py run_ingestion_workers`, or INGESTION_EMBEDDED_WORKERS > 0)
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", "2"))
+INGESTION_POLL_INTERVAL = float(os.getenv("INGESTION_POLL_INTERVAL", "1.0"))
+INGESTION_JOB_STALE_SECONDS = int(os.getenv("INGESTION_JOB_STALE_SECONDS", "600"))
+# running jobs heartbeat at least this often while reading, embedding and deleting
+INGESTION_HEARTBEAT_SECONDS = int(os.getenv("INGESTION_HEARTBEAT_SECONDS", "30"))
+INGESTION_JOB_MAX_ATTEMPTS = int(os.getenv("INGESTION_JOB_MAX_ATTEMPTS", "3"))
+# in-process workers for dev / single-node setups without a separate worker process
+INGESTION_EMBEDDED_WORKERS = int(os.getenv("INGESTION_EMBEDDED_WORKERS", "1" if DEBUG else "0"))
+# uploaded documents are streamed here until their ingestion job finishes
+INGESTION_UPLOAD_DIR = os.getenv("INGESTION_UPLOAD_DIR", str(BASE_DIR / "uploads"))
+INGESTION_UPLOAD_MAX_BYTES = int(os.getenv("INGESTION_UPLOAD_MAX_BYTES", str(1024 ** 3)))
+INGESTION_UPLOAD_MAX_PART_BYTES = int(os.getenv("INGESTION_UPLOAD_MAX_PART_BYTES", str(16 * 1024 * 1024)))
+# chunked uploads with no new part for this long are deleted by `manage.py purge_conversations`
+INGESTION_UPLOAD_EXPIRY_HOURS = float(os.getenv("INGESTION_UPLOAD_EXPIRY_HOURS", "24"))
 
 # CORS settings
 CORS_ALLOWED_ORIGINS = [
@@ -1,6 +1,16 @@
 from django.contrib import admin
-from .models import ChatMemory
+from .models import ChatMemory, ChatMessage, DeliveryRecord
 
 @admin.register(ChatMemory)
 class ChatMemoryAdmin(admin.ModelAdmin):
-    list_display = ("chatbot","fb_user_id","updated_at")
+    list_display = ("chatbot","fb_user_id","started_at","updated_at")
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(admin.ModelAdmin):
+    list_display = ("chatbot","sender_id","role","created_at")
+    list_filter = ("role",)
+
+@admin.register(DeliveryRecord)
+class DeliveryRecordAdmin(admin.ModelAdmin):
+    list_display = ("key","status","created_at","expires_at")
+    list_filter = ("status",)
@@ -0,0 +1,110 @@
+# delivery deduplication: each message key (Messenger mid, widget idempotency key) is processed once
+import asyncio
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from .models import DeliveryRecord
+
+# replies of recently completed keys, so hot duplicates don't reach the database
+_done = OrderedDict()  # key -> (expires timestamp, reply)
+_done_lock = threading.Lock()
+_claims = 0
+_stats = {"claimed": 0, "duplicates": 0, "released": 0}
+
+def _ttl() -> int:
+    return getattr(settings, "DEDUP_TTL_SECONDS", 86400)
+
+def _lease() -> int:
+    return getattr(settings, "DEDUP_LEASE_SECONDS", 120)
+
+def _remember(key: str, reply: str, expires: float):
+    with _done_lock:
+        _done[key] = (expires, reply)
+        _done.move_to_end(key)
+        while len(_done) > getattr(settings, "DEDUP_MEMORY_ENTRIES", 10000):
+            _done.popitem(last=False)
+
+def _remembered(key: str) -> Optional[str]:
+    with _done_lock:
+        entry = _done.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.time():
+            del _done[key]
+            return None
+        return entry[1]
+
+def claim_delivery(key: str, lease: int = None) -> Tuple[bool, Optional[DeliveryRecord]]:
+    """Claim key for processing.
+
+    Returns (True, record) for a new (or expired) key, and (False, record) for a
+    duplicate; the duplicate's record has status "done" and the reply once the
+    first delivery finished. The claim is a lease of lease seconds (default
+    DEDUP_LEASE_SECONDS): if its holder neither completes nor releases it in
+    time (crash, timeout), a redelivery takes it over. Expired records are
+    purged every 1000 claims.
+    """
+    global _claims
+    reply = _remembered(key)
+    if reply is not None:
+        _stats["duplicates"] += 1
+        return False, DeliveryRecord(key=key, status=DeliveryRecord.STATUS_DONE, reply=reply)
+    now = timezone.now()
+    expires_at = now + datetime.timedelta(seconds=_lease() if lease is None else lease)
+    try:
+        with transaction.atomic():
+            record = DeliveryRecord.objects.create(key=key, expires_at=expires_at)
+    except IntegrityError:
+        # take over an expired record (or lapsed lease), otherwise it's a duplicate
+        taken = DeliveryRecord.objects.filter(key=key, expires_at__lte=now).update(
+            status=DeliveryRecord.STATUS_PROCESSING, reply="", expires_at=expires_at
+        )
+        record = DeliveryRecord.objects.filter(key=key).first()
+        if not taken:
+            _stats["duplicates"] += 1
+            if record is not None and record.status == DeliveryRecord.STATUS_DONE:
+                _remember(key, record.reply, record.expires_at.timestamp())
+            return False, record
+    _stats["claimed"] += 1
+    _claims += 1
+    if _claims % 1000 == 0:
+        DeliveryRecord.objects.filter(expires_at__lte=now).delete()
+    return True, record
+
+def complete_delivery(key: str, reply: str):
+    expires_at = timezone.now() + datetime.timedelta(seconds=_ttl())
+    DeliveryRecord.objects.filter(key=key).update(status=DeliveryRecord.STATUS_DONE, reply=reply or "",
+                                                  expires_at=expires_at)
+    _remember(key, reply or "", expires_at.timestamp())
+
+def release_delivery(key: str):
+    """Forget a claim whose processing failed, so a redelivery is processed again"""
+    DeliveryRecord.objects.filter(key=key, status=DeliveryRecord.STATUS_PROCESSING).delete()
+    _stats["released"] += 1
+
+aclaim_delivery = sync_to_async(claim_delivery)
+acomplete_delivery = sync_to_async(complete_delivery)
+arelease_delivery = sync_to_async(release_delivery)
+
+async def await_reply(key: str, timeout: float = 30.0, interval: float = 0.25) -> Optional[str]:
+    """Reply of a key that another request is still processing (None on timeout, failure or a lapsed lease)"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        record = await DeliveryRecord.objects.filter(key=key).afirst()
+        if record is None or record.expires_at <= timezone.now():
+            return None
+        if record.status == DeliveryRecord.STATUS_DONE:
+            return record.reply
+        await asyncio.sleep(interval)
+    return None
+
+def dedup_stats() -> dict:
+    with _done_lock:
+        cached = len(_done)
+    return {**_stats, "memory_entries": cached}
@@ -0,0 +1,34 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from chat.purge import purge_conversations
+from chatbot.models import Chatbot
+
+class Command(BaseCommand):
+    help = "Delete (or archive and delete) conversations idle longer than their chatbot's retention, in batches"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chatbot", type=int, default=None, help="Only purge this chatbot id")
+        parser.add_argument("--batch-size", type=int, default=None, help="Conversations deleted per transaction")
+        parser.add_argument("--pause", type=float, default=None, help="Seconds to sleep between batches")
+        parser.add_argument("--archive", default=None, help="Write purged conversations to a gzipped JSONL file in this directory")
+        parser.add_argument("--every", type=float, default=None,
+                            help="Keep running and purge every this many seconds (default: once)")
+
+    def handle(self, *args, **options):
+        chatbot = Chatbot.objects.get(pk=options["chatbot"]) if options["chatbot"] else None
+        archive = options["archive"] or getattr(settings, "CHAT_PURGE_ARCHIVE_DIR", None)
+        while True:
+            stats = purge_conversations(options["batch_size"], archive, options["pause"], chatbot)
+            self.stdout.write(self.style.SUCCESS(
+                f"Purged {stats['conversations']} conversation(s), {stats['messages']} message(s), "
+                f"{stats['deliveries']} delivery record(s), {stats['fb_events']} Messenger queue row(s) "
+                f"and {stats['uploads']} abandoned upload(s) "
+                f"in {stats['seconds']:.1f}s ({stats['rows_per_second']:.0f} rows/s)"
+            ))
+            if not options["every"]:
+                return
+            try:
+                time.sleep(options["every"])
+            except KeyboardInterrupt:
+                return
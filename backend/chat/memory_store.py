@@ -0,0 +1,367 @@
+# write-behind conversation memory: active conversations live in an in-process LRU and their
+# new messages are inserted in batches
+import asyncio
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from .models import ChatMemory, ChatMessage
+from .summary import messages_to_fold, summarize
+
+# ChatMemory columns written by flush()
+MEMORY_FIELDS = ["started_at", "updated_at", "summary", "summary_until"]
+
+class ConversationStore:
+    """Active conversations (ChatMemory with its recent messages), kept in memory and flushed in batches.
+
+    add_message only changes the cached ChatMemory and queues the new
+    ChatMessage; queued messages and changed conversations are written together
+    every flush_interval seconds by a background thread, soon after a changed
+    conversation is evicted from the LRU (max_sessions), and by close() at
+    interpreter exit. With flush_interval <= 0 every message is written immediately (async
+    code uses aadd_message, which awaits the write in a worker thread).
+
+    When a conversation's window outgrows its chatbot's memory_max_tokens, the
+    oldest turns are summarized by a summary_workers thread pool and dropped
+    from the window once the new summary is in (see chat/summary.py).
+
+    A conversation is best served by one process at a time (inbox workers
+    serialize per conversation; widget traffic should use sticky sessions),
+    since other processes only see it after a flush. Writes are checked
+    against ChatMemory.version, so a flush never overwrites a conversation
+    another process changed meanwhile: its messages are still inserted, and
+    the cached copy is dropped so the next request reloads it.
+    """
+
+    def __init__(self, max_sessions: int = 10000, flush_interval: float = 2.0, summary_workers: int = 2):
+        self.max_sessions = max_sessions
+        self.flush_interval = flush_interval
+        self.summary_workers = summary_workers
+        self._summarizer = None
+        self._summarizing = set()
+        self._sessions: "OrderedDict[Tuple[int, str], ChatMemory]" = OrderedDict()
+        self._dirty: Dict[Tuple[int, str], ChatMemory] = {}
+        self._pending: List[ChatMessage] = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self.messages = 0
+        self.flushes = 0
+        self.rows_written = 0
+        self.conflicts = 0
+        self.loads = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def _cached(self, key) -> ChatMemory:
+        with self._lock:
+            mem = self._sessions.get(key)
+            if mem is None:
+                # evicted but not flushed yet: the dirty copy is the current one
+                mem = self._dirty.get(key)
+                if mem is not None:
+                    self._put(key, mem)
+            else:
+                self._sessions.move_to_end(key)
+            return mem
+
+    def _put(self, key, mem: ChatMemory):
+        self._sessions[key] = mem
+        self._sessions.move_to_end(key)
+        evicted = False
+        while len(self._sessions) > self.max_sessions:
+            old_key, _ = self._sessions.popitem(last=False)
+            evicted = evicted or old_key in self._dirty
+        if evicted:
+            self._wakeup.set()
+
+    def _load(self, chatbot, sender_id: str) -> Tuple[ChatMemory, bool]:
+        """(conversation with its recent messages, whether it had expired)"""
+        self.loads += 1
+        mem = ChatMemory.objects.filter(chatbot=chatbot, fb_user_id=sender_id).first()
+        if mem is None:
+            # not inserted until it has messages to flush
+            mem = ChatMemory(chatbot=chatbot, fb_user_id=sender_id, updated_at=timezone.now())
+            mem.messages = []
+            return mem, False
+        mem.chatbot = chatbot
+        if mem.is_expired():
+            mem._reset()
+            return mem, True
+        mem.load_messages()
+        return mem, False
+
+    def _start(self, loaded: Tuple[ChatMemory, bool], key) -> ChatMemory:
+        mem, expired = loaded
+        with self._lock:
+            current = self._sessions.get(key) or self._dirty.get(key)
+            if current is not None:  # loaded concurrently
+                return current
+            self._put(key, mem)
+        if expired:
+            self._changed(mem)
+        return mem
+
+    def get(self, chatbot, sender_id: str) -> ChatMemory:
+        """The conversation of sender_id with chatbot (history cleared if expired)"""
+        key = (chatbot.id, sender_id)
+        mem = self._cached(key)
+        if mem is None:
+            mem = self._start(self._load(chatbot, sender_id), key)
+        else:
+            mem.chatbot = chatbot  # pick up changed settings (e.g. memory_max_tokens)
+            if mem.is_expired():
+                self.clear(mem)
+        return mem
+
+    async def aget(self, chatbot, sender_id: str) -> ChatMemory:
+        key = (chatbot.id, sender_id)
+        mem = self._cached(key)
+        if mem is None:
+            mem = self._start(await sync_to_async(self._load)(chatbot, sender_id), key)
+        else:
+            mem.chatbot = chatbot
+            if mem.is_expired():
+                self.clear(mem)
+        return mem
+
+    def _changed(self, mem: ChatMemory):
+        with self._lock:
+            self._dirty[(mem.chatbot_id, mem.fb_user_id)] = mem
+        self._schedule()
+
+    def _schedule(self):
+        if self.flush_interval <= 0 and not _in_event_loop():
+            self.flush()
+        else:
+            # the ORM can't be used from the event loop: leave the write to the flusher thread
+            self._ensure_flusher()
+            if self.flush_interval <= 0:
+                self._wakeup.set()
+
+    def _queue(self, mem: ChatMemory, role: str, text: str):
+        with self._lock:
+            self._pending.append(mem._append(role, text))
+            self._dirty[(mem.chatbot_id, mem.fb_user_id)] = mem
+            self.messages += 1
+
+    def add_message(self, mem: ChatMemory, role: str, text: str):
+        self._queue(mem, role, text)
+        self._schedule()
+        if role == ChatMessage.ROLE_ASSISTANT:
+            self._compact_later(mem)
+
+    async def aadd_message(self, mem: ChatMemory, role: str, text: str):
+        """add_message for async code; a write-through store awaits the write in a worker thread"""
+        self._queue(mem, role, text)
+        if self.flush_interval <= 0:
+            await sync_to_async(self.flush)()
+        else:
+            self._ensure_flusher()
+        if role == ChatMessage.ROLE_ASSISTANT:
+            self._compact_later(mem)
+
+    def _compact_later(self, mem: ChatMemory):
+        """Summarize the oldest turns in the background when the window is over budget"""
+        key = (mem.chatbot_id, mem.fb_user_id)
+        max_tokens = mem.chatbot.memory_max_tokens
+        with self._lock:
+            if key in self._summarizing or self._stop.is_set():
+                return
+            messages = list(mem.messages)
+            fold = messages_to_fold(messages, max_tokens)
+            if not fold:
+                return
+            self._summarizing.add(key)
+            if self._summarizer is None:
+                self._summarizer = ThreadPoolExecutor(max_workers=self.summary_workers,
+                                                      thread_name_prefix="chat-summary")
+        self._summarizer.submit(self._compact, mem, key, mem.summary, messages[:fold], max_tokens)
+
+    def _compact(self, mem: ChatMemory, key, previous: str, folded: list, max_tokens: int):
+        try:
+            summary = summarize(previous, folded, max_tokens)
+        except Exception as e:
+            print(f"✗ Error summarizing conversation {key}: {e}")
+            self.summary_failures += 1
+            with self._lock:
+                self._summarizing.discard(key)
+            return
+        with self._lock:
+            self._summarizing.discard(key)
+            # skip if the conversation was reset or compacted meanwhile
+            if mem.summary != previous or mem.messages[:len(folded)] != folded:
+                return
+            mem.messages = mem.messages[len(folded):]
+            mem.summary = summary
+            mem.summary_until = parse_datetime(folded[-1]["time"])
+            self.summaries += 1
+        self._changed(mem)
+
+    def clear(self, mem: ChatMemory):
+        """Start a new conversation; earlier messages are kept but no longer sent to the model"""
+        mem._reset()
+        self._changed(mem)
+
+    def flush(self) -> int:
+        """Insert queued messages and write changed conversations; returns the number of rows written"""
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._dirty.values())
+                messages = self._pending
+                self._dirty.clear()
+                self._pending = []
+            if not batch and not messages:
+                return 0
+            written, conflicts = [], []
+            try:
+                with transaction.atomic():
+                    if messages:
+                        ChatMessage.objects.bulk_create(messages)
+                    for mem in batch:
+                        version = self._write(mem)
+                        if version is None:
+                            conflicts.append(mem)
+                        else:
+                            written.append((mem, version))
+            except Exception as e:
+                print(f"✗ Error flushing {len(messages)} message(s) of {len(batch)} conversation(s): {e}")
+                with self._lock:
+                    for mem in batch:
+                        self._dirty.setdefault((mem.chatbot_id, mem.fb_user_id), mem)
+                    self._pending[:0] = messages
+                return 0
+            # only now that the rows are committed
+            for mem, version in written:
+                mem.version = version
+            for mem in conflicts:
+                self._evict(mem)
+            self.flushes += 1
+            self.conflicts += len(conflicts)
+            self.rows_written += len(batch) + len(messages)
+            return len(batch) + len(messages)
+
+    def _write(self, mem: ChatMemory):
+        """Write one conversation; returns its new version, or None if another process changed it"""
+        if mem.pk is not None:
+            fields = {name: getattr(mem, name) for name in MEMORY_FIELDS}
+            if ChatMemory.objects.filter(pk=mem.pk, version=mem.version).update(version=mem.version + 1, **fields):
+                return mem.version + 1
+            if ChatMemory.objects.filter(pk=mem.pk).exists():
+                self._touch(ChatMemory.objects.filter(pk=mem.pk), mem)
+                return None
+            mem.pk = None  # purged while cached (chat/purge.py): insert it again
+        try:
+            with transaction.atomic():
+                mem.save(force_insert=True)
+            return mem.version
+        except IntegrityError:
+            # another process started this conversation meanwhile
+            mem.pk = None
+            self._touch(ChatMemory.objects.filter(chatbot_id=mem.chatbot_id, fb_user_id=mem.fb_user_id), mem)
+            return None
+
+    def _touch(self, queryset, mem: ChatMemory):
+        """Keep a conflicting row's summary, but record the activity and move its version"""
+        queryset.filter(updated_at__lt=mem.updated_at).update(updated_at=mem.updated_at)
+        queryset.update(version=F("version") + 1)
+
+    def _evict(self, mem: ChatMemory):
+        """Drop a cached conversation so the next request reloads it (unless it changed again)"""
+        key = (mem.chatbot_id, mem.fb_user_id)
+        with self._lock:
+            if key not in self._dirty and self._sessions.get(key) is mem:
+                del self._sessions[key]
+
+    def _ensure_flusher(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="chat-memory-flush", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stop.is_set():
+            # write-through stores only hand work to this thread from async code, with a wakeup
+            self._wakeup.wait(self.flush_interval if self.flush_interval > 0 else None)
+            self._wakeup.clear()
+            if self._stop.is_set():
+                break  # close() writes the rest
+            try:
+                close_old_connections()
+                self.flush()
+            finally:
+                close_old_connections()
+
+    def close(self, attempts: int = 3, retry_delay: float = 1.0):
+        """Stop the background threads and write everything still queued.
+
+        A failing final flush is retried attempts times; RuntimeError is raised
+        if messages remain unwritten, so the loss is not silent.
+        """
+        self._stop.set()
+        self._wakeup.set()
+        if self._summarizer is not None:
+            self._summarizer.shutdown(wait=False, cancel_futures=True)
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join()
+        for attempt in range(attempts):
+            self.flush()
+            with self._lock:
+                messages, conversations = len(self._pending), len(self._dirty)
+            if not messages and not conversations:
+                return
+            if attempt + 1 < attempts:
+                time.sleep(retry_delay)
+        print(f"✗ Conversation store closed with {messages} message(s) of {conversations} conversation(s) unwritten")
+        raise RuntimeError(f"Could not write {messages} message(s) of {conversations} conversation(s)")
+
+    def stats(self) -> dict:
+        return {
+            "sessions": len(self._sessions),
+            "dirty": len(self._dirty),
+            "messages": self.messages,
+            "loads": self.loads,
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "conflicts": self.conflicts,
+            "writes_per_message": self.flushes / self.messages if self.messages else 0.0,
+            "summaries": self.summaries,
+            "summary_failures": self.summary_failures,
+        }
+
+def _in_event_loop() -> bool:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_conversation_store() -> ConversationStore:
+    """Get or create the process-wide conversation store (closed at interpreter exit)"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ConversationStore(
+                    max_sessions=getattr(settings, "CHAT_MEMORY_MAX_SESSIONS", 10000),
+                    flush_interval=getattr(settings, "CHAT_MEMORY_FLUSH_INTERVAL", 2.0),
+                    summary_workers=getattr(settings, "CHAT_SUMMARY_WORKERS", 2),
+                )
+                atexit.register(_store.close)
+    return _store
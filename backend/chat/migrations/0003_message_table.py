@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:51
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+from django.utils.dateparse import parse_datetime
+
+
+def copy_json_history(apps, schema_editor):
+    ChatMemory = apps.get_model("chat", "ChatMemory")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    batch = []
+    for mem in ChatMemory.objects.iterator(chunk_size=500):
+        for entry in mem.messages or []:
+            created_at = parse_datetime(entry.get("time") or "") or mem.updated_at
+            batch.append(ChatMessage(chatbot_id=mem.chatbot_id, sender_id=mem.fb_user_id, role=entry.get("role", "user"),
+                                     text=entry.get("text", ""), created_at=created_at))
+        if len(batch) >= 1000:
+            ChatMessage.objects.bulk_create(batch)
+            batch = []
+    ChatMessage.objects.bulk_create(batch)
+
+
+def restore_json_history(apps, schema_editor):
+    # the JSON field only kept the latest turns
+    ChatMemory = apps.get_model("chat", "ChatMemory")
+    ChatMessage = apps.get_model("chat", "ChatMessage")
+    for mem in ChatMemory.objects.iterator(chunk_size=500):
+        rows = ChatMessage.objects.filter(chatbot_id=mem.chatbot_id, sender_id=mem.fb_user_id).order_by("-created_at", "-id")[:6]
+        mem.messages = [{"role": m.role, "text": m.text, "time": m.created_at.isoformat()} for m in reversed(rows)]
+        ChatMemory.objects.filter(pk=mem.pk).update(messages=mem.messages)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0002_delivery_records'),
+        ('chatbot', '0007_context_assembly'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmemory',
+            name='started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='ChatMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sender_id', models.CharField(max_length=200)),
+                ('role', models.CharField(choices=[('user', 'User'), ('assistant', 'Assistant')], max_length=20)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('chatbot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='chatbot.chatbot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['chatbot', 'sender_id', 'created_at'], name='chat_message_conversation')],
+            },
+        ),
+        migrations.RunPython(copy_json_history, restore_json_history),
+        migrations.RemoveField(
+            model_name='chatmemory',
+            name='messages',
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0003_message_table'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmemory',
+            name='summary',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='chatmemory',
+            name='summary_until',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
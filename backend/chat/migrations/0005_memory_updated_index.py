@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0004_conversation_summary'),
+        ('chatbot', '0009_memory_retention'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='chatmemory',
+            index=models.Index(fields=['chatbot', 'updated_at'], name='chat_memory_chatbot_updated'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0005_memory_updated_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatmemory',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -1,27 +1,135 @@
+from typing import Dict, List
 from django.db import models
 from django.utils import timezone
 from chatbot.models import Chatbot
+from utils.tokens import estimate_tokens
 import datetime
 
+class ChatMessage(models.Model):
+    """One turn of a conversation; history is append-only and read back by (chatbot, sender, created_at)"""
+    ROLE_USER = "user"
+    ROLE_ASSISTANT = "assistant"
+    ROLE_CHOICES = [
+        (ROLE_USER, "User"),
+        (ROLE_ASSISTANT, "Assistant"),
+    ]
+
+    chatbot = models.ForeignKey(Chatbot, on_delete=models.CASCADE, related_name="chat_messages")
+    sender_id = models.CharField(max_length=200)
+    role = models.CharField(max_length=20, choices=ROLE_CHOICES)
+    text = models.TextField()
+    created_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [models.Index(fields=["chatbot", "sender_id", "created_at"], name="chat_message_conversation")]
+
+    def as_entry(self) -> Dict:
+        return {"role": self.role, "text": self.text, "time": self.created_at.isoformat()}
+
+    def __str__(self):
+        return f"{self.sender_id} ({self.role}): {self.text[:50]}"
+
 class ChatMemory(models.Model):
+    """A conversation of one sender with a chatbot; its turns are ChatMessage rows.
+
+    Turns up to summary_until are condensed into summary; messages holds the
+    later ones, sent verbatim (loaded by load_messages()). The window is
+    compacted in blocks rather than as a sliding window (see chat/summary.py),
+    so the prompt prefix stays the same between compactions.
+    """
+    # upper bound on the turns read back when a conversation is loaded
+    LOAD_MESSAGES = 50
+
     chatbot = models.ForeignKey(Chatbot, on_delete=models.CASCADE, related_name="memories")
     fb_user_id = models.CharField(max_length=200, db_index=True)
-    messages = models.JSONField(default=list)
+    # messages before this belong to an expired conversation and are no longer sent to the model
+    started_at = models.DateTimeField(null=True, blank=True)
+    summary = models.TextField(blank=True, default="")
+    # created_at of the latest message included in summary
+    summary_until = models.DateTimeField(null=True, blank=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # moved by every write, so a process caching the conversation notices changes made elsewhere
+    version = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ("chatbot", "fb_user_id")
+        # expired conversations are found per chatbot by age (chat/purge.py)
+        indexes = [models.Index(fields=["chatbot", "updated_at"], name="chat_memory_chatbot_updated")]
+
+    def history(self, limit: int = None, summarized: bool = True):
+        """Messages of the current conversation, newest first (summarized=False: only those after the summary)"""
+        queryset = ChatMessage.objects.filter(chatbot_id=self.chatbot_id, sender_id=self.fb_user_id)
+        if self.started_at:
+            queryset = queryset.filter(created_at__gte=self.started_at)
+        if not summarized and self.summary_until:
+            queryset = queryset.filter(created_at__gt=self.summary_until)
+        queryset = queryset.order_by("-created_at", "-id")
+        return queryset[:limit] if limit else queryset
+
+    def load_messages(self) -> List[Dict]:
+        """Fill messages with the turns after the summary (one indexed range query)"""
+        rows = list(self.history(self.LOAD_MESSAGES, summarized=False)) if self.pk else []
+        self.messages = [m.as_entry() for m in reversed(rows)]
+        return self.messages
+
+    def prompt_history(self, max_tokens: int) -> List[Dict]:
+        """messages for the prompt; normally all of them, but never more than twice max_tokens
+        (e.g. while summarization is failing), dropping the oldest first"""
+        history = list(getattr(self, "messages", None) or [])
+        sizes = [estimate_tokens(m["text"]) for m in history]
+        if sum(sizes) <= 2 * max_tokens:
+            return history
+        while history and sum(sizes) > max_tokens:
+            history.pop(0)
+            sizes.pop(0)
+        return history
+
+    def _append(self, role: str, text: str) -> ChatMessage:
+        message = ChatMessage(chatbot_id=self.chatbot_id, sender_id=self.fb_user_id, role=role, text=text)
+        self.messages = list(getattr(self, "messages", None) or []) + [message.as_entry()]
+        self.updated_at = message.created_at
+        return message
+
+    def save(self, *args, **kwargs):
+        self.version += 1
+        if kwargs.get("update_fields") is not None:
+            kwargs["update_fields"] = {*kwargs["update_fields"], "version"}
+        super().save(*args, **kwargs)
 
     def add_message(self, role: str, text: str):
-        entry = {"role": role, "text": text, "time": timezone.now().isoformat()}
-        current = list(self.messages or [])
-        current.append(entry)
-        self.messages = current[-6:]
-        self.save(update_fields=["messages", "updated_at"])
+        self._append(role, text).save()
+        self.save()
 
-    def is_expired(self, days_limit: int = 3) -> bool:
+    def is_expired(self, days_limit: int = None) -> bool:
+        if days_limit is None:
+            days_limit = self.chatbot.memory_retention_days
         return (timezone.now() - self.updated_at) > datetime.timedelta(days=days_limit)
 
-    def clear(self):
+    def _reset(self):
         self.messages = []
-        self.save(update_fields=["messages", "updated_at"])
+        self.summary = ""
+        self.summary_until = None
+        self.started_at = self.updated_at = timezone.now()
+
+    def clear(self):
+        self._reset()
+        self.save()
+
+class DeliveryRecord(models.Model):
+    """An incoming message already accepted for processing (see chat/dedup.py)"""
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_CHOICES = [
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_DONE, "Done"),
+    ]
+
+    # "fb:<message mid>" or "widget:<chatbot id>:<idempotency key>"
+    key = models.CharField(max_length=255, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PROCESSING)
+    reply = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    expires_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"{self.key} ({self.status})"
@@ -0,0 +1,39 @@
+# prompt layout: stable content first so the provider's automatic prefix caching can hit
+from typing import Dict, List
+
+def system_prefix(chatbot) -> str:
+    """The chatbot's stable system content: its system prompt plus the tenant's instructions"""
+    parts = [chatbot.system_prompt or ""]
+    instructions = getattr(chatbot.tenant, "instructions", "") if chatbot.tenant_id else ""
+    if instructions:
+        parts.append(instructions)
+    return "\n\n".join(p.strip() for p in parts if p.strip())
+
+def build_messages(chatbot, history: List[Dict], question: str, context: List[str] = None,
+                   summary: str = None) -> List[Dict]:
+    """Build the LLM message list for a conversation turn.
+
+    Layout, from most to least stable:
+      1. one system message with system_prefix(chatbot) (same for every conversation)
+      2. the summary of older turns, if any (changes only when the memory is compacted)
+      3. earlier turns of this conversation, oldest first (only grows between turns)
+      4. retrieved context for this turn, as a single system message
+      5. the current question
+
+    history is the stored conversation ({"role", "text"} entries); if it already
+    ends with the current question that entry is not repeated. Each message is
+    built from the stored text only, so earlier turns render byte-identically
+    on every later turn.
+    """
+    history = list(history or [])
+    if history and history[-1].get("role") == "user" and history[-1].get("text") == question:
+        history = history[:-1]
+    messages = [{"role": "system", "content": system_prefix(chatbot)}]
+    if summary:
+        messages.append({"role": "system", "content": "Summary of the earlier conversation:\n\n" + summary})
+    for m in history:
+        messages.append({"role": m["role"], "content": m["text"]})
+    if context:
+        messages.append({"role": "system", "content": "Relevant information:\n\n" + "\n\n---\n\n".join(context)})
+    messages.append({"role": "user", "content": question})
+    return messages
@@ -0,0 +1,109 @@
+# purge of expired conversations (and finished queue rows, abandoned uploads) in small batches, so cleanup never
+# holds long locks on the tables the chat pipeline writes to
+import datetime
+import gzip
+import json
+import os
+import time
+from typing import Optional
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from chatbot.models import Chatbot
+from chatbot.uploads import purge_stale_uploads
+from .models import ChatMemory, ChatMessage, DeliveryRecord
+
+def _archive_file(archive_dir: str):
+    os.makedirs(archive_dir, exist_ok=True)
+    name = f"conversations-{timezone.now():%Y%m%d-%H%M%S}.jsonl.gz"
+    return gzip.open(os.path.join(archive_dir, name), "at", encoding="utf-8")
+
+def _archive(archive, memories: list):
+    for mem in memories:
+        messages = ChatMessage.objects.filter(chatbot_id=mem.chatbot_id, sender_id=mem.fb_user_id).order_by("created_at", "id")
+        archive.write(json.dumps({
+            "chatbot_id": mem.chatbot_id,
+            "sender_id": mem.fb_user_id,
+            "started_at": mem.started_at.isoformat() if mem.started_at else None,
+            "updated_at": mem.updated_at.isoformat(),
+            "summary": mem.summary,
+            "messages": [m.as_entry() for m in messages.iterator()],
+        }) + "\n")
+
+def purge_conversations(batch_size: int = None, archive_dir: Optional[str] = None, pause: float = None,
+                        chatbot: Chatbot = None) -> dict:
+    """Delete conversations idle for longer than their chatbot's memory_retention_days.
+
+    Works through each chatbot's expired conversations oldest first, batch_size
+    at a time (by the (chatbot, updated_at) index), each batch in its own short
+    transaction with pause seconds in between. A conversation's messages are
+    deleted with it; with archive_dir they are first written to a gzipped JSONL
+    file there. Returns counts and rows purged per second.
+    """
+    batch_size = batch_size or getattr(settings, "CHAT_PURGE_BATCH_SIZE", 1000)
+    pause = getattr(settings, "CHAT_PURGE_PAUSE", 0.05) if pause is None else pause
+    started = time.perf_counter()
+    stats = {"conversations": 0, "messages": 0}
+    archive = _archive_file(archive_dir) if archive_dir else None
+    chatbots = [chatbot] if chatbot is not None else Chatbot.objects.only("id", "memory_retention_days")
+    try:
+        for bot in chatbots:
+            cutoff = timezone.now() - datetime.timedelta(days=bot.memory_retention_days)
+            while True:
+                memories = list(ChatMemory.objects.filter(chatbot_id=bot.id, updated_at__lt=cutoff)
+                                .order_by("updated_at")[:batch_size])
+                if not memories:
+                    break
+                if archive:
+                    _archive(archive, memories)
+                with transaction.atomic():
+                    # a conversation that got a message meanwhile is kept (with its history)
+                    ids = [mem.pk for mem in memories]
+                    expired = list(ChatMemory.objects.filter(pk__in=ids, updated_at__lt=cutoff)
+                                   .values_list("pk", "fb_user_id"))
+                    if expired:
+                        stats["messages"] += ChatMessage.objects.filter(
+                            chatbot_id=bot.id, sender_id__in=[sender for _, sender in expired]
+                        ).delete()[0]
+                        stats["conversations"] += ChatMemory.objects.filter(pk__in=[pk for pk, _ in expired]).delete()[0]
+                if len(memories) < batch_size:
+                    break
+                if pause:
+                    time.sleep(pause)
+    finally:
+        if archive:
+            archive.close()
+    stats["deliveries"] = delete_in_batches(DeliveryRecord.objects.filter(expires_at__lt=timezone.now()),
+                                            batch_size, pause)
+    stats["fb_events"] = _purge_fb_queues(batch_size, pause)
+    stats["uploads"] = purge_stale_uploads()
+    stats["seconds"] = time.perf_counter() - started
+    rows = stats["conversations"] + stats["messages"] + stats["deliveries"] + stats["fb_events"]
+    stats["rows_per_second"] = rows / stats["seconds"] if stats["seconds"] else 0.0
+    return stats
+
+def delete_in_batches(queryset, batch_size: int, pause: float = 0) -> int:
+    """Delete queryset batch_size rows at a time (by primary key); returns rows deleted"""
+    deleted = 0
+    model = queryset.model
+    while True:
+        ids = list(queryset.order_by("pk").values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += model.objects.filter(pk__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
+
+def _purge_fb_queues(batch_size: int, pause: float) -> int:
+    """Finished Messenger inbox/outbox rows older than FB_QUEUE_RETENTION_DAYS"""
+    from fb.models import InboundEvent, OutboundMessage
+    cutoff = timezone.now() - datetime.timedelta(days=getattr(settings, "FB_QUEUE_RETENTION_DAYS", 7))
+    deleted = delete_in_batches(InboundEvent.objects.filter(
+        status__in=[InboundEvent.STATUS_DONE, InboundEvent.STATUS_FAILED], received_at__lt=cutoff
+    ), batch_size, pause)
+    deleted += delete_in_batches(OutboundMessage.objects.filter(
+        status__in=[OutboundMessage.STATUS_SENT, OutboundMessage.STATUS_FAILED], created_at__lt=cutoff
+    ), batch_size, pause)
+    return deleted
@@ -0,0 +1,133 @@
+# semantic reply cache: answers to recent single-turn questions, looked up by question embedding
+import hashlib
+import threading
+import time
+from typing import Dict, List, Optional
+import numpy as np
+
+def reply_cache_version(chatbot) -> str:
+    """Entries are only valid while the chatbot's knowledge and system instructions are unchanged"""
+    from .prompt_builder import system_prefix
+    prompt_hash = hashlib.sha256(system_prefix(chatbot).encode("utf-8")).hexdigest()[:16]
+    return f"{chatbot.knowledge_version}:{prompt_hash}"
+
+class _ChatbotReplies:
+    """Cached replies of one chatbot: normalized question vectors as matrix rows"""
+    __slots__ = ("version", "matrix", "questions", "replies", "expires")
+
+    def __init__(self, version: str):
+        self.version = version
+        self.matrix = None
+        self.questions = []
+        self.replies = []
+        self.expires = []
+
+class ReplyCache:
+    """Per-chatbot cache of replies keyed by question embedding.
+
+    A lookup returns the reply of the most similar unexpired question if its
+    cosine similarity reaches the chatbot's threshold. Using a new version
+    (see reply_cache_version) drops everything cached under the old one. Each chatbot keeps at most max_entries replies, oldest evicted first.
+    """
+
+    def __init__(self, max_entries: int = 500):
+        self.max_entries = max_entries
+        self._chatbots: Dict[int, _ChatbotReplies] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.invalidations = 0
+        self.expirations = 0
+
+    def _entries(self, chatbot_id: int, version: str) -> _ChatbotReplies:
+        entries = self._chatbots.get(chatbot_id)
+        if entries is None or entries.version != version:
+            if entries is not None and entries.questions:
+                self.invalidations += 1
+            entries = self._chatbots[chatbot_id] = _ChatbotReplies(version)
+        return entries
+
+    def _drop(self, entries: _ChatbotReplies, keep: List[int]):
+        entries.questions = [entries.questions[i] for i in keep]
+        entries.replies = [entries.replies[i] for i in keep]
+        entries.expires = [entries.expires[i] for i in keep]
+        entries.matrix = entries.matrix[keep] if keep else None
+
+    def lookup(self, chatbot_id: int, version: str, embedding: List[float], threshold: float) -> Optional[str]:
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        with self._lock:
+            entries = self._entries(chatbot_id, version)
+            now = time.time()
+            if entries.expires and min(entries.expires) <= now:
+                keep = [i for i, expires in enumerate(entries.expires) if expires > now]
+                self.expirations += len(entries.expires) - len(keep)
+                self._drop(entries, keep)
+            if entries.matrix is None or norm == 0 or entries.matrix.shape[1] != query.shape[0]:
+                self.misses += 1
+                return None
+            scores = entries.matrix @ (query / norm)
+            best = int(np.argmax(scores))
+            if scores[best] < threshold:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return entries.replies[best]
+
+    def store(self, chatbot_id: int, version: str, question: str, embedding: List[float], reply: str, ttl: float):
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        if norm == 0 or not reply:
+            return
+        with self._lock:
+            entries = self._entries(chatbot_id, version)
+            row = (vector / norm)[None, :]
+            if entries.matrix is not None and entries.matrix.shape[1] != row.shape[1]:
+                entries = self._chatbots[chatbot_id] = _ChatbotReplies(version)
+            entries.matrix = row if entries.matrix is None else np.vstack([entries.matrix, row])
+            entries.questions.append(question)
+            entries.replies.append(reply)
+            entries.expires.append(time.time() + ttl)
+            if len(entries.questions) > self.max_entries:
+                self._drop(entries, list(range(len(entries.questions) - self.max_entries, len(entries.questions))))
+            self.stores += 1
+
+    def invalidate(self, chatbot_id: int = None):
+        with self._lock:
+            if chatbot_id is None:
+                self._chatbots.clear()
+            elif self._chatbots.pop(chatbot_id, None) is not None:
+                self.invalidations += 1
+
+    def stats(self) -> Dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "stores": self.stores,
+            "invalidations": self.invalidations,
+            "expirations": self.expirations,
+            "chatbots": len(self._chatbots),
+            "entries": sum(len(e.questions) for e in self._chatbots.values()),
+        }
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_reply_cache() -> Optional[ReplyCache]:
+    """Get or create the process-wide reply cache (None when disabled)"""
+    global _cache
+    from django.conf import settings
+    if not getattr(settings, "REPLY_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ReplyCache(max_entries=getattr(settings, "REPLY_CACHE_MAX_ENTRIES", 500))
+    return _cache
+
+def reply_cache_stats() -> Dict:
+    cache = get_reply_cache()
+    return cache.stats() if cache else {}
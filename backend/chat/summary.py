@@ -0,0 +1,41 @@
+# rolling conversation summary: turns that no longer fit the chatbot's memory budget are
+# condensed into ChatMemory.summary by background threads, never on the reply path
+from typing import Dict, List
+from django.conf import settings
+from utils.llm_clients import ask_llm
+from utils.tokens import estimate_tokens
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain the memory of a customer conversation. Merge the previous summary and the new "
+    "messages into one updated summary written in the third person. Keep facts about the user, their "
+    "questions, answers already given, decisions and open issues; drop greetings and small talk. "
+    "Use at most {words} words."
+)
+
+def messages_to_fold(messages: List[Dict], max_tokens: int) -> int:
+    """How many of the oldest messages to fold into the summary (0 while within max_tokens).
+
+    Once the window exceeds max_tokens it is cut back to about half of it, so
+    compactions happen in blocks; the kept part starts with a user turn.
+    """
+    sizes = [estimate_tokens(m["text"]) for m in messages]
+    total = sum(sizes)
+    if total <= max_tokens:
+        return 0
+    fold = 0
+    while fold < len(messages) - 1 and total > max_tokens // 2:
+        total -= sizes[fold]
+        fold += 1
+    while fold < len(messages) - 1 and messages[fold]["role"] != "user":
+        fold += 1
+    return fold
+
+def summarize(previous: str, messages: List[Dict], max_tokens: int) -> str:
+    """Updated summary covering previous plus messages, within about max_tokens // 4 tokens"""
+    transcript = "\n".join(f"{m['role']}: {m['text']}" for m in messages)
+    words = max(50, max_tokens // 4 * 3 // 4)
+    prompt = [
+        {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=words)},
+        {"role": "user", "content": f"Previous summary:\n{previous or '(none)'}\n\nNew messages:\n{transcript}"},
+    ]
+    return ask_llm(prompt, model=getattr(settings, "CHAT_SUMMARY_MODEL", "gpt-4o-mini")).strip()
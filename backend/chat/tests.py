@@ -1,3 +1,142 @@
+import datetime
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+from chatbot.models import Chatbot
+from tenants.models import Tenant
+from .memory_store import ConversationStore
+from .models import ChatMemory, ChatMessage
+from .purge import purge_conversations
 
-# Create your tests here.
+def _store(**kwargs) -> ConversationStore:
+    """A store flushed explicitly by the test (no background flusher thread)"""
+    store = ConversationStore(**kwargs)
+    store._ensure_flusher = lambda: None
+    return store
+
+class ConversationStoreTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="tenant")
+        self.chatbot = Chatbot.objects.select_related("tenant").get(
+            pk=Chatbot.objects.create(tenant=tenant, name="bot").pk
+        )
+        self.store = _store(max_sessions=10, flush_interval=3600)
+
+    def test_flush_writes_queued_messages_in_one_batch(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        self.store.add_message(mem, "user", "anyone there?")
+        self.assertEqual(ChatMessage.objects.count(), 0)
+
+        self.assertEqual(self.store.flush(), 3)
+        self.assertEqual(ChatMemory.objects.filter(chatbot=self.chatbot, fb_user_id="alice").count(), 1)
+        self.assertEqual([m.text for m in ChatMessage.objects.order_by("id")], ["hello", "anyone there?"])
+        self.assertEqual(self.store.flush(), 0)
+
+    def test_evicted_conversation_is_flushed_and_reloaded(self):
+        store = _store(max_sessions=1, flush_interval=3600)
+        alice = store.get(self.chatbot, "alice")
+        store.add_message(alice, "user", "hello")
+        store.get(self.chatbot, "bob")  # evicts alice before she was flushed
+        self.assertIs(store.get(self.chatbot, "alice"), alice)
+
+        store.get(self.chatbot, "bob")
+        store.flush()
+        reloaded = store.get(self.chatbot, "alice")
+        self.assertIsNot(reloaded, alice)
+        self.assertEqual([m["text"] for m in reloaded.messages], ["hello"])
+
+    def test_expired_conversation_starts_over(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "old question")
+        self.store.flush()
+        old = timezone.now() - datetime.timedelta(days=self.chatbot.memory_retention_days + 1)
+        ChatMemory.objects.filter(pk=mem.pk).update(updated_at=old)
+
+        store = _store(flush_interval=3600)
+        mem = store.get(self.chatbot, "alice")
+        self.assertEqual(mem.messages, [])
+        store.flush()
+        self.assertEqual(list(ChatMemory.objects.get(pk=mem.pk).history()), [])
+        self.assertEqual(ChatMessage.objects.count(), 1)  # kept, but no longer part of the conversation
+
+    def test_conversation_purged_while_cached_is_inserted_again(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        self.store.flush()
+        old = timezone.now() - datetime.timedelta(days=self.chatbot.memory_retention_days + 1)
+        ChatMemory.objects.filter(pk=mem.pk).update(updated_at=old)
+        purge_conversations(pause=0)
+        self.assertFalse(ChatMemory.objects.exists())
+
+        self.store.add_message(mem, "user", "still here")
+        self.store.flush()
+        self.assertEqual(ChatMemory.objects.filter(fb_user_id="alice").count(), 1)
+        self.assertEqual(list(ChatMessage.objects.values_list("text", flat=True)), ["still here"])
+
+    def test_flush_does_not_overwrite_changes_of_another_process(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        self.store.flush()
+        other = _store(flush_interval=3600)
+        other_mem = other.get(self.chatbot, "alice")
+        other_mem.summary = "written elsewhere"
+        other._changed(other_mem)
+        other.flush()
+
+        self.store.add_message(mem, "user", "second")
+        self.store.flush()
+        self.assertEqual(self.store.stats()["conflicts"], 1)
+        self.assertEqual(ChatMemory.objects.get().summary, "written elsewhere")
+        self.assertEqual(ChatMessage.objects.count(), 2)
+        reloaded = self.store.get(self.chatbot, "alice")
+        self.assertIsNot(reloaded, mem)
+        self.assertEqual(reloaded.summary, "written elsewhere")
+
+    def test_failed_flush_is_requeued(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        with mock.patch.object(ChatMessage.objects, "bulk_create", side_effect=RuntimeError("database down")):
+            self.assertEqual(self.store.flush(), 0)
+        self.assertEqual(self.store.stats()["dirty"], 1)
+        self.store.flush()
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    def test_close_writes_pending_messages(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        self.store.close()
+        self.assertEqual(ChatMessage.objects.count(), 1)
+
+    def test_close_fails_loudly_when_messages_cannot_be_written(self):
+        mem = self.store.get(self.chatbot, "alice")
+        self.store.add_message(mem, "user", "hello")
+        with mock.patch.object(ChatMessage.objects, "bulk_create", side_effect=RuntimeError("database down")):
+            with self.assertRaises(RuntimeError):
+                self.store.close(attempts=2, retry_delay=0)
+
+    def test_async_write_through(self):
+        store = _store(flush_interval=0)
+
+        async def add():
+            mem = await store.aget(self.chatbot, "alice")
+            await store.aadd_message(mem, "user", "hello")
+
+        async_to_sync(add)()
+        self.assertEqual(ChatMessage.objects.count(), 1)
+        self.assertEqual(store.stats()["dirty"], 0)
+
+class StatsViewTests(TestCase):
+    def test_stats_are_staff_only(self):
+        client = APIClient()
+        client.force_authenticate(User.objects.create_user("owner", password="x"))
+        self.assertEqual(client.get("/api/chat/stats/").status_code, 403)
+
+        client.force_authenticate(User.objects.create_user("admin", password="x", is_staff=True))
+        response = client.get("/api/chat/stats/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("http_pools", response.json())
+        self.assertIn("fb_inbox", response.json()["queues"])
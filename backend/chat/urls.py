@@ -1,2 +1,6 @@
 from django.urls import path
-urlpatterns = []
+from .views import StatsView
+
+urlpatterns = [
+    path("stats/", StatsView.as_view(), name="chat-stats"),
+]
@@ -1,3 +1,38 @@
-from django.shortcuts import render
+from django.db.models import Count
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from chatbot.models import IngestionJob
+from fb.models import InboundEvent, OutboundMessage
+from fb.outbox import outbox_stats
+from fb.routing import routing_stats
+from ingestion.embedding_cache import embedding_cache_stats
+from utils.http import pool_stats
+from utils.llm_clients import llm_usage_stats
+from .dedup import dedup_stats
+from .memory_store import get_conversation_store
+from .reply_cache import reply_cache_stats
 
-# Create your views here.
+def _queue_counts(model) -> dict:
+    return {row["status"]: row["n"] for row in model.objects.values("status").annotate(n=Count("pk"))}
+
+class StatsView(APIView):
+    """Runtime counters of the process serving the request, plus queue sizes from the database (staff only)"""
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({
+            "http_pools": pool_stats(),
+            "llm_usage": llm_usage_stats(),
+            "reply_cache": reply_cache_stats(),
+            "embedding_cache": embedding_cache_stats(),
+            "conversations": get_conversation_store().stats(),
+            "dedup": dedup_stats(),
+            "routing": routing_stats(),
+            "outbox": outbox_stats(),
+            "queues": {
+                "ingestion": _queue_counts(IngestionJob),
+                "fb_inbox": _queue_counts(InboundEvent),
+                "fb_outbox": _queue_counts(OutboundMessage),
+            },
+        })
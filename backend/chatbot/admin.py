@@ -1,7 +1,23 @@
 from django.contrib import admin
-from .models import Chatbot
+from .models import Chatbot, ChunkedUpload, IngestedDocument, IngestionJob
 
 @admin.register(Chatbot)
 class ChatbotAdmin(admin.ModelAdmin):
     list_display = ("name","tenant","created_at","is_active")
-    readonly_fields = ("webhook_key","webhook_secret","vector_namespace")
+    # embedding settings are fixed at creation: changing them would not match the stored vectors
+    readonly_fields = ("webhook_key","webhook_secret","vector_namespace",
+                       "embedding_dimensions","vector_quantization","vector_rescore")
+
+@admin.register(IngestionJob)
+class IngestionJobAdmin(admin.ModelAdmin):
+    list_display = ("id","chatbot","status","chunks_total","chunks_upserted","created_at","finished_at")
+    list_filter = ("status",)
+    exclude = ("documents",)
+
+@admin.register(ChunkedUpload)
+class ChunkedUploadAdmin(admin.ModelAdmin):
+    list_display = ("id","chatbot","filename","received_bytes","total_size","status","updated_at")
+
+@admin.register(IngestedDocument)
+class IngestedDocumentAdmin(admin.ModelAdmin):
+    list_display = ("document_id","chatbot","name","chunk_count","updated_at")
@@ -0,0 +1,289 @@
+# background ingestion jobs backed by the IngestionJob table
+import datetime
+import threading
+import time
+from typing import Dict, List
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from utils.db_queue import WorkerPool, claim_next
+from ingestion.services import chunk_fingerprint, ingest_chunks, iter_chunks, iter_file_text
+from ingestion.vector_store import get_vector_store
+from fb.routing import invalidate_routes
+from .models import Chatbot, DocumentChunk, IngestedDocument, IngestionJob
+from .uploads import remove_file
+
+def text_documents(texts: List[str], ids: List[str] = ()) -> List[Dict]:
+    """Job documents for inline texts (blank ones are skipped).
+
+    A text's document_id is the client-supplied id at the same position in ids,
+    so posting an edited text under its id replaces that document's chunks.
+    Texts without an id are named after their content ("text-<hash>"): posting
+    the same text again is a no-op and never replaces another document.
+    """
+    documents = []
+    for i, text in enumerate(texts):
+        if not isinstance(text, str) or not text.strip():
+            continue
+        client_id = ids[i] if i < len(ids) else ""
+        document_id = str(client_id or "text-" + chunk_fingerprint(text)[:32])[:255]
+        documents.append({"document_id": document_id, "name": document_id, "text": text.strip()})
+    return documents
+
+def enqueue_ingestion(chatbot: Chatbot, documents: List[Dict], metadata: Dict = None,
+                      replace_missing: bool = False) -> IngestionJob:
+    """Queue documents for background ingestion into chatbot's namespace.
+
+    Each document is {"document_id", "name", "text"} for inline text or
+    {"document_id", "name", "path"} for a file already stored in the upload dir;
+    document_id defaults to the name. Re-ingesting a document_id only embeds its
+    new or changed chunks and deletes chunks that disappeared. With
+    replace_missing, the chatbot's other documents are deleted as well (full sync).
+    """
+    for doc in documents:
+        doc["document_id"] = doc.get("document_id") or doc.get("name")
+        if not doc["document_id"]:
+            raise ValueError("Every document needs a document_id or name")
+    job = IngestionJob.objects.create(
+        chatbot=chatbot,
+        documents=documents,
+        metadata=metadata or {},
+        replace_missing=replace_missing,
+    )
+    ensure_embedded_workers()
+    return job
+
+def claim_ingestion_job():
+    """Claim the next pending job, or a running job whose worker stopped heartbeating"""
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=getattr(settings, "INGESTION_JOB_STALE_SECONDS", 600))
+    max_attempts = getattr(settings, "INGESTION_JOB_MAX_ATTEMPTS", 3)
+    abandoned = IngestionJob.objects.filter(
+        status=IngestionJob.STATUS_RUNNING, heartbeat_at__lt=stale_before, attempts__gte=max_attempts
+    )
+    for job in abandoned:
+        if IngestionJob.objects.filter(pk=job.pk, heartbeat_at=job.heartbeat_at).update(
+            status=IngestionJob.STATUS_FAILED, error="Worker stopped responding", finished_at=now
+        ):
+            _remove_uploads(job.documents)
+            _knowledge_changed(job)
+    queryset = IngestionJob.objects.filter(
+        Q(status=IngestionJob.STATUS_PENDING)
+        | Q(status=IngestionJob.STATUS_RUNNING, heartbeat_at__lt=stale_before),
+        attempts__lt=max_attempts,
+    )
+    return claim_next(
+        queryset,
+        claim_field="heartbeat_at",
+        status=IngestionJob.STATUS_RUNNING,
+        started_at=now,
+        heartbeat_at=now,
+        attempts=F("attempts") + 1,
+    )
+
+def _remove_uploads(documents: List[Dict]):
+    """Delete a finished job's upload files (kept while the job may still be retried)"""
+    for doc in documents:
+        if doc.get("path"):
+            remove_file(doc["path"])
+
+def _knowledge_changed(job: IngestionJob):
+    """Bump the chatbot's knowledge_version if the job changed any chunks"""
+    if job.chunks_upserted or job.chunks_deleted:
+        # cached replies may be answered from outdated documents
+        Chatbot.objects.filter(pk=job.chatbot_id).update(knowledge_version=F("knowledge_version") + 1)
+        # routed chatbot instances are cached along with their knowledge_version
+        invalidate_routes()
+
+class ClaimLost(Exception):
+    """The job was reclaimed by another worker after this one's heartbeat went stale"""
+
+class _JobLease:
+    """A worker's claim on a running job.
+
+    Every update is conditional on the heartbeat_at value this worker wrote
+    last and moves it forward; once another worker has reclaimed the job the
+    update matches no row and ClaimLost is raised, so the first worker stops.
+    """
+
+    def __init__(self, job: IngestionJob):
+        self.job_id = job.pk
+        self.heartbeat_at = job.heartbeat_at
+        self.interval = getattr(settings, "INGESTION_HEARTBEAT_SECONDS", 30)
+        self._last_beat = time.monotonic()
+
+    def update(self, **fields):
+        now = timezone.now()
+        updated = IngestionJob.objects.filter(pk=self.job_id, heartbeat_at=self.heartbeat_at).update(
+            heartbeat_at=now, **fields
+        )
+        if not updated:
+            raise ClaimLost(f"Ingestion job {self.job_id} was claimed by another worker")
+        self.heartbeat_at = now
+        self._last_beat = time.monotonic()
+
+    def beat(self):
+        """Heartbeat when the last one is older than INGESTION_HEARTBEAT_SECONDS"""
+        if time.monotonic() - self._last_beat >= self.interval:
+            self.update()
+
+    def beating(self, items):
+        """Iterate items, heartbeating along the way (long reads and deletes)"""
+        for item in items:
+            self.beat()
+            yield item
+
+def _document_chunks(doc: Dict):
+    if doc.get("path"):
+        return iter_chunks(iter_file_text(doc["path"]))
+    return iter_chunks([doc.get("text") or ""])
+
+def _delete_document_chunks(chatbot: Chatbot, document: IngestedDocument, point_ids) -> int:
+    point_ids = [str(p) for p in point_ids]
+    if not point_ids:
+        return 0
+    config = chatbot.embedding_config()
+    get_vector_store().delete(chatbot.vector_namespace, point_ids, config["vector_size"], config["quantization"])
+    DocumentChunk.objects.filter(document=document, point_id__in=point_ids).delete()
+    return len(point_ids)
+
+def _ingest_document(lease: _JobLease, chatbot: Chatbot, doc_idx: int, doc: Dict, metadata: Dict):
+    """Ingest one document incrementally; returns (chunks in the document, stale chunks deleted)"""
+    document_id = doc.get("document_id") or doc.get("name") or f"document-{doc_idx}"
+    document, _ = IngestedDocument.objects.get_or_create(
+        chatbot=chatbot, document_id=document_id, defaults={"name": doc.get("name", "")}
+    )
+    known_ids = {str(p) for p in document.chunks.values_list("point_id", flat=True)}
+    seen_ids = set()
+
+    def on_window(records):
+        DocumentChunk.objects.bulk_create([
+            DocumentChunk(document=document, point_id=r["point_id"], content_hash=r["fingerprint"],
+                          chunk_index=r["chunk_index"])
+            for r in records if r["new"]
+        ], ignore_conflicts=True)
+        seen_ids.update(r["point_id"] for r in records)
+
+    def progress(embedded, upserted, unchanged, position):
+        lease.update(
+            chunks_embedded=F("chunks_embedded") + embedded,
+            chunks_upserted=F("chunks_upserted") + upserted,
+            chunks_unchanged=F("chunks_unchanged") + unchanged,
+        )
+
+    doc_metadata = {"document_index": doc_idx, "document_name": doc.get("name", ""), **metadata}
+    count = ingest_chunks(chatbot.vector_namespace, lease.beating(_document_chunks(doc)), doc_metadata, progress=progress,
+                          document_id=document_id, known_ids=known_ids, on_window=on_window,
+                          embedding=chatbot.embedding_config())
+    # only reached once the whole document was read, so unseen chunks are really gone
+    deleted = _delete_document_chunks(chatbot, document, known_ids - seen_ids)
+    document.name = doc.get("name", document.name)
+    document.chunk_count = len(seen_ids)
+    document.save(update_fields=["name", "chunk_count", "updated_at"])
+    print(f"  Processed document {doc_idx + 1} ({document_id}): {count} new, "
+          f"{len(seen_ids) - count} unchanged, {deleted} deleted")
+    return len(seen_ids), deleted
+
+def run_ingestion_job(job: IngestionJob):
+    """Stream, embed and upsert a claimed job's documents, recording progress on the row.
+
+    Progress is checkpointed after every embedding window; a job picked up again
+    after a worker crash re-reads the current document but skips the chunks it
+    already stored, since their fingerprints are recorded. The worker heartbeats
+    while it reads and embeds, and stops as soon as it finds that the job was
+    reclaimed by another worker (see _JobLease).
+    """
+    chatbot = job.chatbot
+    documents = job.documents
+    lease = _JobLease(job)
+    metadata = {
+        "chatbot_id": chatbot.id,
+        "chatbot_name": chatbot.name,
+        "tenant_id": chatbot.tenant_id,
+        **(job.metadata or {}),
+    }
+    errors = []
+    finished = False
+    try:
+        for doc_idx in range(job.document_index, len(documents)):
+            doc = documents[doc_idx]
+            try:
+                chunks, deleted = _ingest_document(lease, chatbot, doc_idx, doc, metadata)
+            except UnicodeDecodeError:
+                chunks = deleted = 0
+                errors.append(f"{doc.get('name', '')}: not a valid text file (UTF-8)")
+                print(f"Error: File {doc.get('name', '')} is not a valid text file (UTF-8)")
+            # chunks_total counts the chunks of completed documents (no separate counting pass)
+            lease.update(
+                document_index=doc_idx + 1,
+                chunks_total=F("chunks_total") + chunks,
+                chunks_deleted=F("chunks_deleted") + deleted,
+            )
+
+        if job.replace_missing:
+            keep = {doc.get("document_id") for doc in documents}
+            for document in lease.beating(chatbot.documents.exclude(document_id__in=keep)):
+                deleted = _delete_document_chunks(chatbot, document, document.chunks.values_list("point_id", flat=True))
+                document.delete()
+                lease.update(chunks_deleted=F("chunks_deleted") + deleted)
+        lease.update(
+            status=IngestionJob.STATUS_DONE,
+            error="\n".join(errors),
+            finished_at=timezone.now(),
+        )
+        finished = True
+    except ClaimLost as e:
+        # the worker that took over owns the job and its files now
+        print(f"⚠ {e}; stopping")
+        return
+    except Exception as e:
+        print(f"✗ Ingestion job {job.pk} failed: {e}")
+        try:
+            lease.update(
+                status=IngestionJob.STATUS_FAILED,
+                error=str(e),
+                finished_at=timezone.now(),
+            )
+            finished = True
+        except ClaimLost as lost:
+            print(f"⚠ {lost}; stopping")
+            return
+        # chunks upserted or deleted before the failure are live already
+        job.refresh_from_db()
+        _knowledge_changed(job)
+        return
+    finally:
+        # failed jobs are not retried, so their uploads go as well
+        if finished:
+            _remove_uploads(documents)
+
+    job.refresh_from_db()
+    _knowledge_changed(job)
+    print(f"✓ Ingestion job {job.pk} finished: {job.chunks_upserted} new, {job.chunks_unchanged} unchanged, "
+          f"{job.chunks_deleted} deleted chunks for chatbot {chatbot.name}")
+
+def ingestion_worker_pool(workers: int = None, poll_interval: float = None) -> WorkerPool:
+    return WorkerPool(
+        "ingestion",
+        claim_ingestion_job,
+        run_ingestion_job,
+        workers=workers or getattr(settings, "INGESTION_WORKERS", 2),
+        poll_interval=poll_interval or getattr(settings, "INGESTION_POLL_INTERVAL", 1.0),
+    )
+
+_embedded_pool = None
+_embedded_lock = threading.Lock()
+
+def ensure_embedded_workers():
+    """Start in-process workers when INGESTION_EMBEDDED_WORKERS > 0 (dev / single-node setups).
+
+    Production deployments run `manage.py run_ingestion_workers` instead so web
+    workers stay free for chat traffic.
+    """
+    global _embedded_pool
+    count = getattr(settings, "INGESTION_EMBEDDED_WORKERS", 0)
+    if count <= 0 or _embedded_pool is not None:
+        return
+    with _embedded_lock:
+        if _embedded_pool is None:
+            _embedded_pool = ingestion_worker_pool(workers=count).start()
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+from chatbot.models import Chatbot
+from ingestion.vector_client import copy_collection_to_shared, shared_collection_name
+
+class Command(BaseCommand):
+    help = "Copy per-chatbot Qdrant collections into the shared multi-tenant layout (QDRANT_STORAGE_MODE=shared)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chatbot", type=int, action="append", help="Only migrate these chatbot ids")
+        parser.add_argument("--batch-size", type=int, default=256, help="Points per scroll/upsert page")
+        parser.add_argument("--delete-source", action="store_true",
+                            help="Drop each per-chatbot collection after it was copied")
+        parser.add_argument("--dry-run", action="store_true", help="Only print the planned moves")
+
+    def handle(self, *args, **options):
+        chatbots = Chatbot.objects.all().order_by("id")
+        if options["chatbot"]:
+            chatbots = chatbots.filter(id__in=options["chatbot"])
+
+        total = 0
+        for chatbot in chatbots:
+            namespace = chatbot.vector_namespace
+            config = chatbot.embedding_config()
+            target = shared_collection_name(namespace, config["vector_size"], config["quantization"])
+            if options["dry_run"]:
+                self.stdout.write(f"{chatbot.id} {namespace} -> {target}")
+                continue
+            try:
+                copied = copy_collection_to_shared(namespace, options["batch_size"], options["delete_source"],
+                                                   config["quantization"])
+            except Exception as e:
+                self.stderr.write(self.style.ERROR(f"✗ {namespace}: {e}"))
+                continue
+            total += copied
+            self.stdout.write(f"{chatbot.id} {namespace} -> {target}: {copied} points")
+        if not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"Migrated {total} points"))
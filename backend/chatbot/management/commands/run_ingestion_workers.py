@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from chatbot.jobs import claim_ingestion_job, ingestion_worker_pool, run_ingestion_job
+
+class Command(BaseCommand):
+    help = "Run background workers that process queued document ingestion jobs"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds to sleep when the queue is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the queue once and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = 0
+            while True:
+                job = claim_ingestion_job()
+                if job is None:
+                    break
+                run_ingestion_job(job)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} ingestion job(s)"))
+            return
+        ingestion_worker_pool(options["workers"], options["poll_interval"]).run_forever()
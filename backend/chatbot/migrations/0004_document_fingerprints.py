@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0003_chunked_uploads'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chunkedupload',
+            name='document_id',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='chunks_deleted',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='chunks_unchanged',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='ingestionjob',
+            name='replace_missing',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.CreateModel(
+            name='IngestedDocument',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('document_id', models.CharField(max_length=255)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('chunk_count', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('chatbot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='documents', to='chatbot.chatbot')),
+            ],
+            options={
+                'unique_together': {('chatbot', 'document_id')},
+            },
+        ),
+        migrations.CreateModel(
+            name='DocumentChunk',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('point_id', models.UUIDField()),
+                ('content_hash', models.CharField(max_length=64)),
+                ('chunk_index', models.IntegerField(default=0)),
+                ('document', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='chunks', to='chatbot.ingesteddocument')),
+            ],
+            options={
+                'unique_together': {('document', 'point_id')},
+            },
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:34
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0004_document_fingerprints'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbot',
+            name='embedding_dimensions',
+            field=models.PositiveIntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(64), django.core.validators.MaxValueValidator(1536)]),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='vector_quantization',
+            field=models.CharField(choices=[('none', 'float32'), ('float16', 'float16'), ('int8', 'int8 scalar quantization')], default='none', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='vector_rescore',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0005_embedding_settings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbot',
+            name='knowledge_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='reply_cache_threshold',
+            field=models.FloatField(default=0.95, validators=[django.core.validators.MinValueValidator(0.5), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='reply_cache_ttl',
+            field=models.PositiveIntegerField(default=3600, help_text='Seconds; 0 disables the reply cache'),
+        ),
+    ]
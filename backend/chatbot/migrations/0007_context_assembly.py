@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:36
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0006_reply_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbot',
+            name='context_max_tokens',
+            field=models.PositiveIntegerField(default=1500),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='retrieval_min_score',
+            field=models.FloatField(default=0.3, validators=[django.core.validators.MinValueValidator(0.0), django.core.validators.MaxValueValidator(1.0)]),
+        ),
+        migrations.AddField(
+            model_name='chatbot',
+            name='retrieval_top_k',
+            field=models.PositiveIntegerField(default=8, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(50)]),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:53
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_context_assembly'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbot',
+            name='memory_max_tokens',
+            field=models.PositiveIntegerField(default=1000, validators=[django.core.validators.MinValueValidator(100)]),
+        ),
+    ]
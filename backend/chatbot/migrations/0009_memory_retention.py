@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:55
+
+import django.core.validators
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0008_memory_budget'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='chatbot',
+            name='memory_retention_days',
+            field=models.PositiveIntegerField(default=3, validators=[django.core.validators.MinValueValidator(1)]),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:05
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0009_memory_retention'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='ingestionjob',
+            name='chunk_offset',
+        ),
+    ]
@@ -1,4 +1,5 @@
 import uuid
+from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
 from tenants.models import Tenant
 
@@ -8,15 +9,148 @@ def gen_key():
 def gen_vector_namespace():
     return "chatbot_" + uuid.uuid4().hex[:12]
 
+# native output size of text-embedding-3-small
+DEFAULT_EMBEDDING_DIMENSIONS = 1536
+
 class Chatbot(models.Model):
+    QUANTIZATION_NONE = "none"
+    QUANTIZATION_FLOAT16 = "float16"
+    QUANTIZATION_INT8 = "int8"
+    QUANTIZATION_CHOICES = [
+        (QUANTIZATION_NONE, "float32"),
+        (QUANTIZATION_FLOAT16, "float16"),
+        (QUANTIZATION_INT8, "int8 scalar quantization"),
+    ]
+
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name="chatbots")
     name = models.CharField(max_length=200)
     webhook_key = models.CharField(max_length=64, unique=True, default=gen_key)
     webhook_secret = models.CharField(max_length=64, default=gen_key)
     vector_namespace = models.CharField(max_length=200, default=gen_vector_namespace)
     system_prompt = models.TextField(blank=True, default="You are a helpful assistant.")
+    # embedding settings are fixed at creation: ingest and query must use the same ones
+    # (empty embedding_dimensions = the model's native 1536)
+    embedding_dimensions = models.PositiveIntegerField(
+        null=True, blank=True, validators=[MinValueValidator(64), MaxValueValidator(DEFAULT_EMBEDDING_DIMENSIONS)]
+    )
+    vector_quantization = models.CharField(max_length=10, choices=QUANTIZATION_CHOICES, default=QUANTIZATION_NONE)
+    # int8 only: re-rank quantized candidates with the full vectors
+    vector_rescore = models.BooleanField(default=True)
+    # retrieval: up to retrieval_top_k hits scoring at least retrieval_min_score are
+    # deduplicated and packed into context_max_tokens (see ingestion/context.py)
+    retrieval_top_k = models.PositiveIntegerField(default=8, validators=[MinValueValidator(1), MaxValueValidator(50)])
+    retrieval_min_score = models.FloatField(default=0.3, validators=[MinValueValidator(0.0), MaxValueValidator(1.0)])
+    context_max_tokens = models.PositiveIntegerField(default=1500)
+    # conversation memory: recent turns are sent verbatim up to memory_max_tokens, older ones
+    # are folded into a rolling summary in the background (see chat/summary.py)
+    memory_max_tokens = models.PositiveIntegerField(default=1000, validators=[MinValueValidator(100)])
+    # conversations idle this long start over and are deleted by `manage.py purge_conversations`
+    memory_retention_days = models.PositiveIntegerField(default=3, validators=[MinValueValidator(1)])
+    # semantic reply cache: reuse the answer to a recent single-turn question whose
+    # embedding is at least this similar; reply_cache_ttl=0 disables it
+    reply_cache_threshold = models.FloatField(
+        default=0.95, validators=[MinValueValidator(0.5), MaxValueValidator(1.0)]
+    )
+    reply_cache_ttl = models.PositiveIntegerField(default=3600, help_text="Seconds; 0 disables the reply cache")
+    # bumped whenever ingestion changes the chatbot's documents (invalidates cached replies)
+    knowledge_version = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
 
     def __str__(self):
         return f"{self.name} ({self.tenant})"
+
+    def embedding_config(self) -> dict:
+        """Embedding settings passed to ingestion and search"""
+        return {
+            "dimensions": self.embedding_dimensions,
+            "vector_size": self.embedding_dimensions or DEFAULT_EMBEDDING_DIMENSIONS,
+            "quantization": self.vector_quantization,
+            "rescore": self.vector_rescore,
+        }
+
+class IngestionJob(models.Model):
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    chatbot = models.ForeignKey(Chatbot, on_delete=models.CASCADE, related_name="ingestion_jobs")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    # list of {"document_id": str, "name": str, "text": str}, or {"document_id", "name", "path"} for files stored on disk
+    documents = models.JSONField(default=list)
+    metadata = models.JSONField(default=dict)
+    # chunks of the documents completed so far (the job total once it is done)
+    chunks_total = models.IntegerField(default=0)
+    chunks_embedded = models.IntegerField(default=0)
+    chunks_upserted = models.IntegerField(default=0)
+    chunks_unchanged = models.IntegerField(default=0)
+    chunks_deleted = models.IntegerField(default=0)
+    # delete documents previously ingested for this chatbot that are not part of this job
+    replace_missing = models.BooleanField(default=False)
+    # resume position: documents before document_index are done (chunks of the
+    # current one that were already stored are skipped by fingerprint)
+    document_index = models.IntegerField(default=0)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"IngestionJob {self.id} ({self.chatbot_id}, {self.status})"
+
+class IngestedDocument(models.Model):
+    """A document ingested into a chatbot's vector namespace, identified by a stable document_id"""
+    chatbot = models.ForeignKey(Chatbot, on_delete=models.CASCADE, related_name="documents")
+    document_id = models.CharField(max_length=255)
+    name = models.CharField(max_length=255, blank=True, default="")
+    chunk_count = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("chatbot", "document_id")
+
+    def __str__(self):
+        return f"{self.document_id} ({self.chatbot_id})"
+
+class DocumentChunk(models.Model):
+    """Fingerprint of one stored chunk; point_id is derived from the document id and content hash"""
+    document = models.ForeignKey(IngestedDocument, on_delete=models.CASCADE, related_name="chunks")
+    point_id = models.UUIDField()
+    content_hash = models.CharField(max_length=64)
+    chunk_index = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("document", "point_id")
+
+class ChunkedUpload(models.Model):
+    """A large file uploaded in parts; clients resume from received_bytes after an interruption"""
+    STATUS_UPLOADING = "uploading"
+    STATUS_COMPLETE = "complete"
+    STATUS_CHOICES = [
+        (STATUS_UPLOADING, "Uploading"),
+        (STATUS_COMPLETE, "Complete"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    chatbot = models.ForeignKey(Chatbot, on_delete=models.CASCADE, related_name="uploads")
+    filename = models.CharField(max_length=255)
+    document_id = models.CharField(max_length=255, blank=True, default="")
+    total_size = models.BigIntegerField()
+    received_bytes = models.BigIntegerField(default=0)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_UPLOADING)
+    job = models.ForeignKey(IngestionJob, on_delete=models.SET_NULL, null=True, blank=True, related_name="uploads")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.filename} ({self.received_bytes}/{self.total_size})"
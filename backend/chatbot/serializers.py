@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Chatbot
+from .models import Chatbot, ChunkedUpload, IngestionJob
 from tenants.models import Tenant
 
 class ChatbotCreateSerializer(serializers.ModelSerializer):
@@ -7,7 +7,9 @@ class ChatbotCreateSerializer(serializers.ModelSerializer):
     
     class Meta:
         model = Chatbot
-        fields = ("id","name","system_prompt","ingestion_status")
+        fields = ("id","name","system_prompt","embedding_dimensions","vector_quantization","vector_rescore",
+                  "retrieval_top_k","retrieval_min_score","context_max_tokens","memory_max_tokens","memory_retention_days",
+                  "reply_cache_threshold","reply_cache_ttl","ingestion_status")
 
     def save(self, **kwargs):
         # Extract tenant from kwargs (passed from view's perform_create)
@@ -24,6 +26,12 @@ class ChatbotCreateSerializer(serializers.ModelSerializer):
         self._tenant = tenant
         return super().save(**kwargs)
 
+    def validate(self, attrs):
+        # form-encoded requests read an omitted checkbox as False; keep the model default instead
+        if "vector_rescore" not in self.initial_data:
+            attrs.pop("vector_rescore", None)
+        return attrs
+
     def create(self, validated_data):
         # Remove tenant from validated_data if it somehow got in there
         validated_data.pop('tenant', None)
@@ -68,3 +76,16 @@ class ChatbotListSerializer(serializers.ModelSerializer):
   }});
 </script>"""
         return snippet
+
+class IngestionJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = IngestionJob
+        fields = ("id","chatbot","status","chunks_total","chunks_embedded","chunks_upserted",
+                  "chunks_unchanged","chunks_deleted","attempts","error","created_at","started_at","finished_at")
+
+class ChunkedUploadSerializer(serializers.ModelSerializer):
+    upload_id = serializers.UUIDField(source="id", read_only=True)
+
+    class Meta:
+        model = ChunkedUpload
+        fields = ("upload_id","filename","document_id","total_size","received_bytes","status","job")
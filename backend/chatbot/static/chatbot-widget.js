@@ -11,10 +11,14 @@
     textColor: '#ffffff',
     buttonText: 'Chat',
     placeholder: 'Type your message...',
-    title: 'Chat with us'
+    title: 'Chat with us',
+    stream: true
   };
 
   let initialized = false;
+  let messageCount = 0;
+  // the last message that failed to send; sending it again reuses its message_id
+  let failedMessage = null;
 
   /* =====================================================
      PUBLIC INIT
@@ -115,34 +119,113 @@
     input.value = '';
     input.disabled = true;
 
-    addMessage('user', text);
+    // lets the server recognise a resent message and return the first reply
+    const retry = failedMessage && failedMessage.text === text;
+    const messageId = retry ? failedMessage.messageId : newMessageId();
+    failedMessage = null;
+
+    if (!retry) addMessage('user', text);
     const typingId = addMessage('bot', 'Typing...');
 
+    const done = () => {
+      input.disabled = false;
+      input.focus();
+    };
+    const streaming = CONFIG.stream && window.ReadableStream && window.TextDecoder;
+
     fetch(`${CONFIG.apiBaseUrl}/chatbot/webhook/${CONFIG.webhookKey}/`, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
-      body: JSON.stringify({ message: text })
+      headers: {
+        'Content-Type': 'application/json',
+        'Accept': streaming ? 'text/event-stream' : 'application/json'
+      },
+      body: JSON.stringify({ message: text, message_id: messageId, stream: !!streaming })
     })
-      .then(res => res.json())
-      .then(data => {
-        removeMessage(typingId);
-        addMessage('bot', data.reply || 'No response');
-        input.disabled = false;
-        input.focus();
+      .then(res => {
+        const type = res.headers.get('Content-Type') || '';
+        if (streaming && res.body && type.indexOf('text/event-stream') === 0) {
+          return readStream(res, typingId);
+        }
+        return res.json().then(data => {
+          removeMessage(typingId);
+          addMessage('bot', data.reply || 'No response');
+        });
       })
+      .then(done)
       .catch(() => {
         removeMessage(typingId);
-        addMessage('bot', 'Error occurred');
+        addMessage('bot', 'Error occurred, press Enter to retry');
+        failedMessage = { text, messageId };
+        input.value = text;
         input.disabled = false;
       });
   }
 
+  function newMessageId() {
+    return window.crypto && crypto.randomUUID
+      ? crypto.randomUUID()
+      : Date.now().toString(36) + Math.random().toString(36).slice(2);
+  }
+
+  /* =====================================================
+     STREAMING (Server-Sent Events over fetch)
+  ===================================================== */
+  function readStream(res, typingId) {
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    let el = null;
+
+    function show(text) {
+      if (!el) {
+        removeMessage(typingId);
+        el = document.getElementById(addMessage('bot', ''));
+      }
+      el.textContent = text;
+      const box = document.getElementById('chatbot-messages');
+      box.scrollTop = box.scrollHeight;
+    }
+
+    function handle(block) {
+      let event = 'message';
+      let data = '';
+      block.split('\n').forEach(line => {
+        if (line.indexOf('event:') === 0) event = line.slice(6).trim();
+        else if (line.indexOf('data:') === 0) data += line.slice(5).trim();
+      });
+      if (!data) return;
+      const payload = JSON.parse(data);
+      if (event === 'token') show((el ? el.textContent : '') + payload.delta);
+      else if (event === 'done') show(payload.reply || 'No response');
+      else if (event === 'error') show('Error occurred');
+    }
+
+    function pump() {
+      return reader.read().then(({ value, done }) => {
+        if (done) {
+          if (buffer.trim()) handle(buffer);
+          if (!el) show('No response');
+          return;
+        }
+        buffer += decoder.decode(value, { stream: true });
+        let index;
+        while ((index = buffer.indexOf('\n\n')) !== -1) {
+          handle(buffer.slice(0, index));
+          buffer = buffer.slice(index + 2);
+        }
+        return pump();
+      });
+    }
+
+    return pump();
+  }
+
   /* =====================================================
      MESSAGE HELPERS
   ===================================================== */
   function addMessage(role, text) {
     const box = document.getElementById('chatbot-messages');
-    const id = 'msg_' + Date.now();
+    const id = 'msg_' + Date.now() + '_' + (++messageCount);
     const div = document.createElement('div');
     div.id = id;
     div.className = `message ${role}`;
@@ -1,3 +1,141 @@
-from django.test import TestCase
+import datetime
+import os
+import shutil
+import tempfile
+import uuid
+from unittest import mock
+from django.contrib.auth.models import User
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from ingestion import vector_store
+from ingestion.numpy_store import NumpyVectorStore
+from tenants.models import Tenant
+from .jobs import claim_ingestion_job, enqueue_ingestion, run_ingestion_job, text_documents
+from .models import Chatbot, ChunkedUpload, DocumentChunk, IngestionJob
+from .uploads import chunked_upload_path, create_upload_file, purge_stale_uploads
 
-# Create your tests here.
+def _fake_embeddings(texts, model="text-embedding-3-small", batch_size=None, max_tokens=None, dimensions=None):
+    """Deterministic 64-dimensional vectors derived from the text"""
+    return [[float((hash(text) >> shift) % 7) + 1.0 for shift in range(64)] for text in texts]
+
+def _paragraphs(*names):
+    return "\n\n".join(f"Paragraph about {name}. " + f"{name} details. " * 250 for name in names)
+
+@override_settings(VECTOR_BACKEND="numpy", INGESTION_EMBEDDED_WORKERS=0)
+class IngestionJobTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.store = NumpyVectorStore(self.root)
+        for patcher in (
+            mock.patch.dict(vector_store._stores, {"numpy": self.store}),
+            mock.patch("ingestion.services.get_embeddings", side_effect=_fake_embeddings),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        tenant = Tenant.objects.create(name="tenant")
+        self.chatbot = Chatbot.objects.create(tenant=tenant, name="bot", embedding_dimensions=64)
+
+    def ingest(self, documents, replace_missing=False) -> IngestionJob:
+        job = enqueue_ingestion(self.chatbot, documents, replace_missing=replace_missing)
+        claimed = claim_ingestion_job()
+        self.assertEqual(claimed.pk, job.pk)
+        run_ingestion_job(claimed)
+        job.refresh_from_db()
+        self.assertEqual(job.status, IngestionJob.STATUS_DONE, job.error)
+        return job
+
+    def stored_ids(self):
+        index = self.store._load(self.chatbot.vector_namespace)
+        return set(index.positions()) if index else set()
+
+    def test_texts_without_ids_are_added_not_replaced(self):
+        self.ingest(text_documents(["Opening hours are 9 to 5."]))
+        self.ingest(text_documents(["Returns are accepted within 30 days."]))
+        self.assertEqual(self.chatbot.documents.count(), 2)
+        self.assertEqual(len(self.stored_ids()), 2)
+
+        job = self.ingest(text_documents(["Opening hours are 9 to 5."]))
+        self.assertEqual((job.chunks_upserted, job.chunks_unchanged), (0, 1))
+        self.assertEqual(self.chatbot.documents.count(), 2)
+
+    def test_reingesting_a_document_only_embeds_changed_chunks(self):
+        first = self.ingest([{"document_id": "faq", "name": "faq", "text": _paragraphs("alpha", "beta", "gamma")}])
+        self.assertGreater(first.chunks_upserted, 2)
+        before = self.stored_ids()
+        self.assertEqual(before, {str(p) for p in DocumentChunk.objects.values_list("point_id", flat=True)})
+
+        second = self.ingest([{"document_id": "faq", "name": "faq", "text": _paragraphs("alpha", "beta", "delta")}])
+        self.assertGreater(second.chunks_unchanged, 0)
+        self.assertGreater(second.chunks_upserted, 0)
+        self.assertGreater(second.chunks_deleted, 0)
+        after = self.stored_ids()
+        self.assertEqual(after, {str(p) for p in DocumentChunk.objects.values_list("point_id", flat=True)})
+        self.assertTrue(before & after)
+        self.assertEqual(self.chatbot.documents.get().chunk_count, len(after))
+        self.chatbot.refresh_from_db()
+        self.assertEqual(self.chatbot.knowledge_version, 2)
+
+    def test_sync_deletes_documents_missing_from_the_upload(self):
+        self.ingest([{"document_id": "a", "name": "a", "text": "Document A."},
+                     {"document_id": "b", "name": "b", "text": "Document B."}])
+        job = self.ingest([{"document_id": "a", "name": "a", "text": "Document A."}], replace_missing=True)
+        self.assertEqual(job.chunks_deleted, 1)
+        self.assertEqual(list(self.chatbot.documents.values_list("document_id", flat=True)), ["a"])
+        self.assertEqual(self.stored_ids(), {str(p) for p in DocumentChunk.objects.values_list("point_id", flat=True)})
+        self.assertEqual(len(self.stored_ids()), 1)
+
+    def test_text_ids(self):
+        documents = text_documents(["first", "  ", "second"], ["faq", "", ""])
+        self.assertEqual(documents[0]["document_id"], "faq")
+        self.assertTrue(documents[1]["document_id"].startswith("text-"))
+        self.assertEqual(documents[1]["document_id"], text_documents(["second"])[0]["document_id"])
+        self.assertNotEqual(documents[1]["document_id"], text_documents(["third"])[0]["document_id"])
+
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, root, ignore_errors=True)
+        settings_override = override_settings(INGESTION_UPLOAD_DIR=root, INGESTION_EMBEDDED_WORKERS=0)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.root = root
+        user = User.objects.create_user("owner", password="x")
+        self.chatbot = Chatbot.objects.create(tenant=Tenant.objects.create(name="tenant", owner=user), name="bot")
+        self.client = APIClient()
+        self.client.force_authenticate(user)
+
+    def upload(self, data: bytes) -> ChunkedUpload:
+        upload = ChunkedUpload.objects.create(chatbot=self.chatbot, filename="big.txt", total_size=len(data),
+                                              received_bytes=len(data))
+        with open(chunked_upload_path(upload), "wb") as f:
+            f.write(data)
+        return upload
+
+    def test_complete_rejects_invalid_utf8_past_the_first_block(self):
+        upload = self.upload(b"a" * 200_000 + b"\xff" + b"b" * 10)
+        response = self.client.post(f"/api/chatbot/{self.chatbot.id}/uploads/{upload.id}/complete/")
+        self.assertEqual(response.status_code, 400, response.content)
+        upload.refresh_from_db()
+        self.assertEqual(upload.status, ChunkedUpload.STATUS_UPLOADING)
+        self.assertFalse(IngestionJob.objects.exists())
+
+        upload = self.upload("é".encode("utf-8") * 100_000)
+        response = self.client.post(f"/api/chatbot/{self.chatbot.id}/uploads/{upload.id}/complete/")
+        self.assertEqual(response.status_code, 202, response.content)
+
+    def test_abandoned_uploads_are_purged(self):
+        stale = ChunkedUpload.objects.create(chatbot=self.chatbot, filename="stale.txt", total_size=10)
+        create_upload_file(stale)
+        fresh = ChunkedUpload.objects.create(chatbot=self.chatbot, filename="fresh.txt", total_size=10)
+        create_upload_file(fresh)
+        old = timezone.now() - datetime.timedelta(days=2)
+        ChunkedUpload.objects.filter(pk=stale.pk).update(updated_at=old)
+        orphan = os.path.join(self.root, f"{uuid.uuid4().hex}.part")
+        open(orphan, "wb").close()
+        os.utime(orphan, (old.timestamp(), old.timestamp()))
+
+        self.assertEqual(purge_stale_uploads(), 2)
+        self.assertEqual(list(ChunkedUpload.objects.values_list("pk", flat=True)), [fresh.pk])
+        self.assertEqual(os.listdir(self.root), [f"{fresh.id.hex}.part"])
@@ -0,0 +1,92 @@
+# on-disk storage for documents awaiting ingestion (uploads are streamed, never read whole into memory)
+import codecs
+import datetime
+import os
+import time
+import uuid
+from django.conf import settings
+from django.utils import timezone
+
+COPY_BUFFER_SIZE = 64 * 1024
+
+def upload_dir() -> str:
+    path = str(getattr(settings, "INGESTION_UPLOAD_DIR", "uploads"))
+    os.makedirs(path, exist_ok=True)
+    return path
+
+def save_uploaded_file(uploaded_file) -> str:
+    """Write a Django UploadedFile to the upload dir chunk by chunk and return its path"""
+    path = os.path.join(upload_dir(), f"{uuid.uuid4().hex}.upload")
+    with open(path, "wb") as out:
+        for part in uploaded_file.chunks():
+            out.write(part)
+    return path
+
+def is_utf8_text(path: str) -> bool:
+    """Check that the whole file is valid UTF-8 (read in blocks, never whole into memory)"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    try:
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(COPY_BUFFER_SIZE), b""):
+                decoder.decode(block)
+        decoder.decode(b"", final=True)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+def chunked_upload_path(upload) -> str:
+    return os.path.join(upload_dir(), f"{upload.id.hex}.part")
+
+def create_upload_file(upload):
+    open(chunked_upload_path(upload), "wb").close()
+
+def write_upload_part(upload, offset: int, stream, length: int) -> int:
+    """Copy `length` bytes from stream into the upload's file at offset; returns bytes written"""
+    written = 0
+    with open(chunked_upload_path(upload), "r+b") as out:
+        out.seek(offset)
+        while written < length:
+            data = stream.read(min(COPY_BUFFER_SIZE, length - written))
+            if not data:
+                break
+            out.write(data)
+            written += len(data)
+    return written
+
+def remove_file(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"Warning: Could not remove {path}: {e}")
+
+def purge_stale_uploads() -> int:
+    """Delete chunked uploads left unfinished for INGESTION_UPLOAD_EXPIRY_HOURS, with their .part files.
+
+    Also removes .part files that no upload row refers to any more (e.g. its
+    chatbot was deleted). Completed uploads are left alone: their file belongs
+    to the ingestion job, which removes it when it finishes.
+    """
+    from .models import ChunkedUpload
+    max_age = getattr(settings, "INGESTION_UPLOAD_EXPIRY_HOURS", 24) * 3600
+    cutoff = timezone.now() - datetime.timedelta(seconds=max_age)
+    removed = 0
+    for upload in ChunkedUpload.objects.filter(status=ChunkedUpload.STATUS_UPLOADING, updated_at__lt=cutoff):
+        # a part written meanwhile moves updated_at, and the upload is kept
+        if ChunkedUpload.objects.filter(pk=upload.pk, updated_at=upload.updated_at).delete()[0]:
+            remove_file(chunked_upload_path(upload))
+            removed += 1
+    directory = upload_dir()
+    known = {upload_id.hex for upload_id in ChunkedUpload.objects.values_list("id", flat=True)}
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.endswith(".part") and name[:-len(".part")] not in known:
+            try:
+                stale = os.path.getmtime(path) < time.time() - max_age
+            except FileNotFoundError:
+                continue
+            if stale:
+                remove_file(path)
+                removed += 1
+    return removed
@@ -1,9 +1,14 @@
 from django.urls import path
-from .views import ChatbotCreateView, ChatbotListView, ChatbotWebhookView, ChatbotIngestView
+from .views import (ChatbotCreateView, ChatbotListView, ChatbotWebhookView, ChatbotIngestView, IngestionJobStatusView,
+                    ChunkedUploadCreateView, ChunkedUploadDetailView, ChunkedUploadCompleteView)
 
 urlpatterns = [
     path("", ChatbotListView.as_view(), name="chatbot-list"),
     path("create/", ChatbotCreateView.as_view(), name="chatbot-create"),
     path("webhook/<str:webhook_key>/", ChatbotWebhookView.as_view(), name="chatbot-webhook"),
     path("<int:chatbot_id>/ingest/", ChatbotIngestView.as_view(), name="chatbot-ingest"),
+    path("<int:chatbot_id>/ingest/<int:job_id>/", IngestionJobStatusView.as_view(), name="chatbot-ingest-status"),
+    path("<int:chatbot_id>/uploads/", ChunkedUploadCreateView.as_view(), name="chatbot-upload-create"),
+    path("<int:chatbot_id>/uploads/<uuid:upload_id>/", ChunkedUploadDetailView.as_view(), name="chatbot-upload-detail"),
+    path("<int:chatbot_id>/uploads/<uuid:upload_id>/complete/", ChunkedUploadCompleteView.as_view(), name="chatbot-upload-complete"),
 ]
@@ -1,13 +1,36 @@
+import asyncio
+import contextlib
+import json
+import re
 from rest_framework import generics, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
-from .models import Chatbot
-from .serializers import ChatbotCreateSerializer, ChatbotListSerializer
+from django.conf import settings
+from django.db import transaction
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+from .models import Chatbot, ChunkedUpload, IngestionJob
+from .serializers import ChatbotCreateSerializer, ChatbotListSerializer, ChunkedUploadSerializer, IngestionJobSerializer
+from .jobs import enqueue_ingestion, text_documents
+from .uploads import (chunked_upload_path, create_upload_file, is_utf8_text, remove_file,
+                      save_uploaded_file, write_upload_part)
 from tenants.models import Tenant
-from fb.services import process_incoming_for_chatbot
-from ingestion.services import ingest_documents
+from chat.dedup import aclaim_delivery, acomplete_delivery, arelease_delivery, await_reply
+from fb.routing import achatbot_for_key
+from fb.services import aprocess_incoming_for_chatbot, astream_incoming_for_chatbot
+from ingestion.vector_store import get_vector_store
+
+def _form_list(data, key: str) -> list:
+    """All values of a form field (or of a JSON string/list field)"""
+    if hasattr(data, "getlist"):
+        return data.getlist(key)
+    value = data.get(key) or []
+    return value if isinstance(value, list) else [value]
 
 class ChatbotCreateView(generics.CreateAPIView):
     serializer_class = ChatbotCreateSerializer
@@ -18,72 +41,52 @@ class ChatbotCreateView(generics.CreateAPIView):
         tenant = Tenant.objects.filter(owner=self.request.user).first()
         chatbot = serializer.save(tenant=tenant)
         
+        # Create the vector collection up front so the chat path never has to check for it
+        try:
+            config = chatbot.embedding_config()
+            get_vector_store().ensure_namespace(chatbot.vector_namespace, config["vector_size"],
+                                                config["quantization"])
+        except Exception as e:
+            print(f"⚠ Could not create vector collection for chatbot {chatbot.name}: {e}")
+        
         # Process vector data if provided (optional - chatbot creation succeeds even if this fails)
         ingestion_result = {"success": False, "message": "", "chunks_ingested": 0}
         try:
             documents = self.request.FILES.getlist('documents') if hasattr(self.request, 'FILES') else []
-            document_texts = self.request.data.get('document_texts', '')
+            document_texts = _form_list(self.request.data, 'document_texts')
             
             if documents or document_texts:
                 # If files are uploaded, read them
-                texts_to_ingest = []
+                documents_to_ingest = []
                 
-                # Process uploaded files
+                # Process uploaded files (streamed to disk, decoded incrementally by the worker)
                 if documents:
                     for doc in documents:
                         try:
-                            if hasattr(doc, 'read'):
-                                content = doc.read().decode('utf-8')
-                                if content.strip():
-                                    texts_to_ingest.append(content)
-                        except UnicodeDecodeError:
-                            print(f"Error: File {doc.name} is not a valid text file (UTF-8)")
+                            path = save_uploaded_file(doc)
+                            if not is_utf8_text(path):
+                                remove_file(path)
+                                print(f"Error: File {doc.name} is not a valid text file (UTF-8)")
+                                continue
+                            documents_to_ingest.append({"document_id": doc.name, "name": doc.name, "path": path})
                         except Exception as e:
                             print(f"Error reading document {doc.name}: {e}")
                 
-                # Process text documents
-                if document_texts:
-                    if isinstance(document_texts, str) and document_texts.strip():
-                        texts_to_ingest.append(document_texts.strip())
-                    elif isinstance(document_texts, list):
-                        for text in document_texts:
-                            if isinstance(text, str) and text.strip():
-                                texts_to_ingest.append(text.strip())
+                # Process text documents (document_text_ids, if given, name them for later updates)
+                documents_to_ingest.extend(text_documents(document_texts,
+                                                          _form_list(self.request.data, 'document_text_ids')))
                 
-                # Ingest into vector database (optional - don't fail chatbot creation if this fails)
-                if texts_to_ingest:
-                    try:
-                        metadata = {
-                            "chatbot_id": chatbot.id,
-                            "chatbot_name": chatbot.name,
-                            "tenant_id": tenant.id
-                        }
-                        chunks_count = ingest_documents(chatbot.vector_namespace, texts_to_ingest, metadata)
-                        ingestion_result = {
-                            "success": True,
-                            "message": f"Successfully ingested {chunks_count} document chunks",
-                            "chunks_ingested": chunks_count
-                        }
-                        print(f"✓ Vector ingestion successful: {chunks_count} chunks ingested for chatbot {chatbot.name}")
-                    except ValueError as e:
-                        # API key or configuration issue
-                        ingestion_result = {
-                            "success": False,
-                            "message": f"Configuration error: {str(e)}",
-                            "chunks_ingested": 0
-                        }
-                        print(f"⚠ Configuration error during vector ingestion: {e}")
-                    except Exception as e:
-                        # Other errors (Qdrant connection, etc.)
-                        ingestion_result = {
-                            "success": False,
-                            "message": f"Vector database error: {str(e)}",
-                            "chunks_ingested": 0
-                        }
-                        print(f"⚠ Error ingesting documents into vector database: {e}")
-                        print("   Chatbot created successfully, but vector database ingestion failed.")
-                        import traceback
-                        traceback.print_exc()
+                # Queue ingestion into the vector database; workers process it in the background
+                if documents_to_ingest:
+                    job = enqueue_ingestion(chatbot, documents_to_ingest)
+                    ingestion_result = {
+                        "success": True,
+                        "message": f"Queued {len(documents_to_ingest)} document(s) for ingestion",
+                        "chunks_ingested": 0,
+                        "job_id": job.id,
+                        "status": job.status,
+                    }
+                    print(f"✓ Queued ingestion job {job.id} for chatbot {chatbot.name}")
         except Exception as e:
             # Don't fail chatbot creation if vector processing fails
             ingestion_result = {
@@ -106,27 +109,118 @@ class ChatbotListView(generics.ListAPIView):
         tenant = Tenant.objects.filter(owner=self.request.user).first()
         return Chatbot.objects.filter(tenant=tenant)
 
-class ChatbotWebhookView(APIView):
-    authentication_classes = []
-    permission_classes = []
+def _request_data(request) -> dict:
+    """JSON or form body of a plain Django request"""
+    if request.content_type == "application/json":
+        try:
+            data = json.loads(request.body or b"{}")
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+    return request.POST
+
+def _wants_stream(request, data) -> bool:
+    flag = str(request.GET.get("stream", data.get("stream", ""))).lower()
+    return flag in ("1", "true") or "text/event-stream" in request.headers.get("Accept", "")
 
-    def post(self, request, webhook_key):
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+async def _sse_reply(chatbot, sender_id: str, text: str, dedup_key: str = None):
+    """Server-Sent Events: one "token" event per delta, then "done" with the full reply (or "error")"""
+    parts = []
+    completed = False
+    try:
         try:
-            chatbot = Chatbot.objects.get(webhook_key=webhook_key, is_active=True)
-        except Chatbot.DoesNotExist:
-            return Response({"error": "Chatbot not found"}, status=status.HTTP_404_NOT_FOUND)
+            # closed as soon as the client goes away, so the partial reply is saved right then
+            async with contextlib.aclosing(astream_incoming_for_chatbot(chatbot, sender_id, text)) as stream:
+                async for delta in stream:
+                    parts.append(delta)
+                    yield _sse("token", {"delta": delta})
+        except Exception as e:
+            print(f"✗ Error streaming reply for chatbot {chatbot.id}: {e}")
+            yield _sse("error", {"error": "Could not generate a reply"})
+            return
+        if dedup_key:
+            await acomplete_delivery(dedup_key, "".join(parts))
+        completed = True
+        yield _sse("done", {"reply": "".join(parts)})
+    finally:
+        # failed, or the client went away mid-stream (GeneratorExit / CancelledError): let a retry process it
+        if dedup_key and not completed:
+            await asyncio.shield(arelease_delivery(dedup_key))
+
+async def _sse_stored_reply(reply: str):
+    yield _sse("token", {"delta": reply})
+    yield _sse("done", {"reply": reply, "duplicate": True})
+
+def _stream_response(events) -> StreamingHttpResponse:
+    response = StreamingHttpResponse(events, content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    # keep proxies (nginx) from buffering the stream
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+@method_decorator(csrf_exempt, name="dispatch")
+class ChatbotWebhookView(View):
+    """Widget webhook; async so waiting on OpenAI/Qdrant doesn't hold a worker thread (serve via ASGI).
+
+    With ?stream=1, "stream": true or Accept: text/event-stream the reply is
+    sent as Server-Sent Events while it is generated. A message sent again with
+    the same Idempotency-Key header (or "message_id") is not processed twice;
+    the first reply is returned instead.
+    """
+
+    async def post(self, request, webhook_key):
+        chatbot = await achatbot_for_key(webhook_key)
+        if chatbot is None:
+            return JsonResponse({"error": "Chatbot not found"}, status=status.HTTP_404_NOT_FOUND)
 
         # Extract message from request
-        text = request.data.get("message", "")
-        sender_id = request.data.get("sender_id", request.data.get("user_id", "anonymous"))
+        data = _request_data(request)
+        text = data.get("message", "")
+        sender_id = data.get("sender_id", data.get("user_id", "anonymous"))
 
         if not text:
-            return Response({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
+            return JsonResponse({"error": "Message is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        stream = _wants_stream(request, data)
+        idempotency_key = request.headers.get("Idempotency-Key") or data.get("message_id")
+        dedup_key = f"widget:{chatbot.id}:{idempotency_key}"[:255] if idempotency_key else None
+        if dedup_key:
+            is_new, record = await aclaim_delivery(dedup_key)
+            reply = None
+            if not is_new:
+                reply = record.reply if record and record.status == record.STATUS_DONE else await await_reply(dedup_key)
+                if reply is None:
+                    # the first request failed or its lease lapsed meanwhile: take it over
+                    is_new, record = await aclaim_delivery(dedup_key)
+                    if not is_new and record and record.status == record.STATUS_DONE:
+                        reply = record.reply
+            if not is_new:
+                if reply is None:
+                    return JsonResponse({"error": "Message is already being processed"},
+                                        status=status.HTTP_409_CONFLICT)
+                if stream:
+                    return _stream_response(_sse_stored_reply(reply))
+                return JsonResponse({"reply": reply, "duplicate": True}, status=status.HTTP_200_OK)
+
+        if stream:
+            return _stream_response(_sse_reply(chatbot, sender_id, text, dedup_key))
 
         # Process the message
-        reply = process_incoming_for_chatbot(chatbot, sender_id, text, channel="widget", fb_page=None)
+        completed = False
+        try:
+            reply = await aprocess_incoming_for_chatbot(chatbot, sender_id, text, channel="widget", fb_page=None)
+            if dedup_key:
+                await acomplete_delivery(dedup_key, reply)
+            completed = True
+        finally:
+            # failed, cancelled (client disconnect) or timed out: let a retry process it
+            if dedup_key and not completed:
+                await asyncio.shield(arelease_delivery(dedup_key))
 
-        return Response({"reply": reply}, status=status.HTTP_200_OK)
+        return JsonResponse({"reply": reply}, status=status.HTTP_200_OK)
 
 class ChatbotIngestView(APIView):
     """Endpoint to add more documents to chatbot's vector database"""
@@ -140,40 +234,167 @@ class ChatbotIngestView(APIView):
             return Response({"error": "Chatbot not found"}, status=status.HTTP_404_NOT_FOUND)
 
         documents = request.FILES.getlist('documents')
-        document_texts = request.data.get('document_texts', [])
+        document_texts = _form_list(request.data, 'document_texts')
         
-        texts_to_ingest = []
+        documents_to_ingest = []
         
-        # Process uploaded files
+        # Process uploaded files (streamed to disk, decoded incrementally by the worker)
         for doc in documents:
             try:
-                content = doc.read().decode('utf-8')
-                texts_to_ingest.append(content)
+                path = save_uploaded_file(doc)
             except Exception as e:
                 return Response({"error": f"Error reading file {doc.name}: {str(e)}"}, 
                               status=status.HTTP_400_BAD_REQUEST)
+            if not is_utf8_text(path):
+                remove_file(path)
+                return Response({"error": f"Error reading file {doc.name}: not a valid text file (UTF-8)"}, 
+                              status=status.HTTP_400_BAD_REQUEST)
+            documents_to_ingest.append({"document_id": doc.name, "name": doc.name, "path": path})
         
-        # Process text documents
-        if document_texts:
-            if isinstance(document_texts, str):
-                texts_to_ingest.append(document_texts)
-            elif isinstance(document_texts, list):
-                texts_to_ingest.extend(document_texts)
+        # Process text documents; a text posted again under the same id
+        # (document_text_ids) replaces the earlier version, texts without one are added
+        documents_to_ingest.extend(text_documents(document_texts, _form_list(request.data, 'document_text_ids')))
         
-        if not texts_to_ingest:
+        if not documents_to_ingest:
             return Response({"error": "No documents provided"}, status=status.HTTP_400_BAD_REQUEST)
         
+        # sync=true removes previously ingested documents that are not part of this upload
+        replace_missing = str(request.data.get("sync", "")).lower() in ("1", "true", "yes")
+        job = enqueue_ingestion(chatbot, documents_to_ingest, replace_missing=replace_missing)
+        return Response({
+            "message": f"Queued {len(documents_to_ingest)} document(s) for ingestion",
+            "job_id": job.id,
+            "status": job.status,
+            "status_url": request.build_absolute_uri(f"/api/chatbot/{chatbot.id}/ingest/{job.id}/"),
+        }, status=status.HTTP_202_ACCEPTED)
+
+class IngestionJobStatusView(generics.RetrieveAPIView):
+    """Report progress of a background ingestion job"""
+    serializer_class = IngestionJobSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    lookup_url_kwarg = "job_id"
+
+    def get_queryset(self):
+        return IngestionJob.objects.filter(
+            chatbot_id=self.kwargs["chatbot_id"],
+            chatbot__tenant__owner=self.request.user,
+        )
+
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+class ChunkedUploadCreateView(APIView):
+    """Start a resumable upload of a large document: POST {filename, total_size, document_id?}"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, chatbot_id):
         try:
-            metadata = {
-                "chatbot_id": chatbot.id,
-                "chatbot_name": chatbot.name,
-                "tenant_id": chatbot.tenant.id
-            }
-            count = ingest_documents(chatbot.vector_namespace, texts_to_ingest, metadata)
-            return Response({
-                "message": f"Successfully ingested {count} document chunks",
-                "chunks_count": count
-            }, status=status.HTTP_200_OK)
-        except Exception as e:
-            return Response({"error": f"Error ingesting documents: {str(e)}"}, 
-                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            chatbot = Chatbot.objects.get(id=chatbot_id, tenant__owner=request.user)
+        except Chatbot.DoesNotExist:
+            return Response({"error": "Chatbot not found"}, status=status.HTTP_404_NOT_FOUND)
+
+        filename = request.data.get("filename") or "document.txt"
+        try:
+            total_size = int(request.data.get("total_size"))
+        except (TypeError, ValueError):
+            return Response({"error": "total_size is required"}, status=status.HTTP_400_BAD_REQUEST)
+        max_size = getattr(settings, "INGESTION_UPLOAD_MAX_BYTES", 1024 ** 3)
+        if total_size <= 0 or total_size > max_size:
+            return Response({"error": f"total_size must be between 1 and {max_size} bytes"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        document_id = request.data.get("document_id") or filename
+        upload = ChunkedUpload.objects.create(chatbot=chatbot, filename=filename[:255],
+                                              document_id=document_id[:255], total_size=total_size)
+        create_upload_file(upload)
+        return Response(ChunkedUploadSerializer(upload).data, status=status.HTTP_201_CREATED)
+
+class ChunkedUploadDetailView(APIView):
+    """GET reports how many bytes were received (where to resume); PUT appends one part.
+
+    Parts are sent as the raw request body with a `Content-Range: bytes start-end/total`
+    header, and start must equal the number of bytes already received.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_upload(self, request, chatbot_id, upload_id):
+        return ChunkedUpload.objects.filter(
+            id=upload_id, chatbot_id=chatbot_id, chatbot__tenant__owner=request.user
+        ).first()
+
+    def get(self, request, chatbot_id, upload_id):
+        upload = self.get_upload(request, chatbot_id, upload_id)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(ChunkedUploadSerializer(upload).data)
+
+    def put(self, request, chatbot_id, upload_id):
+        upload = self.get_upload(request, chatbot_id, upload_id)
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        if upload.status != ChunkedUpload.STATUS_UPLOADING:
+            return Response({"error": "Upload already completed"}, status=status.HTTP_409_CONFLICT)
+
+        match = CONTENT_RANGE_RE.match(request.headers.get("Content-Range", ""))
+        if not match:
+            return Response({"error": "Content-Range header (bytes start-end/total) is required"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        start, end = int(match.group(1)), int(match.group(2)) + 1
+        length = end - start
+        max_part = getattr(settings, "INGESTION_UPLOAD_MAX_PART_BYTES", 16 * 1024 * 1024)
+        if length <= 0 or length > max_part or end > upload.total_size:
+            return Response({"error": f"Invalid part range (max part size {max_part} bytes)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if start != upload.received_bytes:
+            return Response({"error": "Part does not start at the current offset",
+                             "received_bytes": upload.received_bytes}, status=status.HTTP_409_CONFLICT)
+
+        written = write_upload_part(upload, start, request.stream, length)
+        if written != length:
+            return Response({"error": f"Expected {length} bytes, received {written}",
+                             "received_bytes": upload.received_bytes}, status=status.HTTP_400_BAD_REQUEST)
+        # only advance if no concurrent request already moved the offset
+        advanced = ChunkedUpload.objects.filter(pk=upload.pk, received_bytes=start).update(
+            received_bytes=end, updated_at=timezone.now()
+        )
+        upload.refresh_from_db()
+        if not advanced:
+            return Response({"error": "Part conflicts with a concurrent upload",
+                             "received_bytes": upload.received_bytes}, status=status.HTTP_409_CONFLICT)
+        return Response(ChunkedUploadSerializer(upload).data)
+
+class ChunkedUploadCompleteView(APIView):
+    """Finish a resumable upload and queue it for ingestion (idempotent)"""
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request, chatbot_id, upload_id):
+        upload = ChunkedUpload.objects.filter(
+            id=upload_id, chatbot_id=chatbot_id, chatbot__tenant__owner=request.user
+        ).select_related("chatbot").first()
+        if upload is None:
+            return Response({"error": "Upload not found"}, status=status.HTTP_404_NOT_FOUND)
+        if upload.received_bytes != upload.total_size:
+            return Response({"error": "Upload is incomplete", "received_bytes": upload.received_bytes},
+                            status=status.HTTP_409_CONFLICT)
+
+        path = chunked_upload_path(upload)
+        # the whole file is checked (outside the transaction, it may take a moment for large files)
+        if upload.status == ChunkedUpload.STATUS_UPLOADING and not is_utf8_text(path):
+            return Response({"error": f"Error reading file {upload.filename}: not a valid text file (UTF-8)"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        with transaction.atomic():
+            claimed = ChunkedUpload.objects.filter(
+                pk=upload.pk, status=ChunkedUpload.STATUS_UPLOADING
+            ).update(status=ChunkedUpload.STATUS_COMPLETE)
+            if claimed:
+                job = enqueue_ingestion(upload.chatbot, [{"document_id": upload.document_id or upload.filename,
+                                                           "name": upload.filename, "path": path}])
+                ChunkedUpload.objects.filter(pk=upload.pk).update(job=job)
+        upload.refresh_from_db()
+        if upload.job is None:
+            return Response({"error": "Upload is being finalized"}, status=status.HTTP_409_CONFLICT)
+        return Response({
+            "message": f"Queued {upload.filename} for ingestion",
+            "job_id": upload.job_id,
+            "status": upload.job.status,
+            "status_url": request.build_absolute_uri(f"/api/chatbot/{chatbot_id}/ingest/{upload.job_id}/"),
+        }, status=status.HTTP_202_ACCEPTED)
@@ -1,7 +1,17 @@
 from django.contrib import admin
-from .models import FacebookPage
+from .models import FacebookPage, InboundEvent, OutboundMessage
 
 @admin.register(FacebookPage)
 class FacebookPageAdmin(admin.ModelAdmin):
-    list_display = ("tenant","page_id","page_name","created_at")
+    list_display = ("tenant","page_id","page_name","default_chatbot","created_at")
     readonly_fields = ("access_token_encrypted",)
+
+@admin.register(InboundEvent)
+class InboundEventAdmin(admin.ModelAdmin):
+    list_display = ("id","sender_id","webhook_key","status","attempts","received_at","processed_at")
+    list_filter = ("status",)
+
+@admin.register(OutboundMessage)
+class OutboundMessageAdmin(admin.ModelAdmin):
+    list_display = ("id","page","recipient_id","status","attempts","created_at","sent_at")
+    list_filter = ("status",)
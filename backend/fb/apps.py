@@ -3,3 +3,6 @@ from django.apps import AppConfig
 class FbConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "fb"
+
+    def ready(self):
+        from . import routing  # noqa: F401  (connects the routing cache invalidation signals)
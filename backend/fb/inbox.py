@@ -0,0 +1,172 @@
+# durable inbox for Messenger webhook events, drained by background workers (no external broker)
+import datetime
+import threading
+from typing import Optional, Tuple
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from chat.dedup import claim_delivery, complete_delivery, release_delivery
+from utils.db_queue import WorkerPool, claim_next
+from utils.keyed_lock import KeyedLock
+from chatbot.models import Chatbot
+from .models import FacebookPage, InboundEvent
+from .routing import chatbot_for_key, route_page
+from .services import process_incoming_for_chatbot
+
+def enqueue_events(webhook_key: str, body: dict) -> list:
+    """Unsaved InboundEvents for every message in a webhook delivery (entry -> messaging)"""
+    events = []
+    for entry in body.get("entry", []) or []:
+        for messaging in entry.get("messaging", []) or []:
+            if "message" not in messaging or not messaging.get("sender", {}).get("id"):
+                continue
+            sender_id = str(messaging["sender"]["id"])
+            recipient_id = str(messaging.get("recipient", {}).get("id", ""))
+            events.append(InboundEvent(
+                webhook_key=webhook_key,
+                sender_id=sender_id,
+                recipient_id=recipient_id,
+                conversation_key=f"{webhook_key}/{recipient_id}/{sender_id}",
+                payload=messaging,
+            ))
+    return events
+
+@transaction.atomic
+def store_new_events(events: list) -> list:
+    """Insert the events whose message id was not queued before; returns the inserted ones.
+
+    Facebook redelivers on slow or failed acknowledgements, so each mid is
+    claimed (chat/dedup.py) in the same transaction as the insert: a failed
+    insert leaves no claims behind. The claims last the full dedup TTL, since
+    the stored event is retried by the inbox workers, which complete or
+    release its claim.
+    """
+    new = []
+    for event in events:
+        mid = event.payload.get("message", {}).get("mid")
+        if mid:
+            is_new, _ = claim_delivery(f"fb:{mid}", lease=getattr(settings, "DEDUP_TTL_SECONDS", 86400))
+            if not is_new:
+                continue
+        new.append(event)
+    if new:
+        InboundEvent.objects.bulk_create(new)
+    return new
+
+def resolve_target(event: InboundEvent) -> Tuple[Optional[Chatbot], Optional[FacebookPage]]:
+    """The chatbot that answers an event and the page to reply through.
+
+    The webhook key may be a chatbot's webhook_key; otherwise the page is looked
+    up by the event's recipient or the key and its default chatbot answers
+    (routes are cached, see fb/routing.py).
+    """
+    chatbot = chatbot_for_key(event.webhook_key)
+    if chatbot is not None:
+        return chatbot, None
+    chatbot, page = route_page(event.recipient_id)
+    if page is None:
+        chatbot, page = route_page(event.webhook_key)
+    return chatbot, page
+
+def claim_inbound_event():
+    """Claim the oldest pending event, or one whose worker died while processing it.
+
+    Events wait while an earlier event of their conversation is unfinished, so
+    each sender's messages are answered in order while different senders are
+    processed in parallel by the pool's workers.
+    """
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=getattr(settings, "FB_INBOX_STALE_SECONDS", 300))
+    max_attempts = getattr(settings, "FB_INBOX_MAX_ATTEMPTS", 3)
+    abandoned = InboundEvent.objects.filter(
+        status=InboundEvent.STATUS_PROCESSING, claimed_at__lt=stale_before, attempts__gte=max_attempts
+    )
+    for event in abandoned:
+        if InboundEvent.objects.filter(pk=event.pk, claimed_at=event.claimed_at).update(
+            status=InboundEvent.STATUS_FAILED, error="Worker stopped responding", processed_at=now
+        ):
+            _release_event(event)
+    earlier_unfinished = InboundEvent.objects.filter(
+        conversation_key=OuterRef("conversation_key"),
+        pk__lt=OuterRef("pk"),
+        status__in=[InboundEvent.STATUS_PENDING, InboundEvent.STATUS_PROCESSING],
+    )
+    queryset = InboundEvent.objects.filter(
+        Q(status=InboundEvent.STATUS_PENDING, next_attempt_at__isnull=True)
+        | Q(status=InboundEvent.STATUS_PENDING, next_attempt_at__lte=now)
+        | Q(status=InboundEvent.STATUS_PROCESSING, claimed_at__lt=stale_before),
+        attempts__lt=max_attempts,
+    ).exclude(Exists(earlier_unfinished))
+    return claim_next(
+        queryset,
+        claim_field="claimed_at",
+        status=InboundEvent.STATUS_PROCESSING,
+        claimed_at=now,
+        attempts=F("attempts") + 1,
+    )
+
+def _backoff_seconds(attempts: int) -> float:
+    base = getattr(settings, "FB_INBOX_RETRY_BASE_SECONDS", 5.0)
+    return min(base * 2 ** max(attempts - 1, 0), getattr(settings, "FB_INBOX_RETRY_MAX_SECONDS", 300.0))
+
+def _release_event(event: InboundEvent):
+    """Let Facebook's redelivery of a failed event be processed again"""
+    mid = event.payload.get("message", {}).get("mid")
+    if mid:
+        release_delivery(f"fb:{mid}")
+
+# different webhook keys/pages can route to the same chatbot; serialize per (chatbot, sender) too
+_conversation_locks = KeyedLock()
+
+def handle_inbound_event(event: InboundEvent):
+    mid = event.payload.get("message", {}).get("mid")
+    reply = ""
+    try:
+        chatbot, page = resolve_target(event)
+        if chatbot is not None:
+            text = event.payload.get("message", {}).get("text", "")
+            with _conversation_locks.hold((chatbot.id, event.sender_id)):
+                reply = process_incoming_for_chatbot(chatbot, event.sender_id, text, channel="fb", fb_page=page)
+    except Exception as e:
+        print(f"✗ Inbound event {event.pk} failed: {e}")
+        max_attempts = getattr(settings, "FB_INBOX_MAX_ATTEMPTS", 3)
+        failed = event.attempts >= max_attempts
+        now = timezone.now()
+        InboundEvent.objects.filter(pk=event.pk).update(
+            status=InboundEvent.STATUS_FAILED if failed else InboundEvent.STATUS_PENDING,
+            error=str(e),
+            processed_at=now,
+            next_attempt_at=None if failed else now + datetime.timedelta(seconds=_backoff_seconds(event.attempts)),
+        )
+        if failed:
+            _release_event(event)
+        return
+    InboundEvent.objects.filter(pk=event.pk).update(status=InboundEvent.STATUS_DONE, processed_at=timezone.now())
+    if mid:
+        complete_delivery(f"fb:{mid}", reply)
+
+def inbox_worker_pool(workers: int = None, poll_interval: float = None) -> WorkerPool:
+    return WorkerPool(
+        "fb-inbox",
+        claim_inbound_event,
+        handle_inbound_event,
+        workers=workers or getattr(settings, "FB_INBOX_WORKERS", 4),
+        poll_interval=poll_interval or getattr(settings, "FB_INBOX_POLL_INTERVAL", 0.5),
+    )
+
+_embedded_pool = None
+_embedded_lock = threading.Lock()
+
+def ensure_embedded_inbox_workers():
+    """Start in-process inbox workers when FB_INBOX_EMBEDDED_WORKERS > 0 (dev / single-node setups).
+
+    Production deployments run `manage.py run_inbox_workers` instead.
+    """
+    global _embedded_pool
+    count = getattr(settings, "FB_INBOX_EMBEDDED_WORKERS", 0)
+    if count <= 0 or _embedded_pool is not None:
+        return
+    with _embedded_lock:
+        if _embedded_pool is None:
+            _embedded_pool = inbox_worker_pool(workers=count).start()
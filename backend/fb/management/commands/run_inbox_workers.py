@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+from fb.inbox import claim_inbound_event, handle_inbound_event, inbox_worker_pool
+
+class Command(BaseCommand):
+    help = "Run background workers that answer Messenger events queued by the webhook"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds to sleep when the inbox is empty")
+        parser.add_argument("--once", action="store_true", help="Drain the inbox once and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            processed = 0
+            while True:
+                event = claim_inbound_event()
+                if event is None:
+                    break
+                handle_inbound_event(event)
+                processed += 1
+            self.stdout.write(self.style.SUCCESS(f"Processed {processed} inbound event(s)"))
+            return
+        inbox_worker_pool(options["workers"], options["poll_interval"]).run_forever()
@@ -0,0 +1,27 @@
+import time
+from django.core.management.base import BaseCommand
+from fb.outbox import claim_outbound_message, handle_outbound_message, outbox_stats, outbox_worker_pool
+
+class Command(BaseCommand):
+    help = "Run background workers that send queued Messenger replies through the Graph API"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=None, help="Number of worker threads")
+        parser.add_argument("--poll-interval", type=float, default=None, help="Seconds to sleep when the outbox is empty")
+        parser.add_argument("--once", action="store_true", help="Send the messages that are due once and exit")
+
+    def handle(self, *args, **options):
+        if options["once"]:
+            started = time.perf_counter()
+            while True:
+                message = claim_outbound_message()
+                if message is None:
+                    break
+                handle_outbound_message(message)
+            stats = outbox_stats()
+            self.stdout.write(self.style.SUCCESS(
+                f"Sent {stats['sent']}, retrying {stats['retried']}, failed {stats['failed']}, "
+                f"rate limited {stats['rate_limited']} ({time.perf_counter() - started:.1f}s)"
+            ))
+            return
+        outbox_worker_pool(options["workers"], options["poll_interval"]).run_forever()
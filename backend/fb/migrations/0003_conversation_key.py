@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb', '0002_inbound_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboundevent',
+            name='conversation_key',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=255),
+        ),
+    ]
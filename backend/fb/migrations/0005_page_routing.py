@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def set_default_chatbots(apps, schema_editor):
+    # keep the previous routing: each page is answered by its tenant's latest chatbot
+    FacebookPage = apps.get_model("fb", "FacebookPage")
+    Chatbot = apps.get_model("chatbot", "Chatbot")
+    for page in FacebookPage.objects.filter(default_chatbot__isnull=True):
+        chatbot = Chatbot.objects.filter(tenant_id=page.tenant_id).order_by("-created_at").first()
+        if chatbot is not None:
+            FacebookPage.objects.filter(pk=page.pk).update(default_chatbot=chatbot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chatbot', '0007_context_assembly'),
+        ('fb', '0004_outbound_messages'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='facebookpage',
+            name='default_chatbot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='fb_pages', to='chatbot.chatbot'),
+        ),
+        migrations.AlterField(
+            model_name='facebookpage',
+            name='page_id',
+            field=models.CharField(db_index=True, max_length=100),
+        ),
+        migrations.RunPython(set_default_chatbots, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb', '0006_routing_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboundevent',
+            name='next_attempt_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-18 09:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('fb', '0007_inbound_retry_backoff'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PageSendRate',
+            fields=[
+                ('page', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='send_rate', serialize=False, to='fb.facebookpage')),
+                ('next_send_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
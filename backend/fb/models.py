@@ -5,7 +5,10 @@ from django.conf import settings
 
 class FacebookPage(models.Model):
     tenant = models.ForeignKey(Tenant, on_delete=models.CASCADE, related_name="fb_pages")
-    page_id = models.CharField(max_length=100)
+    page_id = models.CharField(max_length=100, db_index=True)
+    # chatbot answering the page's messages (empty: the tenant's latest chatbot)
+    default_chatbot = models.ForeignKey("chatbot.Chatbot", on_delete=models.SET_NULL, null=True, blank=True,
+                                        related_name="fb_pages")
     page_name = models.CharField(max_length=200, null=True, blank=True)
     access_token_encrypted = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
@@ -17,3 +20,81 @@ class FacebookPage(models.Model):
     def get_access_token(self):
         f = Fernet(settings.FERNET_KEY.encode())
         return f.decrypt(self.access_token_encrypted.encode()).decode()
+
+class InboundEvent(models.Model):
+    """A Messenger messaging event persisted by the webhook, processed later by inbox workers"""
+    STATUS_PENDING = "pending"
+    STATUS_PROCESSING = "processing"
+    STATUS_DONE = "done"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_PROCESSING, "Processing"),
+        (STATUS_DONE, "Done"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    # key from the webhook URL (a chatbot webhook_key or a page id)
+    webhook_key = models.CharField(max_length=200)
+    sender_id = models.CharField(max_length=200, db_index=True)
+    recipient_id = models.CharField(max_length=200, blank=True, default="")
+    # events of one conversation (same webhook key, page and sender, hence same chatbot and
+    # sender) are processed one at a time in arrival order
+    conversation_key = models.CharField(max_length=255, blank=True, default="", db_index=True)
+    # the raw "messaging" item as delivered by Facebook
+    payload = models.JSONField(default=dict)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    received_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    # a failed event is retried no earlier than this (exponential backoff)
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"InboundEvent {self.id} ({self.sender_id}, {self.status})"
+
+class OutboundMessage(models.Model):
+    """A reply waiting to be sent through the Graph API by the outbox workers (fb/outbox.py)"""
+    STATUS_PENDING = "pending"
+    STATUS_SENDING = "sending"
+    STATUS_SENT = "sent"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_PENDING, "Pending"),
+        (STATUS_SENDING, "Sending"),
+        (STATUS_SENT, "Sent"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    page = models.ForeignKey(FacebookPage, on_delete=models.CASCADE, related_name="outbound_messages")
+    recipient_id = models.CharField(max_length=200, db_index=True)
+    text = models.TextField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default=STATUS_PENDING, db_index=True)
+    attempts = models.IntegerField(default=0)
+    error = models.TextField(blank=True, default="")
+    # retries and rate-limited sends wait until then
+    next_attempt_at = models.DateTimeField(null=True, blank=True, db_index=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    claimed_at = models.DateTimeField(null=True, blank=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"OutboundMessage {self.id} ({self.recipient_id}, {self.status})"
+
+class PageSendRate(models.Model):
+    """A page's Graph API send schedule, shared by the outbox workers of every process (see fb/outbox.py)"""
+    page = models.OneToOneField(FacebookPage, on_delete=models.CASCADE, primary_key=True, related_name="send_rate")
+    # theoretical arrival time of the next send (GCRA): 1 / FB_OUTBOX_PAGE_RATE later for every send
+    next_send_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"PageSendRate {self.page_id}"
+
+class RoutingVersion(models.Model):
+    """Single-row counter bumped on every routing change; each process polls it to drop its cached routes"""
+    version = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"RoutingVersion {self.version}"
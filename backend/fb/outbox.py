@@ -0,0 +1,192 @@
+# outbound Graph API queue: replies are stored by the chat pipeline and sent by outbox workers
+import collections
+import datetime
+import threading
+from typing import Optional
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Q
+from django.utils import timezone
+from utils.db_queue import WorkerPool, claim_next
+from utils.http import get_http_client
+from .models import FacebookPage, OutboundMessage, PageSendRate
+
+GRAPH_API_URL = "https://graph.facebook.com/v16.0"
+# Graph API error codes for throttling (answered with HTTP 400 or 403 rather than 429)
+GRAPH_THROTTLE_CODES = {4, 17, 32, 613}
+
+_stats_lock = threading.Lock()
+_stats = {"sent": 0, "failed": 0, "retried": 0, "rate_limited": 0}
+# queue-to-delivery seconds of the latest sends
+_latencies = collections.deque(maxlen=1000)
+
+def _count(name: str):
+    with _stats_lock:
+        _stats[name] += 1
+
+def _reserve_send(page_id: int) -> float:
+    """Take one of the page's sends; returns 0, or the seconds until one is available.
+
+    A token bucket of FB_OUTBOX_PAGE_RATE per second and FB_OUTBOX_PAGE_BURST
+    tokens, kept in the page's PageSendRate row so the limit holds across all
+    outbox processes: each send moves next_send_at forward by 1 / rate, and a
+    send is allowed while that stays within burst / rate of now (GCRA). The row
+    is updated conditionally on the value read, so two workers never take the
+    same slot.
+    """
+    rate = getattr(settings, "FB_OUTBOX_PAGE_RATE", 10.0)
+    if rate <= 0:
+        return 0.0
+    interval = datetime.timedelta(seconds=1 / rate)
+    tolerance = interval * getattr(settings, "FB_OUTBOX_PAGE_BURST", 20)
+    for _ in range(10):
+        now = timezone.now()
+        row, _ = PageSendRate.objects.get_or_create(page_id=page_id)
+        next_send_at = max(row.next_send_at or now, now) + interval
+        if next_send_at - now > tolerance:
+            return (next_send_at - now - tolerance).total_seconds()
+        if PageSendRate.objects.filter(page_id=page_id, next_send_at=row.next_send_at).update(
+            next_send_at=next_send_at
+        ):
+            return 0.0
+    # other workers keep taking the slots first; try again after one interval
+    return interval.total_seconds()
+
+def queue_reply(page: FacebookPage, recipient_id: str, text: str) -> OutboundMessage:
+    message = OutboundMessage.objects.create(page=page, recipient_id=recipient_id, text=text)
+    ensure_embedded_outbox_workers()
+    return message
+
+async def aqueue_reply(page: FacebookPage, recipient_id: str, text: str) -> OutboundMessage:
+    message = await OutboundMessage.objects.acreate(page=page, recipient_id=recipient_id, text=text)
+    ensure_embedded_outbox_workers()
+    return message
+
+def claim_outbound_message():
+    """Claim the oldest message that is due, or one whose worker died while sending it.
+
+    Messages wait while an earlier message to the same recipient is unsent, so
+    each conversation receives its replies in order.
+    """
+    now = timezone.now()
+    stale_before = now - datetime.timedelta(seconds=getattr(settings, "FB_OUTBOX_STALE_SECONDS", 120))
+    max_attempts = getattr(settings, "FB_OUTBOX_MAX_ATTEMPTS", 5)
+    OutboundMessage.objects.filter(
+        status=OutboundMessage.STATUS_SENDING, claimed_at__lt=stale_before, attempts__gte=max_attempts
+    ).update(status=OutboundMessage.STATUS_FAILED, error="Worker stopped responding")
+    earlier_unsent = OutboundMessage.objects.filter(
+        page_id=OuterRef("page_id"),
+        recipient_id=OuterRef("recipient_id"),
+        pk__lt=OuterRef("pk"),
+        status__in=[OutboundMessage.STATUS_PENDING, OutboundMessage.STATUS_SENDING],
+    )
+    queryset = OutboundMessage.objects.filter(
+        Q(status=OutboundMessage.STATUS_PENDING, next_attempt_at__isnull=True)
+        | Q(status=OutboundMessage.STATUS_PENDING, next_attempt_at__lte=now)
+        | Q(status=OutboundMessage.STATUS_SENDING, claimed_at__lt=stale_before),
+        attempts__lt=max_attempts,
+    ).exclude(Exists(earlier_unsent))
+    return claim_next(
+        queryset,
+        claim_field="claimed_at",
+        status=OutboundMessage.STATUS_SENDING,
+        claimed_at=now,
+        attempts=F("attempts") + 1,
+    )
+
+def _send(message: OutboundMessage) -> Optional[str]:
+    """POST the message; returns None when sent, "retry: ..." or "error: ..." otherwise"""
+    page = message.page
+    try:
+        response = get_http_client("graph").post(
+            f"{GRAPH_API_URL}/{page.page_id}/messages",
+            json={"recipient": {"id": message.recipient_id}, "message": {"text": message.text}},
+            params={"access_token": page.get_access_token()},
+        )
+    except Exception as e:
+        return f"retry: {e}"
+    if response.status_code < 300:
+        return None
+    try:
+        error = response.json().get("error", {})
+    except ValueError:
+        error = {}
+    detail = f"HTTP {response.status_code}: {error.get('message') or response.text[:200]}"
+    if response.status_code == 429 or response.status_code >= 500 or error.get("code") in GRAPH_THROTTLE_CODES:
+        return f"retry: {detail}"
+    return f"error: {detail}"
+
+def _backoff_seconds(attempts: int) -> float:
+    base = getattr(settings, "FB_OUTBOX_RETRY_BASE_SECONDS", 2.0)
+    return min(base * 2 ** max(attempts - 1, 0), getattr(settings, "FB_OUTBOX_RETRY_MAX_SECONDS", 300.0))
+
+def handle_outbound_message(message: OutboundMessage):
+    now = timezone.now()
+    wait = _reserve_send(message.page_id)
+    if wait > 0:
+        # over the page's rate: put it back without using up an attempt
+        OutboundMessage.objects.filter(pk=message.pk).update(
+            status=OutboundMessage.STATUS_PENDING,
+            attempts=F("attempts") - 1,
+            next_attempt_at=now + datetime.timedelta(seconds=wait),
+        )
+        _count("rate_limited")
+        return
+
+    error = _send(message)
+    now = timezone.now()
+    if error is None:
+        OutboundMessage.objects.filter(pk=message.pk).update(status=OutboundMessage.STATUS_SENT, sent_at=now,
+                                                             error="")
+        _count("sent")
+        with _stats_lock:
+            _latencies.append((now - message.created_at).total_seconds())
+        return
+
+    max_attempts = getattr(settings, "FB_OUTBOX_MAX_ATTEMPTS", 5)
+    if error.startswith("retry") and message.attempts < max_attempts:
+        OutboundMessage.objects.filter(pk=message.pk).update(
+            status=OutboundMessage.STATUS_PENDING,
+            error=error,
+            next_attempt_at=now + datetime.timedelta(seconds=_backoff_seconds(message.attempts)),
+        )
+        _count("retried")
+        return
+    print(f"✗ Outbound message {message.pk} to {message.recipient_id} failed: {error}")
+    OutboundMessage.objects.filter(pk=message.pk).update(status=OutboundMessage.STATUS_FAILED, error=error)
+    _count("failed")
+
+def outbox_stats() -> dict:
+    """Send counters of this process plus delivery latency (seconds from queueing to sent)"""
+    with _stats_lock:
+        stats = dict(_stats)
+        latencies = sorted(_latencies)
+    if latencies:
+        stats["latency_avg"] = sum(latencies) / len(latencies)
+        stats["latency_p50"] = latencies[len(latencies) // 2]
+        stats["latency_p95"] = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+    return stats
+
+def outbox_worker_pool(workers: int = None, poll_interval: float = None) -> WorkerPool:
+    return WorkerPool(
+        "fb-outbox",
+        claim_outbound_message,
+        handle_outbound_message,
+        workers=workers or getattr(settings, "FB_OUTBOX_WORKERS", 4),
+        poll_interval=poll_interval or getattr(settings, "FB_OUTBOX_POLL_INTERVAL", 0.5),
+    )
+
+_embedded_pool = None
+_embedded_lock = threading.Lock()
+
+def ensure_embedded_outbox_workers():
+    """Start in-process outbox workers when FB_OUTBOX_EMBEDDED_WORKERS > 0 (dev / single-node setups).
+
+    Production deployments run `manage.py run_outbox_workers` instead.
+    """
+    global _embedded_pool
+    count = getattr(settings, "FB_OUTBOX_EMBEDDED_WORKERS", 0)
+    if count <= 0 or _embedded_pool is not None:
+        return
+    with _embedded_lock:
+        if _embedded_pool is None:
+            _embedded_pool = outbox_worker_pool(workers=count).start()
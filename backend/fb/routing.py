@@ -0,0 +1,128 @@
+# in-process routing table: webhook key -> chatbot and page id -> (chatbot, page), so inbound
+# messages are resolved without database queries (beyond a once-a-second version check)
+import threading
+import time
+from typing import Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from chatbot.models import Chatbot
+from tenants.models import Tenant
+from .models import FacebookPage, RoutingVersion
+
+_routes = {}  # (kind, key) -> (expires timestamp, route)
+_routes_version = None
+# the RoutingVersion counter as last read from the database, and when
+_seen_version = None
+_seen_at = 0.0
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "invalidations": 0, "version_reads": 0}
+
+def invalidate_routes():
+    """Drop cached routes here and, through the RoutingVersion row, in every other process"""
+    global _routes_version, _seen_version
+    if not RoutingVersion.objects.filter(pk=1).update(version=F("version") + 1):
+        try:
+            with transaction.atomic():
+                RoutingVersion.objects.create(pk=1, version=1)
+        except IntegrityError:  # created concurrently
+            RoutingVersion.objects.filter(pk=1).update(version=F("version") + 1)
+    with _lock:
+        _routes.clear()
+        # lookups already in flight must not store what they loaded before the change
+        _routes_version = None
+        _seen_version = None
+        _stats["invalidations"] += 1
+
+@receiver([post_save, post_delete], sender=Chatbot)
+@receiver([post_save, post_delete], sender=FacebookPage)
+@receiver([post_save, post_delete], sender=Tenant)
+def _routes_changed(sender, **kwargs):
+    invalidate_routes()
+
+def _polled_version():
+    """The last version read, or None when it is due to be read again (ROUTING_VERSION_POLL_SECONDS)"""
+    poll = getattr(settings, "ROUTING_VERSION_POLL_SECONDS", 1.0)
+    with _lock:
+        if _seen_version is not None and time.monotonic() - _seen_at < poll:
+            return _seen_version
+    return None
+
+def _read_version() -> int:
+    global _seen_version, _seen_at
+    version = RoutingVersion.objects.filter(pk=1).values_list("version", flat=True).first() or 0
+    with _lock:
+        _seen_version, _seen_at = version, time.monotonic()
+        _stats["version_reads"] += 1
+    return version
+
+def _current_version() -> int:
+    version = _polled_version()
+    return _read_version() if version is None else version
+
+def _cached(kind: str, key: str, version):
+    global _routes_version
+    with _lock:
+        if version != _routes_version:
+            _routes.clear()
+            _routes_version = version
+            return False, None
+        entry = _routes.get((kind, key))
+        if entry is None or entry[0] <= time.monotonic():
+            return False, None
+        _stats["hits"] += 1
+        return True, entry[1]
+
+def _remember(kind: str, key: str, version, route):
+    with _lock:
+        _stats["misses"] += 1
+        if version == _routes_version:
+            _routes[(kind, key)] = (time.monotonic() + getattr(settings, "ROUTING_CACHE_TTL", 60), route)
+
+def _load_chatbot(webhook_key: str) -> Optional[Chatbot]:
+    return Chatbot.objects.select_related("tenant").filter(webhook_key=webhook_key, is_active=True).first()
+
+def _load_page(page_id: str) -> Tuple[Optional[Chatbot], Optional[FacebookPage]]:
+    page = FacebookPage.objects.select_related("tenant", "default_chatbot__tenant").filter(page_id=page_id).first()
+    if page is None:
+        return None, None
+    chatbot = page.default_chatbot
+    if chatbot is None:
+        # pages without a default chatbot are answered by their tenant's latest one
+        chatbot = Chatbot.objects.select_related("tenant").filter(tenant_id=page.tenant_id).order_by("-created_at").first()
+    return chatbot, page
+
+def chatbot_for_key(webhook_key: str) -> Optional[Chatbot]:
+    """The active chatbot (tenant loaded) with this webhook key, or None"""
+    version = _current_version()
+    found, chatbot = _cached("chatbot", webhook_key, version)
+    if not found:
+        chatbot = _load_chatbot(webhook_key)
+        _remember("chatbot", webhook_key, version, chatbot)
+    return chatbot
+
+def route_page(page_id: str) -> Tuple[Optional[Chatbot], Optional[FacebookPage]]:
+    """(chatbot, page) for a Facebook page id, or (None, None) for an unknown page"""
+    version = _current_version()
+    found, route = _cached("page", page_id, version)
+    if not found:
+        route = _load_page(page_id)
+        _remember("page", page_id, version, route)
+    return route
+
+async def achatbot_for_key(webhook_key: str) -> Optional[Chatbot]:
+    version = _polled_version()
+    if version is None:
+        version = await sync_to_async(_read_version)()
+    found, chatbot = _cached("chatbot", webhook_key, version)
+    if not found:
+        chatbot = await sync_to_async(_load_chatbot)(webhook_key)
+        _remember("chatbot", webhook_key, version, chatbot)
+    return chatbot
+
+def routing_stats() -> dict:
+    with _lock:
+        return {**_stats, "routes": len(_routes)}
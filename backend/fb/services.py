@@ -1,53 +1,171 @@
-import requests
+import asyncio
 from django.conf import settings
-from chat.models import ChatMemory
+from chat.memory_store import get_conversation_store
+from chat.prompt_builder import build_messages
+from chat.reply_cache import get_reply_cache, reply_cache_version
 from chatbot.models import Chatbot
 from .models import FacebookPage
-from utils.llm_clients import ask_llm
+from .outbox import aqueue_reply, queue_reply
+from utils.llm_clients import aask_llm, ask_llm, astream_chat
 from ingestion.vector_client import retrieve_top_k  # optional, if ingestion exists
 
 def send_reply_to_facebook(page: FacebookPage, recipient_id: str, text: str):
-    token = page.get_access_token()
-    url = f"https://graph.facebook.com/v16.0/{page.page_id}/messages"
-    payload = {"recipient":{"id": recipient_id}, "message":{"text": text}}
-    params = {"access_token": token}
-    try:
-        requests.post(url, json=payload, params=params, timeout=10)
-    except Exception:
-        pass
+    """Queue a reply for the outbox workers, which send it with rate limits and retries (fb/outbox.py)"""
+    queue_reply(page, recipient_id, text)
 
-def process_incoming_for_chatbot(chatbot: Chatbot, sender_id: str, text: str, channel: str = "fb", fb_page: FacebookPage = None):
-    # Chat memory per chatbot + user
-    mem, _ = ChatMemory.objects.get_or_create(chatbot=chatbot, fb_user_id=sender_id)
-    if mem.is_expired():
-        mem.clear()
-    mem.add_message("user", text)
+async def asend_reply_to_facebook(page: FacebookPage, recipient_id: str, text: str):
+    await aqueue_reply(page, recipient_id, text)
 
-    # retrieval (optional)
-    docs = []
+def _cached_reply_lookup(chatbot: Chatbot, text: str):
+    """Return (cached reply or None, question embedding) for a single-turn question"""
+    cache = get_reply_cache()
+    if cache is None or not chatbot.reply_cache_ttl:
+        return None, None
     try:
-        from ingestion.services import search_similar
-        docs = search_similar(chatbot.vector_namespace, text, k=4)
+        from ingestion.services import get_embedding
+        # the same embedding is reused by search_similar through the embedding cache
+        embedding = get_embedding(text, dimensions=chatbot.embedding_config()["dimensions"])
     except Exception as e:
-        print(f"Error retrieving vectors: {e}")
+        print(f"Error embedding question for reply cache: {e}")
+        return None, None
+    if not embedding:
+        return None, None
+    reply = cache.lookup(chatbot.id, reply_cache_version(chatbot), embedding, chatbot.reply_cache_threshold)
+    return reply, embedding
+
+def process_incoming_for_chatbot(chatbot: Chatbot, sender_id: str, text: str, channel: str = "fb", fb_page: FacebookPage = None):
+    # Chat memory per chatbot + user (written to the DB in batches, see chat/memory_store.py)
+    conversations = get_conversation_store()
+    mem = conversations.get(chatbot, sender_id)
+    # only questions without earlier turns are answered from / stored in the reply cache,
+    # since follow-up answers depend on the conversation
+    single_turn = not mem.messages and not mem.summary
+    conversations.add_message(mem, "user", text)
+
+    reply, question_embedding = _cached_reply_lookup(chatbot, text) if single_turn else (None, None)
+    if reply is not None:
+        print(f"✓ Reply cache hit for chatbot {chatbot.id}")
+    else:
+        # retrieval (optional)
         docs = []
+        try:
+            from ingestion.context import assemble_context
+            from ingestion.services import search_scored
+            results = search_scored(chatbot.vector_namespace, text, k=chatbot.retrieval_top_k,
+                                    embedding=chatbot.embedding_config())
+            docs = assemble_context(results, min_score=chatbot.retrieval_min_score,
+                                    max_tokens=chatbot.context_max_tokens)
+        except Exception as e:
+            print(f"Error retrieving vectors: {e}")
+            docs = []
 
-    # Build messages for LLM
-    messages = [{"role":"system", "content": chatbot.system_prompt}]
-    # add memory (last messages)
-    for m in mem.messages[-6:]:
-        messages.append({"role": m["role"], "content": m["text"]})
-    # add docs
-    for d in docs:
-        messages.append({"role":"system","content":"Relevant: " + d})
+        # Build messages for LLM (stable prefix first, see chat/prompt_builder.py)
+        messages = build_messages(chatbot, mem.prompt_history(chatbot.memory_max_tokens), text, docs,
+                                  summary=mem.summary)
+        reply = ask_llm(messages, cache_key=f"chatbot-{chatbot.id}")
 
-    messages.append({"role":"user","content": text})
-    reply = ask_llm(messages)
+        if question_embedding:
+            get_reply_cache().store(chatbot.id, reply_cache_version(chatbot), text, question_embedding, reply,
+                                    chatbot.reply_cache_ttl)
 
-    mem.add_message("assistant", reply)
+    conversations.add_message(mem, "assistant", reply)
 
     # send to FB if FB channel
     if channel == "fb" and fb_page:
         send_reply_to_facebook(fb_page, sender_id, reply)
     # if widget, return reply
     return reply
+
+async def _aprepare_turn(chatbot: Chatbot, sender_id: str, text: str):
+    """Shared first half of the async pipeline.
+
+    Returns (mem, cached reply or None, LLM messages or None, store) where
+    store(reply) puts a generated reply into the reply cache when allowed.
+    """
+    from ingestion.context import assemble_context
+    from ingestion.services import aget_embedding, asearch_scored
+    config = chatbot.embedding_config()
+
+    async def embed():
+        try:
+            return await aget_embedding(text, dimensions=config["dimensions"])
+        except Exception as e:
+            print(f"Error embedding question: {e}")
+            return None
+
+    conversations = get_conversation_store()
+    mem, question_embedding = await asyncio.gather(conversations.aget(chatbot, sender_id), embed())
+    # only questions without earlier turns are answered from / stored in the reply cache
+    single_turn = not mem.messages and not mem.summary
+    await conversations.aadd_message(mem, "user", text)
+
+    cache = get_reply_cache() if single_turn and chatbot.reply_cache_ttl and question_embedding else None
+
+    def store(reply: str):
+        if cache:
+            cache.store(chatbot.id, reply_cache_version(chatbot), text, question_embedding, reply,
+                        chatbot.reply_cache_ttl)
+
+    if cache:
+        reply = cache.lookup(chatbot.id, reply_cache_version(chatbot), question_embedding,
+                             chatbot.reply_cache_threshold)
+        if reply is not None:
+            print(f"✓ Reply cache hit for chatbot {chatbot.id}")
+            return mem, reply, None, store
+
+    docs = []
+    if question_embedding:
+        try:
+            results = await asearch_scored(chatbot.vector_namespace, k=chatbot.retrieval_top_k, embedding=config,
+                                           query_embedding=question_embedding)
+            docs = assemble_context(results, min_score=chatbot.retrieval_min_score,
+                                    max_tokens=chatbot.context_max_tokens)
+        except Exception as e:
+            print(f"Error retrieving vectors: {e}")
+            docs = []
+    return mem, None, build_messages(chatbot, mem.prompt_history(chatbot.memory_max_tokens), text, docs,
+                                     summary=mem.summary), store
+
+async def aprocess_incoming_for_chatbot(chatbot: Chatbot, sender_id: str, text: str, channel: str = "fb",
+                                        fb_page: FacebookPage = None):
+    """Async process_incoming_for_chatbot for ASGI views.
+
+    The memory fetch and the query embedding run concurrently; the embedding is
+    then shared by the reply cache lookup and the vector search. chatbot must
+    be loaded with select_related("tenant").
+    """
+    mem, reply, messages, store = await _aprepare_turn(chatbot, sender_id, text)
+    if reply is None:
+        reply = await aask_llm(messages, cache_key=f"chatbot-{chatbot.id}")
+        store(reply)
+
+    await get_conversation_store().aadd_message(mem, "assistant", reply)
+    if channel == "fb" and fb_page:
+        await asend_reply_to_facebook(fb_page, sender_id, reply)
+    return reply
+
+async def astream_incoming_for_chatbot(chatbot: Chatbot, sender_id: str, text: str):
+    """Like aprocess_incoming_for_chatbot (widget channel), but yields the reply as text deltas.
+
+    The complete reply is saved to memory (and the reply cache) once the stream
+    finishes. If the client goes away mid-stream, the part it was shown is saved
+    instead; if generating the reply fails, nothing is saved.
+    """
+    mem, reply, messages, store = await _aprepare_turn(chatbot, sender_id, text)
+    if reply is not None:
+        yield reply
+        await get_conversation_store().aadd_message(mem, "assistant", reply)
+        return
+    parts = []
+    try:
+        async for delta in astream_chat(messages, cache_key=f"chatbot-{chatbot.id}"):
+            parts.append(delta)
+            yield delta
+    except (GeneratorExit, asyncio.CancelledError):
+        reply = "".join(parts)
+        if reply:
+            await asyncio.shield(get_conversation_store().aadd_message(mem, "assistant", reply))
+        raise
+    reply = "".join(parts)
+    store(reply)
+    await get_conversation_store().aadd_message(mem, "assistant", reply)
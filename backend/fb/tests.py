@@ -1,3 +1,156 @@
-from django.test import TestCase
+import datetime
+from unittest import mock
+from asgiref.sync import async_to_sync
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from chatbot.models import Chatbot
+from tenants.models import Tenant
+from .inbox import claim_inbound_event, enqueue_events, handle_inbound_event, store_new_events
+from .models import FacebookPage, InboundEvent
+from .outbox import _reserve_send
+from .services import astream_incoming_for_chatbot
 
-# Create your tests here.
+def _delivery(*messages):
+    """A webhook body with one messaging item per (sender, mid, text)"""
+    return {"entry": [{"messaging": [
+        {"sender": {"id": sender}, "recipient": {"id": "page"}, "message": {"mid": mid, "text": text}}
+        for sender, mid, text in messages
+    ]}]}
+
+@override_settings(FB_INBOX_EMBEDDED_WORKERS=0, FB_INBOX_MAX_ATTEMPTS=3)
+class InboxTests(TestCase):
+    def setUp(self):
+        tenant = Tenant.objects.create(name="tenant")
+        self.chatbot = Chatbot.objects.create(tenant=tenant, name="bot")
+        # completed deliveries are remembered in memory across tests
+        patcher = mock.patch.dict("chat.dedup._done", clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch("fb.inbox.process_incoming_for_chatbot", return_value="reply")
+        self.process = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def store(self, *messages):
+        return store_new_events(enqueue_events(self.chatbot.webhook_key, _delivery(*messages)))
+
+    def test_redelivered_message_is_stored_once(self):
+        self.assertEqual(len(self.store(("alice", "m1", "hi"))), 1)
+        self.assertEqual(self.store(("alice", "m1", "hi")), [])
+        self.assertEqual(InboundEvent.objects.count(), 1)
+
+    def test_events_of_a_sender_are_handled_in_order(self):
+        self.store(("alice", "m1", "first"), ("alice", "m2", "second"), ("bob", "m3", "hello"))
+        first = claim_inbound_event()
+        self.assertEqual(first.payload["message"]["mid"], "m1")
+        # alice's second message waits for her first; bob is not held up
+        self.assertEqual(claim_inbound_event().payload["message"]["mid"], "m3")
+        self.assertIsNone(claim_inbound_event())
+        handle_inbound_event(first)
+        self.assertEqual(claim_inbound_event().payload["message"]["mid"], "m2")
+
+    def test_failed_event_is_retried_after_backoff(self):
+        self.store(("alice", "m1", "hi"))
+        self.process.side_effect = RuntimeError("OpenAI down")
+        event = claim_inbound_event()
+        handle_inbound_event(event)
+        event.refresh_from_db()
+        self.assertEqual(event.status, InboundEvent.STATUS_PENDING)
+        self.assertGreater(event.next_attempt_at, timezone.now())
+        self.assertIsNone(claim_inbound_event())
+
+        InboundEvent.objects.filter(pk=event.pk).update(next_attempt_at=timezone.now())
+        self.process.side_effect = None
+        self.assertEqual(len(self.store(("alice", "m2", "later"))), 1)
+        retried = claim_inbound_event()
+        self.assertEqual((retried.pk, retried.attempts), (event.pk, 2))
+        handle_inbound_event(retried)
+        retried.refresh_from_db()
+        self.assertEqual(retried.status, InboundEvent.STATUS_DONE)
+        self.assertEqual(claim_inbound_event().payload["message"]["mid"], "m2")
+
+    @override_settings(FB_INBOX_MAX_ATTEMPTS=1)
+    def test_final_failure_lets_the_redelivery_in(self):
+        self.store(("alice", "m1", "hi"))
+        self.process.side_effect = RuntimeError("OpenAI down")
+        handle_inbound_event(claim_inbound_event())
+        self.assertEqual(InboundEvent.objects.get().status, InboundEvent.STATUS_FAILED)
+        self.assertEqual(len(self.store(("alice", "m1", "hi"))), 1)
+
+    def test_stale_event_is_reclaimed(self):
+        self.store(("alice", "m1", "hi"))
+        event = claim_inbound_event()
+        self.assertIsNone(claim_inbound_event())
+        InboundEvent.objects.filter(pk=event.pk).update(claimed_at=timezone.now() - datetime.timedelta(hours=1))
+        reclaimed = claim_inbound_event()
+        self.assertEqual((reclaimed.pk, reclaimed.attempts), (event.pk, 2))
+
+    @override_settings(FB_INBOX_MAX_ATTEMPTS=1)
+    def test_abandoned_event_fails_and_lets_the_redelivery_in(self):
+        self.store(("alice", "m1", "hi"))
+        event = claim_inbound_event()
+        InboundEvent.objects.filter(pk=event.pk).update(claimed_at=timezone.now() - datetime.timedelta(hours=1))
+        self.assertIsNone(claim_inbound_event())
+        event.refresh_from_db()
+        self.assertEqual(event.status, InboundEvent.STATUS_FAILED)
+        self.assertEqual(len(self.store(("alice", "m1", "hi"))), 1)
+
+class StreamedReplyTests(TestCase):
+    def setUp(self):
+        self.chatbot = Chatbot(id=1, name="bot")
+        self.store = mock.Mock()
+        self.conversations = mock.Mock(aadd_message=mock.AsyncMock())
+        for patcher in (
+            mock.patch("fb.services._aprepare_turn", mock.AsyncMock(return_value=("mem", None, [], self.store))),
+            mock.patch("fb.services.get_conversation_store", return_value=self.conversations),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stream(self, *deltas, error=None):
+        async def astream_chat(messages, cache_key=None):
+            for delta in deltas:
+                yield delta
+            if error:
+                raise error
+        return mock.patch("fb.services.astream_chat", astream_chat)
+
+    def test_complete_reply_is_saved_and_cached(self):
+        async def consume():
+            return [delta async for delta in astream_incoming_for_chatbot(self.chatbot, "alice", "hi")]
+
+        with self.stream("Hel", "lo"):
+            self.assertEqual(async_to_sync(consume)(), ["Hel", "lo"])
+        self.store.assert_called_once_with("Hello")
+        self.conversations.aadd_message.assert_awaited_once_with("mem", "assistant", "Hello")
+
+    def test_partial_reply_is_saved_when_the_client_goes_away(self):
+        async def consume_one():
+            stream = astream_incoming_for_chatbot(self.chatbot, "alice", "hi")
+            await stream.__anext__()
+            await stream.aclose()
+
+        with self.stream("Hel", "lo"):
+            async_to_sync(consume_one)()
+        self.store.assert_not_called()
+        self.conversations.aadd_message.assert_awaited_once_with("mem", "assistant", "Hel")
+
+    def test_nothing_is_saved_when_the_reply_fails(self):
+        async def consume():
+            async for _ in astream_incoming_for_chatbot(self.chatbot, "alice", "hi"):
+                pass
+
+        with self.stream("Hel", error=RuntimeError("OpenAI down")):
+            with self.assertRaises(RuntimeError):
+                async_to_sync(consume)()
+        self.store.assert_not_called()
+        self.conversations.aadd_message.assert_not_awaited()
+
+class PageRateLimitTests(TestCase):
+    @override_settings(FB_OUTBOX_PAGE_RATE=10, FB_OUTBOX_PAGE_BURST=2)
+    def test_sends_beyond_the_burst_wait_for_the_rate(self):
+        page = FacebookPage.objects.create(tenant=Tenant.objects.create(name="tenant"), page_id="page",
+                                           access_token_encrypted="")
+        self.assertEqual([_reserve_send(page.pk), _reserve_send(page.pk)], [0.0, 0.0])
+        wait = _reserve_send(page.pk)
+        self.assertGreater(wait, 0)
+        self.assertLessEqual(wait, 0.1)
@@ -0,0 +1,59 @@
+# context assembly: turn scored search hits into the smallest useful set of prompt snippets
+from typing import List, Optional
+from utils.tokens import estimate_tokens
+
+SHINGLE_WORDS = 5
+MAX_OVERLAP_WORDS = 100
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < SHINGLE_WORDS:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(len(words) - SHINGLE_WORDS + 1)}
+
+def _overlap(before: List[str], after: List[str]) -> int:
+    """Length of the longest run of words that ends `before` and starts `after`"""
+    for size in range(min(len(before), len(after), MAX_OVERLAP_WORDS), 0, -1):
+        if before[-size:] == after[:size]:
+            return size
+    return 0
+
+def assemble_context(results, min_score: Optional[float] = None, max_tokens: Optional[int] = None,
+                     duplicate_threshold: float = 0.8) -> List[str]:
+    """Select snippets from search hits (best first) for the prompt.
+
+    Hits scoring below min_score are dropped, as are near-duplicates of a
+    better hit (share of common word shingles >= duplicate_threshold). Words a
+    hit shares with the end or start of an already selected hit, such as the
+    overlap between neighbouring chunks, are trimmed. The rest is packed best
+    first into max_tokens; hits that don't fit are skipped in favour of
+    smaller ones further down.
+    """
+    selected = []
+    used_tokens = 0
+    for result in results:
+        if min_score is not None and result.score < min_score:
+            continue
+        text = (result.payload or {}).get("text") or ""
+        words = text.split()
+        if not words:
+            continue
+        shingles = _shingles(words)
+        if any(len(shingles & s) >= duplicate_threshold * min(len(shingles), len(s)) for _, s in selected):
+            continue
+        for other, _ in selected:
+            trim = _overlap(other, words)
+            if trim:
+                words = words[trim:]
+            trim = _overlap(words, other)
+            if trim:
+                words = words[:-trim]
+            if not words:
+                break
+        if not words:
+            continue
+        tokens = estimate_tokens(" ".join(words))
+        if max_tokens is not None and used_tokens + tokens > max_tokens:
+            continue
+        used_tokens += tokens
+        selected.append((words, shingles))
+    return [" ".join(words) for words, _ in selected]
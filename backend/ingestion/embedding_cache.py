@@ -0,0 +1,218 @@
+# content-addressed embedding cache: in-process LRU tier in front of a persistent SQLite tier
+import hashlib
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+
+def normalize_text(text: str) -> str:
+    """Collapse whitespace so trivially reformatted text maps to the same key"""
+    return " ".join(text.split())
+
+def cache_key(model: str, text: str) -> str:
+    return hashlib.sha256(f"{model}\0{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+class EmbeddingCache:
+    """Embedding cache keyed by (model, normalized text hash).
+
+    Lookups go to the in-process LRU first, then the SQLite store; disk hits are
+    promoted into memory. Both tiers evict least recently used entries once they
+    exceed their size limits.
+    """
+
+    def __init__(self, path: Optional[str] = None, memory_entries: int = 10000, disk_entries: int = 500000):
+        self.path = str(path) if path else None
+        self.memory_entries = memory_entries
+        self.disk_entries = disk_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._writes_since_trim = 0
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if self.path:
+            self._init_db()
+
+    # ---- persistent tier ----
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        try:
+            conn = self._conn()
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "key TEXT PRIMARY KEY, model TEXT NOT NULL, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            conn.commit()
+        except Exception as e:
+            print(f"Warning: Could not open embedding cache at {self.path}: {e}")
+            self.path = None
+
+    def _disk_get_many(self, keys: List[str]) -> Dict[str, array]:
+        found = {}
+        if not self.path or not keys:
+            return found
+        try:
+            conn = self._conn()
+            # stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", part
+                ).fetchall()
+                for key, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[key] = vector
+            if found:
+                conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(time.time(), key) for key in found],
+                )
+                conn.commit()
+        except Exception as e:
+            print(f"Warning: embedding cache read failed: {e}")
+        return found
+
+    def _disk_set_many(self, rows: List[Tuple[str, str, array]]):
+        if not self.path or not rows:
+            return
+        try:
+            conn = self._conn()
+            now = time.time()
+            conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, model, vector, last_used) VALUES (?, ?, ?, ?)",
+                [(key, model, vector.tobytes(), now) for key, model, vector in rows],
+            )
+            conn.commit()
+            self._writes_since_trim += len(rows)
+            if self._writes_since_trim >= 1000:
+                self._writes_since_trim = 0
+                self._trim_disk(conn)
+        except Exception as e:
+            print(f"Warning: embedding cache write failed: {e}")
+
+    def _trim_disk(self, conn):
+        count = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.disk_entries
+        if excess > 0:
+            conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)",
+                (excess,),
+            )
+            conn.commit()
+            self.evictions += excess
+
+    # ---- in-process tier ----
+
+    def _memory_put(self, key: str, vector: array):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    # ---- public API ----
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Return cached embeddings aligned with texts (None for misses)"""
+        keys = [cache_key(model, t) for t in texts]
+        results = [None] * len(texts)
+        pending = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    results[i] = vector.tolist()
+                else:
+                    pending.setdefault(key, []).append(i)
+
+        found = self._disk_get_many(list(pending))
+        with self._lock:
+            for key, indices in pending.items():
+                vector = found.get(key)
+                if vector is None:
+                    self.misses += len(indices)
+                    continue
+                self.disk_hits += len(indices)
+                self._memory_put(key, vector)
+                for i in indices:
+                    results[i] = vector.tolist()
+        return results
+
+    def get(self, model: str, text: str) -> Optional[List[float]]:
+        return self.get_many(model, [text])[0]
+
+    def set_many(self, model: str, items: Iterable[Tuple[str, List[float]]]):
+        rows = []
+        with self._lock:
+            for text, embedding in items:
+                if not embedding:
+                    continue
+                key = cache_key(model, text)
+                vector = array("f", embedding)
+                self._memory_put(key, vector)
+                rows.append((key, model, vector))
+        self._disk_set_many(rows)
+
+    def set(self, model: str, text: str, embedding: List[float]):
+        self.set_many(model, [(text, embedding)])
+
+    def stats(self) -> Dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.path:
+            conn = self._conn()
+            conn.execute("DELETE FROM embeddings")
+            conn.commit()
+
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Get or create the process-wide embedding cache (None when disabled)"""
+    global _cache
+    from django.conf import settings
+    if not getattr(settings, "EMBEDDING_CACHE_ENABLED", True):
+        return None
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = EmbeddingCache(
+                    path=getattr(settings, "EMBEDDING_CACHE_PATH", None),
+                    memory_entries=getattr(settings, "EMBEDDING_CACHE_MEMORY_ENTRIES", 10000),
+                    disk_entries=getattr(settings, "EMBEDDING_CACHE_MAX_ENTRIES", 500000),
+                )
+    return _cache
+
+def embedding_cache_stats() -> Dict:
+    cache = get_embedding_cache()
+    return cache.stats() if cache else {}
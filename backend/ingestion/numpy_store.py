@@ -0,0 +1,380 @@
+# in-process vector index: memory-mapped float32 segments per namespace, searched with
+# vectorized cosine similarity (no network hop; meant for dev, CI and small single-node installs)
+import contextlib
+import itertools
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from .vector_store import SearchResult, VectorStore
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows; fall back to in-process locking only
+    fcntl = None
+
+SEARCH_BLOCK_ROWS = 8192
+RESCORE_OVERSAMPLING = 4
+# the newest segment is merged into the one before it while that one holds at most this many
+# times its live rows, which keeps the segment count (and rewrites per point) logarithmic
+SEGMENT_MERGE_RATIO = 2
+# all segments are rewritten into one once more than this fraction of their rows are dead
+COMPACT_DEAD_FRACTION = 0.5
+
+_segment_numbers = itertools.count()
+
+class _Segment:
+    """An immutable batch of points: L2-normalized row matrix plus ids/payloads by row.
+
+    For int8 storage, codes/scales hold the quantized copy searched first and
+    matrix holds the full float32 vectors (only touched when rescoring).
+    """
+    __slots__ = ("name", "matrix", "codes", "scales", "ids", "payloads")
+
+    def __init__(self, name, matrix, codes, scales, ids, payloads):
+        self.name = name
+        self.matrix = matrix
+        self.codes = codes
+        self.scales = scales
+        self.ids = ids
+        self.payloads = payloads
+
+class _Index:
+    """A loaded generation of a namespace: its segments and the dead (deleted or replaced) rows of each"""
+    __slots__ = ("generation", "quantization", "segments", "deleted", "live", "_positions")
+
+    def __init__(self, generation, quantization, segments: List[_Segment], deleted: List[Set[int]],
+                 positions: Optional[Dict[str, Tuple[str, int]]] = None):
+        self.generation = generation
+        self.quantization = quantization
+        self.segments = segments
+        self.deleted = deleted
+        self.live = []
+        for segment, dead in zip(segments, deleted):
+            mask = None
+            if dead:
+                mask = np.ones(len(segment.ids), dtype=bool)
+                mask[list(dead)] = False
+            self.live.append(mask)
+        self._positions = positions
+
+    def live_rows(self, i: int) -> int:
+        return len(self.segments[i].ids) - len(self.deleted[i])
+
+    def positions(self) -> Dict[str, Tuple[str, int]]:
+        """point id -> (segment name, row) of its live copy (writers only).
+
+        Built when a generation written by another process is first written to;
+        a write in this process updates the map and hands it on to the generation
+        it commits, so it is not rebuilt on every upsert or delete.
+        """
+        if self._positions is None:
+            positions = {}
+            for segment, dead in zip(self.segments, self.deleted):
+                for row, point_id in enumerate(segment.ids):
+                    if row not in dead:
+                        positions[point_id] = (segment.name, row)
+            self._positions = positions
+        return self._positions
+
+    def segment_numbers(self) -> Dict[str, int]:
+        return {segment.name: i for i, segment in enumerate(self.segments)}
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def _quantize_int8(matrix: np.ndarray):
+    """Symmetric per-row int8 scalar quantization: row ~= codes * scale"""
+    scales = np.abs(matrix).max(axis=1) / 127.0
+    scales[scales == 0] = 1.0
+    codes = np.clip(np.rint(matrix / scales[:, None]), -127, 127).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+class NumpyVectorStore(VectorStore):
+    """Brute-force cosine top-k over per-namespace segments stored as .npy files.
+
+    An upsert writes only its own points as a new segment (vectors, plus int8
+    codes, and a JSONL file of ids and payloads); rows it replaces and deleted
+    rows are only marked dead in the generation's manifest. Small segments are
+    merged as they accumulate and everything is compacted once most rows are
+    dead, so each point is rewritten a logarithmic number of times rather than
+    on every write.
+
+    Each write produces a new manifest generation and then atomically swaps the
+    CURRENT pointer, so readers never see a half-written index. The files of
+    the previous generation are kept until the next write, for readers that are
+    still opening them. Segments are opened with mmap, which makes loading
+    instant and lets all worker processes share the same page cache.
+    """
+
+    name = "numpy"
+
+    def __init__(self, root: str):
+        self.root = str(root)
+        self._indexes = {}
+        self._lock = threading.Lock()
+        self._write_locks = {}
+
+    def _dir(self, namespace: str) -> str:
+        return os.path.join(self.root, re.sub(r"[^A-Za-z0-9_.-]", "_", namespace))
+
+    def _current_generation(self, path: str) -> Optional[str]:
+        try:
+            with open(os.path.join(path, "CURRENT")) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def _read_segment(self, path: str, name: str, quantization: str) -> _Segment:
+        matrix = np.load(os.path.join(path, f"{name}.vectors.npy"), mmap_mode="r")
+        codes = scales = None
+        if quantization == "int8":
+            codes = np.load(os.path.join(path, f"{name}.codes.npy"), mmap_mode="r")
+            scales = np.load(os.path.join(path, f"{name}.scales.npy"))
+        ids, payloads = [], []
+        with open(os.path.join(path, f"{name}.points.jsonl")) as f:
+            for line in f:
+                point = json.loads(line)
+                ids.append(point["id"])
+                payloads.append(point["payload"])
+        return _Segment(name, matrix, codes, scales, ids, payloads)
+
+    def _load_generation(self, namespace: str) -> Optional[_Index]:
+        path = self._dir(namespace)
+        generation = self._current_generation(path)
+        if generation is None:
+            return None
+        cached = self._indexes.get(namespace)
+        if cached is not None and cached.generation == generation:
+            return cached
+        with open(os.path.join(path, f"manifest-{generation}.json")) as f:
+            manifest = json.load(f)
+        quantization = manifest.get("quantization", "none")
+        # segments never change once written, so the ones already open are reused
+        known = {}
+        if cached is not None and cached.quantization == quantization:
+            known = {segment.name: segment for segment in cached.segments}
+        segments, deleted = [], []
+        for entry in manifest["segments"]:
+            segment = known.get(entry["name"]) or self._read_segment(path, entry["name"], quantization)
+            segments.append(segment)
+            deleted.append(set(entry["deleted"]))
+        index = _Index(generation, quantization, segments, deleted)
+        with self._lock:
+            self._indexes[namespace] = index
+        return index
+
+    def _load(self, namespace: str) -> Optional[_Index]:
+        try:
+            return self._load_generation(namespace)
+        except FileNotFoundError:
+            # two writes went by while this reader was opening files; the newest generation is complete
+            return self._load_generation(namespace)
+
+    @contextlib.contextmanager
+    def _locked(self, namespace: str):
+        """Serialize writers of a namespace across threads and (where fcntl exists) processes"""
+        with self._lock:
+            thread_lock = self._write_locks.setdefault(namespace, threading.Lock())
+        path = self._dir(namespace)
+        os.makedirs(path, exist_ok=True)
+        with thread_lock, open(os.path.join(path, ".lock"), "w") as lock_file:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield path
+            finally:
+                if fcntl:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextlib.contextmanager
+    def _writing(self, namespace: str):
+        """The namespace's current index for a write (under _locked).
+
+        The write updates the index's positions() map in place for the next
+        generation; if it fails before committing, the map is dropped so it is
+        rebuilt from the unchanged index.
+        """
+        index = self._load(namespace)
+        try:
+            yield index
+        except BaseException:
+            if index is not None:
+                index._positions = None
+            raise
+
+    def _write_segment(self, path: str, matrix: np.ndarray, ids: list, payloads: list,
+                       quantization: str) -> _Segment:
+        name = f"seg-{time.time_ns():x}-{next(_segment_numbers)}"
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if quantization == "float16":
+            np.save(os.path.join(path, f"{name}.vectors.npy"), matrix.astype(np.float16))
+        else:
+            np.save(os.path.join(path, f"{name}.vectors.npy"), matrix)
+        if quantization == "int8":
+            codes, scales = _quantize_int8(matrix)
+            np.save(os.path.join(path, f"{name}.codes.npy"), codes)
+            np.save(os.path.join(path, f"{name}.scales.npy"), scales)
+        with open(os.path.join(path, f"{name}.points.jsonl"), "w") as f:
+            for point_id, payload in zip(ids, payloads):
+                f.write(json.dumps({"id": point_id, "payload": payload}) + "\n")
+        return self._read_segment(path, name, quantization)
+
+    def _merge(self, path: str, quantization: str, segments: List[_Segment], deleted: List[Set[int]]) -> _Segment:
+        """One new segment holding the live rows of segments"""
+        matrices, ids, payloads = [], [], []
+        for segment, dead in zip(segments, deleted):
+            live = np.ones(len(segment.ids), dtype=bool)
+            live[list(dead)] = False
+            rows = np.flatnonzero(live)
+            matrices.append(np.asarray(segment.matrix[rows], dtype=np.float32))
+            rows = rows.tolist()
+            ids.extend(segment.ids[row] for row in rows)
+            payloads.extend(segment.payloads[row] for row in rows)
+        return self._write_segment(path, np.concatenate(matrices), ids, payloads, quantization)
+
+    def _commit(self, namespace: str, path: str, previous: Optional[_Index], quantization: str,
+                segments: List[_Segment], deleted: List[Set[int]], positions: Dict[str, Tuple[str, int]]):
+        """Merge segments as needed, then publish them as the namespace's next generation.
+
+        positions must already reflect the write; rows moved by merging are updated here.
+        """
+        kept = [(segment, rows) for segment, rows in zip(segments, deleted) if len(rows) < len(segment.ids)]
+        segments, deleted = [segment for segment, _ in kept], [rows for _, rows in kept]
+        total = sum(len(segment.ids) for segment in segments)
+        dead = sum(len(rows) for rows in deleted)
+        changed_quantization = previous is not None and previous.quantization != quantization
+        merged_segments = []
+        if segments and (changed_quantization or dead > total * COMPACT_DEAD_FRACTION):
+            segments, deleted = [self._merge(path, quantization, segments, deleted)], [set()]
+            merged_segments.append(segments[0])
+        while len(segments) > 1:
+            newest = len(segments[-1].ids) - len(deleted[-1])
+            if len(segments[-2].ids) - len(deleted[-2]) > newest * SEGMENT_MERGE_RATIO:
+                break
+            merged = self._merge(path, quantization, segments[-2:], deleted[-2:])
+            segments, deleted = segments[:-2] + [merged], deleted[:-2] + [set()]
+            merged_segments.append(merged)
+        for segment in merged_segments:
+            positions.update((point_id, (segment.name, row)) for row, point_id in enumerate(segment.ids))
+
+        generation = f"{time.time_ns():x}"
+        with open(os.path.join(path, f"manifest-{generation}.json"), "w") as f:
+            json.dump({
+                "quantization": quantization,
+                "segments": [{"name": s.name, "deleted": sorted(rows)} for s, rows in zip(segments, deleted)],
+            }, f)
+        tmp = os.path.join(path, "CURRENT.tmp")
+        with open(tmp, "w") as f:
+            f.write(generation)
+        os.replace(tmp, os.path.join(path, "CURRENT"))
+        with self._lock:
+            self._indexes[namespace] = _Index(generation, quantization, segments, deleted, positions)
+
+        # files of the previous generation stay until the next write; older ones go (readers
+        # that still map them keep working through POSIX unlink semantics)
+        keep = {f"manifest-{generation}.json"} | {s.name for s in segments}
+        if previous is not None:
+            keep |= {f"manifest-{previous.generation}.json"} | {s.name for s in previous.segments}
+        for name in os.listdir(path):
+            if name.startswith(("manifest-", "seg-")) and name not in keep and name.split(".")[0] not in keep:
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(path, name))
+
+    def ensure_namespace(self, namespace, vector_size=1536, quantization="none"):
+        os.makedirs(self._dir(namespace), exist_ok=True)
+
+    def upsert(self, namespace, vectors, quantization="none"):
+        started = time.perf_counter()
+        vectors = list(vectors)
+        if not vectors:
+            return {"points": 0, "seconds": 0.0}
+        new_matrix = _normalize_rows(np.asarray([v["vector"] for v in vectors], dtype=np.float32))
+        with self._locked(namespace) as path, self._writing(namespace) as index:
+            segments = list(index.segments) if index else []
+            deleted = [set(rows) for rows in index.deleted] if index else []
+            if segments and segments[0].matrix.shape[1] != new_matrix.shape[1]:
+                raise ValueError(f"Vector size {new_matrix.shape[1]} does not match namespace {namespace} "
+                                 f"({segments[0].matrix.shape[1]})")
+            # the last copy of an id within the batch wins; earlier stored copies become dead rows
+            rows_by_id = {str(v["id"]): row for row, v in enumerate(vectors)}
+            positions = index.positions() if index else {}
+            numbers = index.segment_numbers() if index else {}
+            for point_id in rows_by_id:
+                position = positions.get(point_id)
+                if position is not None:
+                    deleted[numbers[position[0]]].add(position[1])
+            rows = list(rows_by_id.values())
+            segment = self._write_segment(path, new_matrix[rows], list(rows_by_id),
+                                          [vectors[row].get("payload", {}) for row in rows], quantization)
+            segments.append(segment)
+            deleted.append(set())
+            positions.update((point_id, (segment.name, row)) for row, point_id in enumerate(segment.ids))
+            self._commit(namespace, path, index, quantization, segments, deleted, positions)
+        seconds = time.perf_counter() - started
+        print(f"✓ Upserted {len(vectors)} points to numpy index: {namespace} ({seconds:.2f}s)")
+        return {"points": len(vectors), "seconds": seconds}
+
+    def delete(self, namespace, ids, vector_size=1536, quantization="none"):
+        if not ids:
+            return
+        removed = 0
+        with self._locked(namespace) as path, self._writing(namespace) as index:
+            if index is None:
+                return
+            deleted = [set(rows) for rows in index.deleted]
+            positions = index.positions()
+            numbers = index.segment_numbers()
+            for point_id in {str(i) for i in ids}:
+                position = positions.pop(point_id, None)
+                if position is not None:
+                    deleted[numbers[position[0]]].add(position[1])
+                    removed += 1
+            if removed:
+                self._commit(namespace, path, index, index.quantization, list(index.segments), deleted, positions)
+        print(f"✓ Deleted {removed} points from numpy index: {namespace}")
+
+    def _scores(self, segment: _Segment, query: np.ndarray, int8: bool) -> np.ndarray:
+        # blockwise so the int8 / float16 -> float32 upcast never materializes the whole matrix
+        matrix = segment.codes if int8 else segment.matrix
+        scores = np.empty(matrix.shape[0], dtype=np.float32)
+        for start in range(0, matrix.shape[0], SEARCH_BLOCK_ROWS):
+            block = matrix[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = block.astype(np.float32, copy=False) @ query
+        return scores * segment.scales if int8 else scores
+
+    def search(self, namespace, query_vector, k=4, quantization="none", rescore=True) -> List[SearchResult]:
+        index = self._load(namespace)
+        if index is None or k <= 0:
+            return []
+        query = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return []
+        query = query / norm
+        int8 = index.quantization == "int8"
+        wanted = k * RESCORE_OVERSAMPLING if int8 and rescore else k
+        hits = []  # (score, segment number, row), top candidates of every segment
+        for i, segment in enumerate(index.segments):
+            candidates = min(wanted, index.live_rows(i))
+            if candidates <= 0:
+                continue
+            scores = self._scores(segment, query, int8)
+            if index.live[i] is not None:
+                scores[~index.live[i]] = -np.inf
+            top = np.argpartition(-scores, candidates - 1)[:candidates]
+            if int8 and rescore:
+                # re-rank the oversampled candidates against the full float32 vectors
+                rows = np.sort(top)
+                exact = np.asarray(segment.matrix[rows]) @ query
+                hits.extend((score, i, row) for score, row in zip(exact.tolist(), rows.tolist()))
+            else:
+                hits.extend((float(scores[row]), i, row) for row in top.tolist())
+        hits.sort(key=lambda hit: hit[0], reverse=True)
+        return [SearchResult(index.segments[i].ids[row], float(score), index.segments[i].payloads[row])
+                for score, i, row in hits[:k]]
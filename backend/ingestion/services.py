@@ -1,32 +1,55 @@
-import os
-from typing import List, Dict, Optional
-from openai import OpenAI
+import asyncio
+import codecs
+import hashlib
+import itertools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Dict, Optional
+import openai
 from django.conf import settings
-from .vector_client import upsert_vectors, retrieve_top_k
+from utils import llm_clients
+from utils.tokens import estimate_tokens
+from .embedding_cache import get_embedding_cache, normalize_text
+from .vector_client import retrieve_top_k
+from .vector_store import get_vector_store
 import uuid
 
-# Lazy initialization of OpenAI client
-_openai_client = None
+# Chunk point ids are uuid5(CHUNK_ID_NAMESPACE, namespace/document_id/content hash/occurrence)
+CHUNK_ID_NAMESPACE = uuid.UUID("6f1f5b0e-3c59-4c8e-9a53-0d1c2b7d8e41")
 
 def get_openai_client():
-    """Get or create OpenAI client"""
-    global _openai_client
-    if _openai_client is None:
-        api_key = os.getenv("OPENAI_API_KEY") or getattr(settings, "OPENAI_API_KEY", None)
-        if not api_key:
-            raise ValueError("OPENAI_API_KEY is not set. Please set it in your environment variables or Django settings.")
-        _openai_client = OpenAI(api_key=api_key)
-    return _openai_client
-
-def get_embedding(text: str, model: str = "text-embedding-3-small") -> Optional[List[float]]:
+    """OpenAI client shared with the chat path (see utils.llm_clients)"""
+    return llm_clients.get_openai_client()
+
+def get_async_openai_client():
+    """AsyncOpenAI client for the running event loop"""
+    return llm_clients.get_async_openai_client()
+
+def _dimensions_params(dimensions: Optional[int]) -> Dict:
+    # text-embedding-3 models can return shortened vectors; None keeps the model's native size
+    return {"dimensions": dimensions} if dimensions else {}
+
+def _cache_model(model: str, dimensions: Optional[int]) -> str:
+    return f"{model}@{dimensions}" if dimensions else model
+
+def get_embedding(text: str, model: str = "text-embedding-3-small", dimensions: int = None) -> Optional[List[float]]:
     """Get embedding vector for text using OpenAI"""
+    cache = get_embedding_cache()
+    if cache:
+        cached = cache.get(_cache_model(model, dimensions), text)
+        if cached is not None:
+            return cached
     try:
         client = get_openai_client()
         response = client.embeddings.create(
             model=model,
-            input=text
+            input=text,
+            **_dimensions_params(dimensions)
         )
-        return response.data[0].embedding
+        embedding = response.data[0].embedding
+        if cache:
+            cache.set(_cache_model(model, dimensions), text, embedding)
+        return embedding
     except ValueError as e:
         # API key not set
         print(f"OpenAI API key not configured: {e}")
@@ -35,32 +58,229 @@ def get_embedding(text: str, model: str = "text-embedding-3-small") -> Optional[
         print(f"Error getting embedding: {e}")
         return None
 
+async def aget_embedding(text: str, model: str = "text-embedding-3-small",
+                         dimensions: int = None) -> Optional[List[float]]:
+    """Async get_embedding"""
+    cache = get_embedding_cache()
+    if cache:
+        # the cache's disk tier is SQLite; keep it off the event loop
+        cached = await asyncio.to_thread(cache.get, _cache_model(model, dimensions), text)
+        if cached is not None:
+            return cached
+    try:
+        client = get_async_openai_client()
+        response = await client.embeddings.create(
+            model=model,
+            input=text,
+            **_dimensions_params(dimensions)
+        )
+        embedding = response.data[0].embedding
+        if cache:
+            await asyncio.to_thread(cache.set, _cache_model(model, dimensions), text, embedding)
+        return embedding
+    except ValueError as e:
+        print(f"OpenAI API key not configured: {e}")
+        return None
+    except Exception as e:
+        print(f"Error getting embedding: {e}")
+        return None
+
+def _is_transient(error: Exception) -> bool:
+    """Rate limits, server errors and dropped connections: the same request may succeed later"""
+    if isinstance(error, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+def _is_too_large(error: Exception) -> bool:
+    """The request exceeds an input or token limit, so smaller batches may go through"""
+    if not isinstance(error, openai.BadRequestError):
+        return False
+    message = str(error).lower()
+    return any(hint in message for hint in ("maximum", "too many", "too large", "too long", "context length"))
+
+def _retry_delay(error: Exception, attempt: int) -> float:
+    """Server-requested Retry-After if given, else exponential backoff"""
+    response = getattr(error, "response", None)
+    try:
+        return float(response.headers["retry-after"])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        base = getattr(settings, "EMBEDDING_RETRY_BASE_SECONDS", 1.0)
+        return min(base * 2 ** attempt, getattr(settings, "EMBEDDING_RETRY_MAX_SECONDS", 30.0))
+
+def _embed_batch(texts: List[str], model: str, dimensions: int = None) -> List[Optional[List[float]]]:
+    """Embed a batch of texts.
+
+    Rate-limited and failed-upstream requests are retried as they are, with
+    backoff (EMBEDDING_RETRY_ATTEMPTS); only a batch rejected as too large is
+    split in half, so one oversized chunk doesn't drop the rest.
+    """
+    attempts = getattr(settings, "EMBEDDING_RETRY_ATTEMPTS", 5)
+    for attempt in range(attempts):
+        try:
+            client = get_openai_client()
+            response = client.embeddings.create(
+                model=model,
+                input=texts,
+                **_dimensions_params(dimensions)
+            )
+            embeddings = [None] * len(texts)
+            for item in response.data:
+                embeddings[item.index] = item.embedding
+            return embeddings
+        except ValueError as e:
+            # API key not set - retrying won't help
+            print(f"OpenAI API key not configured: {e}")
+            return [None] * len(texts)
+        except Exception as e:
+            if _is_too_large(e) and len(texts) > 1:
+                print(f"  Embedding batch of {len(texts)} is too large ({e}), splitting")
+                mid = len(texts) // 2
+                return _embed_batch(texts[:mid], model, dimensions) + _embed_batch(texts[mid:], model, dimensions)
+            if not _is_transient(e) or attempt == attempts - 1:
+                print(f"Error getting embeddings for a batch of {len(texts)}: {e}")
+                return [None] * len(texts)
+            delay = _retry_delay(e, attempt)
+            print(f"  Embedding batch of {len(texts)} failed ({e}), retrying in {delay:.1f}s")
+            time.sleep(delay)
+    return [None] * len(texts)
+
+def _plan_batches(texts: List[str], batch_size: int, max_tokens: int) -> List[List[int]]:
+    """Group text indices into batches bounded by item count and token budget"""
+    batches = []
+    current = []
+    current_tokens = 0
+    for i, text in enumerate(texts):
+        tokens = estimate_tokens(text)
+        if current and (len(current) >= batch_size or current_tokens + tokens > max_tokens):
+            batches.append(current)
+            current = []
+            current_tokens = 0
+        current.append(i)
+        current_tokens += tokens
+    if current:
+        batches.append(current)
+    return batches
+
+def get_embeddings(texts: List[str], model: str = "text-embedding-3-small", batch_size: int = None,
+                   max_tokens_per_batch: int = None, max_workers: int = None,
+                   dimensions: int = None) -> List[Optional[List[float]]]:
+    """Get embedding vectors for many texts using batched, concurrent OpenAI calls.
+
+    Returns a list aligned with texts; entries are None for texts that could not be embedded.
+    dimensions, if given, requests shortened vectors of that size.
+    """
+    if not texts:
+        return []
+    batch_size = batch_size or getattr(settings, "EMBEDDING_BATCH_SIZE", 128)
+    max_tokens_per_batch = max_tokens_per_batch or getattr(settings, "EMBEDDING_BATCH_MAX_TOKENS", 100000)
+    max_workers = max_workers or getattr(settings, "EMBEDDING_MAX_WORKERS", 4)
+
+    cache = get_embedding_cache()
+    cache_model = _cache_model(model, dimensions)
+    embeddings = cache.get_many(cache_model, texts) if cache else [None] * len(texts)
+    # embed each distinct uncached text once
+    missing = {}
+    for i, embedding in enumerate(embeddings):
+        if embedding is None:
+            missing.setdefault(texts[i], []).append(i)
+    if not missing:
+        return embeddings
+    unique_texts = list(missing)
+    batches = _plan_batches(unique_texts, batch_size, max_tokens_per_batch)
+
+    def run(indices):
+        return indices, _embed_batch([unique_texts[i] for i in indices], model, dimensions)
+
+    if len(batches) == 1 or max_workers <= 1:
+        results = [run(b) for b in batches]
+    else:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            results = list(executor.map(run, batches))
+    fresh = []
+    for indices, batch_embeddings in results:
+        for i, embedding in zip(indices, batch_embeddings):
+            text = unique_texts[i]
+            for pos in missing[text]:
+                embeddings[pos] = embedding
+            if embedding:
+                fresh.append((text, embedding))
+    if cache and fresh:
+        cache.set_many(cache_model, fresh)
+    return embeddings
+
+def iter_decoded_text(byte_chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    """Incrementally decode a stream of byte chunks (multi-byte characters may span chunks)"""
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for data in byte_chunks:
+        text = decoder.decode(data)
+        if text:
+            yield text
+    tail = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+def iter_file_text(path: str, encoding: str = "utf-8", read_size: int = 1024 * 1024) -> Iterator[str]:
+    """Stream a text file from disk without loading it into memory"""
+    with open(path, "rb") as f:
+        yield from iter_decoded_text(iter(lambda: f.read(read_size), b""), encoding)
+
+def iter_chunks(pieces: Iterable[str], chunk_size: int = 500, overlap: int = 50) -> Iterator[str]:
+    """Yield overlapping word chunks from a stream of text pieces.
+
+    Produces exactly the same chunks as chunk_text would for the concatenated
+    text, while holding at most one chunk's worth of words in memory.
+    """
+    step = chunk_size - overlap
+    words = []
+    partial = ""
+    for piece in pieces:
+        piece = partial + piece
+        parts = piece.split()
+        # the last word may continue in the next piece
+        partial = parts.pop() if parts and not piece[-1].isspace() else ""
+        words.extend(parts)
+        while len(words) >= chunk_size:
+            yield ' '.join(words[:chunk_size])
+            del words[:step]
+    if partial:
+        words.append(partial)
+    while words:
+        yield ' '.join(words[:chunk_size])
+        del words[:step]
+
 def chunk_text(text: str, chunk_size: int = 500, overlap: int = 50) -> List[str]:
     """Split text into chunks with overlap"""
-    words = text.split()
-    chunks = []
-    
-    for i in range(0, len(words), chunk_size - overlap):
-        chunk = ' '.join(words[i:i + chunk_size])
-        if chunk.strip():
-            chunks.append(chunk)
-    
-    return chunks
+    return list(iter_chunks([text], chunk_size, overlap))
+
+def chunk_fingerprint(chunk: str) -> str:
+    """Content hash of a chunk (whitespace-insensitive)"""
+    return hashlib.sha256(normalize_text(chunk).encode("utf-8")).hexdigest()
+
+def chunk_point_id(namespace: str, document_id: str, fingerprint: str, occurrence: int = 0) -> str:
+    """Deterministic point id: the same chunk of the same document always maps to the same point"""
+    return str(uuid.uuid5(CHUNK_ID_NAMESPACE, f"{namespace}/{document_id}/{fingerprint}/{occurrence}"))
 
-def process_text_for_ingestion(text: str, metadata: Dict = None) -> List[Dict]:
-    """Process text into chunks and create vectors"""
+def process_text_for_ingestion(text: str, metadata: Dict = None, namespace: str = "",
+                               document_id: str = None, embedding: Dict = None) -> List[Dict]:
+    """Process text into chunks and create vectors (with deterministic point ids)"""
     chunks = chunk_text(text)
+    document_id = document_id or "text-" + chunk_fingerprint(text)[:32]
     vectors = []
+    embeddings = get_embeddings(chunks, dimensions=(embedding or {}).get("dimensions"))
+    occurrences = {}
     
-    for i, chunk in enumerate(chunks):
-        embedding = get_embedding(chunk)
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
+        fingerprint = chunk_fingerprint(chunk)
+        occurrence = occurrences.get(fingerprint, 0)
+        occurrences[fingerprint] = occurrence + 1
         if embedding:
             vector_point = {
-                "id": str(uuid.uuid4()),
+                "id": chunk_point_id(namespace, document_id, fingerprint, occurrence),
                 "payload": {
                     "text": chunk,
                     "chunk_index": i,
                     "total_chunks": len(chunks),
+                    "document_id": document_id,
                     **(metadata or {})
                 },
                 "vector": embedding
@@ -69,12 +289,85 @@ def process_text_for_ingestion(text: str, metadata: Dict = None) -> List[Dict]:
     
     return vectors
 
-def ingest_documents(namespace: str, documents: List[str], metadata: Dict = None):
-    """Ingest multiple documents into vector database"""
+def ingest_chunks(namespace: str, chunks: Iterable[str], metadata: Dict = None,
+                  progress: Optional[Callable[..., None]] = None, window: int = None,
+                  document_id: str = "", known_ids: Optional[set] = None,
+                  on_window: Optional[Callable[[List[Dict]], None]] = None, embedding: Dict = None) -> int:
+    """Embed and upsert a stream of chunks in bounded windows.
+
+    Only `window` chunks are held in memory at a time. Each chunk gets a point id
+    derived from document_id and its content hash; chunks whose id is already in
+    known_ids are unchanged and skipped without embedding. on_window, if given,
+    receives [{"point_id", "fingerprint", "chunk_index", "new"}] for every chunk
+    of the window after its new points were upserted. progress, if given, is
+    called after each window with the number of chunks embedded, upserted and
+    left unchanged, and the index of the next chunk. embedding is the chatbot's
+    embedding_config() (output dimensions and storage quantization).
+    """
+    embedding = embedding or {}
+    window = window or getattr(settings, "EMBEDDING_BATCH_SIZE", 128) * getattr(settings, "EMBEDDING_MAX_WORKERS", 4)
+    known_ids = known_ids or set()
+    occurrences = {}
+    indexed_chunks = enumerate(chunks)
+    total_upserted = 0
+
+    while True:
+        batch = list(itertools.islice(indexed_chunks, window))
+        if not batch:
+            break
+        records = []
+        for i, chunk in batch:
+            fingerprint = chunk_fingerprint(chunk)
+            occurrence = occurrences.get(fingerprint, 0)
+            occurrences[fingerprint] = occurrence + 1
+            point_id = chunk_point_id(namespace, document_id, fingerprint, occurrence)
+            records.append({
+                "point_id": point_id,
+                "fingerprint": fingerprint,
+                "chunk_index": i,
+                "new": point_id not in known_ids,
+                "text": chunk,
+            })
+        new_records = [r for r in records if r["new"]]
+        embeddings = get_embeddings([r["text"] for r in new_records], dimensions=embedding.get("dimensions"))
+        vectors = []
+        for record, vector in zip(new_records, embeddings):
+            if vector:
+                vectors.append({
+                    "id": record["point_id"],
+                    "payload": {
+                        "text": record["text"],
+                        "chunk_index": record["chunk_index"],
+                        "document_id": document_id,
+                        **(metadata or {})
+                    },
+                    "vector": vector
+                })
+            else:
+                # not stored; leave it out so a later run retries it
+                record["new"] = None
+        if vectors:
+            try:
+                get_vector_store().upsert(namespace, vectors, quantization=embedding.get("quantization", "none"))
+            except Exception as e:
+                print(f"✗ Error storing vectors: {e}")
+                raise
+            total_upserted += len(vectors)
+        if on_window:
+            on_window([{k: v for k, v in r.items() if k != "text"} for r in records if r["new"] is not None])
+        if progress:
+            progress(embedded=len(vectors), upserted=len(vectors),
+                     unchanged=len(records) - len(new_records), position=batch[-1][0] + 1)
+
+    return total_upserted
+
+def ingest_documents(namespace: str, documents: List[str], metadata: Dict = None,
+                     progress: Optional[Callable[..., None]] = None, embedding: Dict = None):
+    """Ingest multiple documents into vector database (see ingest_chunks for progress)"""
     if not documents:
         return 0
     
-    all_vectors = []
+    total_upserted = 0
     
     for doc_idx, doc_text in enumerate(documents):
         if not doc_text or not doc_text.strip():
@@ -84,54 +377,55 @@ def ingest_documents(namespace: str, documents: List[str], metadata: Dict = None
             "document_index": doc_idx,
             **(metadata or {})
         }
-        try:
-            vectors = process_text_for_ingestion(doc_text, doc_metadata)
-            all_vectors.extend(vectors)
-            print(f"  Processed document {doc_idx + 1}: {len(vectors)} chunks created")
-        except Exception as e:
-            print(f"  Error processing document {doc_idx + 1}: {e}")
-            continue
+        document_id = "text-" + chunk_fingerprint(doc_text)[:32]
+        count = ingest_chunks(namespace, iter_chunks([doc_text]), doc_metadata, progress=progress,
+                              document_id=document_id, embedding=embedding)
+        total_upserted += count
+        print(f"  Processed document {doc_idx + 1}: {count} chunks stored")
     
-    if all_vectors:
-        try:
-            upsert_vectors(namespace, all_vectors)
-            print(f"✓ Successfully stored {len(all_vectors)} vectors in namespace: {namespace}")
-            return len(all_vectors)
-        except Exception as e:
-            print(f"✗ Error storing vectors in Qdrant: {e}")
-            raise
+    if total_upserted:
+        print(f"✓ Successfully stored {total_upserted} vectors in namespace: {namespace}")
     else:
         print("⚠ No vectors created from documents")
-        return 0
+    return total_upserted
 
-def search_similar(namespace: str, query_text: str, k: int = 4) -> List[str]:
-    """Search for similar documents in vector database"""
+def search_scored(namespace: str, query_text: str, k: int = 4, embedding: Dict = None) -> list:
+    """Search for similar chunks; returns hits with id, score and payload, best first"""
+    embedding = embedding or {}
     try:
         # Get embedding for query
-        query_embedding = get_embedding(query_text)
+        query_embedding = get_embedding(query_text, dimensions=embedding.get("dimensions"))
         if not query_embedding:
             return []
         
-        # Use Qdrant client to search
-        from ingestion.vector_client import get_client, ensure_collection
-        client = get_client()
-        # Ensure collection exists
-        ensure_collection(namespace, len(query_embedding))
-        
-        results = client.search(
-            collection_name=namespace,
-            query_vector=query_embedding,
-            limit=k
-        )
-        
-        # Extract text from results
-        texts = []
-        for result in results:
-            if hasattr(result, 'payload') and 'text' in result.payload:
-                texts.append(result.payload['text'])
-        
-        return texts
+        return get_vector_store().search(namespace, query_embedding, k,
+                                         quantization=embedding.get("quantization", "none"),
+                                         rescore=embedding.get("rescore", True))
+    except Exception as e:
+        print(f"Error searching vectors: {e}")
+        return []
+
+async def asearch_scored(namespace: str, query_text: str = None, k: int = 4, embedding: Dict = None,
+                         query_embedding: List[float] = None) -> list:
+    """Async search_scored; pass query_embedding when the question was already embedded"""
+    embedding = embedding or {}
+    try:
+        if query_embedding is None:
+            query_embedding = await aget_embedding(query_text, dimensions=embedding.get("dimensions"))
+        if not query_embedding:
+            return []
+        return await get_vector_store().asearch(namespace, query_embedding, k,
+                                                quantization=embedding.get("quantization", "none"),
+                                                rescore=embedding.get("rescore", True))
     except Exception as e:
         print(f"Error searching vectors: {e}")
         return []
 
+def search_similar(namespace: str, query_text: str, k: int = 4, embedding: Dict = None) -> List[str]:
+    """Search for similar documents in vector database (embedding: the chatbot's embedding_config())"""
+    # Extract text from results
+    texts = []
+    for result in search_scored(namespace, query_text, k, embedding):
+        if hasattr(result, 'payload') and 'text' in result.payload:
+            texts.append(result.payload['text'])
+    return texts
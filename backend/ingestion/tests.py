@@ -0,0 +1,159 @@
+import shutil
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+import httpx
+import numpy as np
+import openai
+from django.test import SimpleTestCase
+from utils.tokens import estimate_tokens
+from .context import assemble_context
+from .numpy_store import NumpyVectorStore
+from .services import _embed_batch
+from .vector_store import SearchResult
+
+def _points(ids, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    return [{"id": point_id, "vector": rng.normal(size=dim).tolist(), "payload": {"text": point_id}}
+            for point_id in ids]
+
+class NumpyVectorStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.store = NumpyVectorStore(self.root)
+
+    def assert_positions_match_disk(self, namespace="ns"):
+        """The positions map carried from write to write equals one rebuilt from the files"""
+        carried = self.store._load(namespace).positions()
+        rebuilt = NumpyVectorStore(self.root)._load(namespace).positions()
+        self.assertEqual(carried, rebuilt)
+
+    def test_search_finds_the_nearest_points(self):
+        for quantization in ("none", "float16", "int8"):
+            with self.subTest(quantization=quantization):
+                namespace = f"ns-{quantization}"
+                points = _points([f"p{i}" for i in range(200)])
+                self.store.upsert(namespace, points[:120], quantization=quantization)
+                self.store.upsert(namespace, points[120:], quantization=quantization)
+                hits = self.store.search(namespace, points[42]["vector"], k=3, quantization=quantization)
+                self.assertEqual(hits[0].id, "p42")
+                self.assertAlmostEqual(hits[0].score, 1.0, places=2)
+                self.assertEqual(hits[0].payload, {"text": "p42"})
+                self.assertEqual(len(hits), 3)
+
+    def test_upsert_replaces_and_delete_removes(self):
+        points = _points(["a", "b", "c"])
+        self.store.upsert("ns", points)
+        replaced = {**points[0], "payload": {"text": "a v2"}}
+        self.store.upsert("ns", [replaced])
+        hits = self.store.search("ns", points[0]["vector"], k=3)
+        self.assertEqual([hit.payload["text"] for hit in hits].count("a v2"), 1)
+        self.assertEqual(len(hits), 3)
+
+        self.store.delete("ns", ["a", "missing"])
+        hits = self.store.search("ns", points[0]["vector"], k=3)
+        self.assertEqual(sorted(hit.id for hit in hits), ["b", "c"])
+        self.assert_positions_match_disk()
+
+    def test_many_small_writes_are_merged(self):
+        ids = [f"p{i}" for i in range(300)]
+        points = _points(ids)
+        for start in range(0, len(points), 10):
+            self.store.upsert("ns", points[start:start + 10])
+            self.assert_positions_match_disk()
+        self.store.delete("ns", ids[:200])
+        self.assert_positions_match_disk()
+        index = self.store._load("ns")
+        self.assertLess(len(index.segments), 10)
+        self.assertEqual(sum(index.live_rows(i) for i in range(len(index.segments))), 100)
+        self.assertEqual(self.store.search("ns", points[250]["vector"], k=1)[0].id, "p250")
+
+    def test_writes_of_another_process_are_seen(self):
+        points = _points(["a", "b"])
+        other = NumpyVectorStore(self.root)
+        self.store.upsert("ns", points[:1])
+        other.upsert("ns", points[1:])
+        self.store.delete("ns", ["a"])
+        self.assertEqual([hit.id for hit in other.search("ns", points[1]["vector"], k=2)], ["b"])
+        self.assert_positions_match_disk()
+
+    def test_vector_size_mismatch_is_rejected(self):
+        self.store.upsert("ns", _points(["a"], dim=16))
+        with self.assertRaises(ValueError):
+            self.store.upsert("ns", _points(["b"], dim=8))
+        self.store.upsert("ns", _points(["c"], dim=16, seed=1))
+        self.assert_positions_match_disk()
+
+def _api_error(error_class, status_code: int, message: str):
+    response = httpx.Response(status_code, request=httpx.Request("POST", "https://api.openai.com/v1/embeddings"))
+    return error_class(message, response=response, body=None)
+
+class EmbedBatchTests(SimpleTestCase):
+    def embed(self, texts, *outcomes):
+        """Run _embed_batch against a client failing with outcomes (exceptions) before it succeeds"""
+        calls = []
+        outcomes = list(outcomes)
+
+        def create(model, input, **kwargs):
+            calls.append(list(input))
+            if outcomes:
+                error = outcomes.pop(0)
+                if callable(error):
+                    error = error(input)
+                if error is not None:
+                    raise error
+            return SimpleNamespace(data=[SimpleNamespace(index=i, embedding=[float(len(text))])
+                                         for i, text in enumerate(input)])
+
+        client = SimpleNamespace(embeddings=SimpleNamespace(create=create))
+        with mock.patch("ingestion.services.get_openai_client", return_value=client), \
+                mock.patch("ingestion.services.time.sleep") as sleep:
+            return _embed_batch(texts, "text-embedding-3-small"), calls, sleep
+
+    def test_rate_limited_batch_is_retried_whole_after_a_delay(self):
+        embeddings, calls, sleep = self.embed(["a", "bb"], _api_error(openai.RateLimitError, 429, "slow down"),
+                                              _api_error(openai.InternalServerError, 500, "oops"))
+        self.assertEqual(embeddings, [[1.0], [2.0]])
+        self.assertEqual(calls, [["a", "bb"]] * 3)
+        self.assertEqual(sleep.call_count, 2)
+        self.assertLess(sleep.call_args_list[0][0][0], sleep.call_args_list[1][0][0])
+
+    def test_only_a_too_large_batch_is_split(self):
+        too_long = lambda batch: (_api_error(openai.BadRequestError, 400, "maximum context length exceeded")
+                                  if "x" * 10 in batch else None)
+        embeddings, calls, sleep = self.embed(["a", "x" * 10, "c", "d"], too_long, too_long, None, too_long)
+        self.assertEqual(embeddings, [[1.0], None, [1.0], [1.0]])
+        sleep.assert_not_called()
+
+    def test_other_errors_are_not_retried(self):
+        embeddings, calls, sleep = self.embed(["a", "b"], _api_error(openai.AuthenticationError, 401, "bad key"))
+        self.assertEqual(embeddings, [None, None])
+        self.assertEqual(len(calls), 1)
+
+def _hit(text: str, score: float = 0.9) -> SearchResult:
+    return SearchResult(text[:8], score, {"text": text})
+
+def _words(prefix: str, count: int) -> str:
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+class AssembleContextTests(SimpleTestCase):
+    def test_low_scoring_and_empty_hits_are_dropped(self):
+        hits = [_hit("relevant answer", 0.8), _hit("   ", 0.7), _hit("barely related", 0.2)]
+        self.assertEqual(assemble_context(hits, min_score=0.3), ["relevant answer"])
+
+    def test_near_duplicates_of_a_better_hit_are_dropped(self):
+        text = _words("w", 40)
+        hits = [_hit(text, 0.9), _hit(text + " extra", 0.8), _hit(_words("other", 40), 0.7)]
+        self.assertEqual(assemble_context(hits), [text, _words("other", 40)])
+
+    def test_overlap_with_a_neighbouring_chunk_is_trimmed(self):
+        words = _words("w", 60).split()
+        first, second = " ".join(words[:40]), " ".join(words[30:])
+        self.assertEqual(assemble_context([_hit(first), _hit(second, 0.8)]), [first, " ".join(words[40:])])
+
+    def test_hits_are_packed_into_the_token_budget(self):
+        big, small = _words("big", 200), _words("small", 10)
+        budget = estimate_tokens(_words("best", 20)) + estimate_tokens(small)
+        hits = [_hit(_words("best", 20), 0.9), _hit(big, 0.8), _hit(small, 0.7)]
+        self.assertEqual(assemble_context(hits, max_tokens=budget), [_words("best", 20), small])
@@ -1,87 +1,253 @@
 # minimal qdrant client wrapper (adjust to your qdrant deployment)
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import itertools
 import os
+import threading
+import time
+from utils.http import client_options, register_client
 
 QDRANT_URL = os.getenv("QDRANT_URL", "http://localhost:6333")
+# bulk upsert tuning: points per request, pages in flight, and whether each page waits for indexing
+QDRANT_UPSERT_PAGE_SIZE = int(os.getenv("QDRANT_UPSERT_PAGE_SIZE", "256"))
+QDRANT_UPSERT_PARALLEL = int(os.getenv("QDRANT_UPSERT_PARALLEL", "2"))
+QDRANT_UPSERT_WAIT = os.getenv("QDRANT_UPSERT_WAIT", "True") == "True"
+# how long a collection confirmed to exist is trusted without asking Qdrant again
+QDRANT_COLLECTION_CACHE_TTL = int(os.getenv("QDRANT_COLLECTION_CACHE_TTL", "600"))
+# "per_chatbot": one collection per vector namespace; "shared": all namespaces of a shard share one
+# collection and are separated by an indexed "vector_namespace" payload filter
+QDRANT_STORAGE_MODE = os.getenv("QDRANT_STORAGE_MODE", "per_chatbot")
+QDRANT_SHARED_COLLECTION_PREFIX = os.getenv("QDRANT_SHARED_COLLECTION_PREFIX", "chatbots_shared")
+QDRANT_SHARD_COUNT = int(os.getenv("QDRANT_SHARD_COUNT", "1"))
 _client = None
+_known_collections = {}
+_registry_lock = threading.Lock()
+
+def _register_pool(client):
+    # qdrant-client builds its own httpx client; make its pool visible in utils.http.pool_stats()
+    api = getattr(getattr(client, "http", None), "client", None)
+    inner = getattr(api, "_client", None) or getattr(api, "_async_client", None)
+    if inner is not None:
+        register_client("qdrant", inner)
 
 def get_client():
     """Get or create Qdrant client (lazy initialization)"""
     global _client
     if _client is None:
         try:
-            _client = QdrantClient(url=QDRANT_URL)
+            _client = QdrantClient(url=QDRANT_URL, **client_options("qdrant"))
+            _register_pool(_client)
         except Exception as e:
             print(f"Warning: Could not initialize Qdrant client: {e}")
             raise
     return _client
 
+def get_async_client():
+    """Async Qdrant client for the running event loop"""
+    from qdrant_client import AsyncQdrantClient
+    from utils.aio import loop_singleton
+
+    def create():
+        client = AsyncQdrantClient(url=QDRANT_URL, **client_options("qdrant"))
+        _register_pool(client)
+        return client
+    return loop_singleton("qdrant", create)
+
 # For backward compatibility - use get_client() instead
 def client():
     return get_client()
 
-def ensure_collection(namespace: str, vector_size: int = 1536):
-    """Ensure collection exists, create if not"""
+def is_shared_mode() -> bool:
+    return QDRANT_STORAGE_MODE == "shared"
+
+def shared_collection_name(namespace: str, vector_size: int = 1536, quantization: str = "none") -> str:
+    """Shared collection holding namespace (stable hash of the namespace modulo the shard count).
+
+    Chatbots with non-default vector settings get their own family of shared
+    collections, since a collection has a single vector size and storage type.
+    """
+    shard = int(hashlib.sha1(namespace.encode("utf-8")).hexdigest(), 16) % max(1, QDRANT_SHARD_COUNT)
+    if vector_size != 1536 or quantization != "none":
+        return f"{QDRANT_SHARED_COLLECTION_PREFIX}_{vector_size}d_{quantization}_{shard}"
+    return f"{QDRANT_SHARED_COLLECTION_PREFIX}_{shard}"
+
+def collection_for(namespace: str, vector_size: int = 1536, quantization: str = "none") -> str:
+    """Physical collection that stores a chatbot's vector namespace"""
+    if is_shared_mode():
+        return shared_collection_name(namespace, vector_size, quantization)
+    return namespace
+
+def namespace_filter(namespace: str):
+    """Filter restricting a shared-collection query to one namespace (None in per-chatbot mode)"""
+    if not is_shared_mode():
+        return None
+    from qdrant_client.models import FieldCondition, Filter, MatchValue
+    return Filter(must=[FieldCondition(key="vector_namespace", match=MatchValue(value=namespace))])
+
+def _registry_valid(collection: str) -> bool:
+    expires = _known_collections.get(collection)
+    return expires is not None and expires > time.monotonic()
+
+def _remember(collection: str):
+    with _registry_lock:
+        _known_collections[collection] = time.monotonic() + QDRANT_COLLECTION_CACHE_TTL
+
+def _forget(collection: str = None):
+    with _registry_lock:
+        if collection is None:
+            _known_collections.clear()
+        else:
+            _known_collections.pop(collection, None)
+
+def remember_collection(namespace: str, vector_size: int = 1536, quantization: str = "none"):
+    """Record that a namespace's collection is known to exist (for QDRANT_COLLECTION_CACHE_TTL seconds)"""
+    _remember(collection_for(namespace, vector_size, quantization))
+
+def invalidate_collection(namespace: str = None, vector_size: int = 1536, quantization: str = "none"):
+    """Forget a namespace's collection (or all) so the next ensure_collection checks Qdrant again"""
+    _forget(collection_for(namespace, vector_size, quantization) if namespace else None)
+
+def is_missing_collection_error(e: Exception) -> bool:
+    return getattr(e, "status_code", None) == 404 or "not found" in str(e).lower()
+
+def _create_tenant_indexes(client, collection: str):
+    """Payload indexes that make per-chatbot filtering in a shared collection cheap"""
+    from qdrant_client.models import KeywordIndexParams, PayloadSchemaType
+    client.create_payload_index(collection, "vector_namespace",
+                                field_schema=KeywordIndexParams(type="keyword", is_tenant=True))
+    client.create_payload_index(collection, "chatbot_id", field_schema=PayloadSchemaType.INTEGER)
+    client.create_payload_index(collection, "tenant_id", field_schema=PayloadSchemaType.INTEGER)
+
+def _vector_storage(vector_size: int, quantization: str):
+    """VectorParams and quantization config for a storage mode ("none", "float16" or "int8")"""
+    from qdrant_client.models import (Datatype, ScalarQuantization, ScalarQuantizationConfig, ScalarType)
+    if quantization == "float16":
+        return VectorParams(size=vector_size, distance=Distance.COSINE, datatype=Datatype.FLOAT16), None
+    if quantization == "int8":
+        # full vectors stay on disk for rescoring; only the int8 copy is kept in RAM
+        return (VectorParams(size=vector_size, distance=Distance.COSINE, on_disk=True),
+                ScalarQuantization(scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99,
+                                                                   always_ram=True)))
+    return VectorParams(size=vector_size, distance=Distance.COSINE), None
+
+def _ensure_collection(collection: str, vector_size: int, shared: bool, quantization: str = "none"):
+    if _registry_valid(collection):
+        return
     try:
         client = get_client()
         try:
-            collections = client.get_collections().collections
-            collection_names = [c.name for c in collections]
+            exists = client.collection_exists(collection)
         except Exception as e:
             error_msg = f"Could not connect to Qdrant at {QDRANT_URL}: {e}"
             print(f"✗ {error_msg}")
             raise ConnectionError(error_msg)
         
-        if namespace not in collection_names:
-            client.create_collection(
-                collection_name=namespace,
-                vectors_config=VectorParams(size=vector_size, distance=Distance.COSINE)
-            )
-            print(f"✓ Created collection: {namespace} (vector size: {vector_size})")
-        else:
-            print(f"✓ Collection exists: {namespace}")
+        if not exists:
+            try:
+                vectors_config, quantization_config = _vector_storage(vector_size, quantization)
+                client.create_collection(
+                    collection_name=collection,
+                    vectors_config=vectors_config,
+                    quantization_config=quantization_config
+                )
+                if shared:
+                    _create_tenant_indexes(client, collection)
+                print(f"✓ Created collection: {collection} (vector size: {vector_size}, storage: {quantization})")
+            except Exception:
+                _forget(collection)
+                # another worker may have created it concurrently
+                if not client.collection_exists(collection):
+                    raise
+        _remember(collection)
     except ConnectionError:
         raise  # Re-raise connection errors
     except Exception as e:
-        error_msg = f"Error ensuring collection {namespace}: {e}"
+        error_msg = f"Error ensuring collection {collection}: {e}"
         print(f"✗ {error_msg}")
         raise Exception(error_msg)
 
-def upsert_vectors(namespace: str, vectors: list):
+def ensure_collection(namespace: str, vector_size: int = 1536, quantization: str = "none"):
+    """Ensure the namespace's collection exists, create if not.
+
+    Collections already confirmed within the TTL are trusted without a round trip.
     """
-    vectors: list of dict {"id": str, "payload": {...}, "vector": [floats]}
+    _ensure_collection(collection_for(namespace, vector_size, quantization), vector_size, is_shared_mode(),
+                       quantization)
+
+def _upsert_page(client, namespace: str, page: list, wait: bool, quantization: str = "none") -> float:
+    """Send one page of points; returns elapsed seconds"""
+    from qdrant_client.models import PointStruct
+    started = time.perf_counter()
+    vector_size = len(page[0]["vector"])
+    collection = collection_for(namespace, vector_size, quantization)
+    if is_shared_mode():
+        points = [PointStruct(id=v["id"], vector=v["vector"],
+                              payload={**v.get("payload", {}), "vector_namespace": namespace}) for v in page]
+    else:
+        points = [PointStruct(id=v["id"], vector=v["vector"], payload=v.get("payload", {})) for v in page]
+    try:
+        client.upsert(collection_name=collection, points=points, wait=wait)
+    except Exception as e:
+        if not is_missing_collection_error(e):
+            raise
+        # collection was deleted behind our back: recreate it and retry once
+        invalidate_collection(namespace, vector_size, quantization)
+        ensure_collection(namespace, vector_size, quantization)
+        client.upsert(collection_name=collection, points=points, wait=wait)
+    return time.perf_counter() - started
+
+def upsert_vectors(namespace: str, vectors, page_size: int = None, parallel: int = None, wait: bool = None,
+                   quantization: str = "none") -> dict:
     """
-    if not vectors:
-        return
+    vectors: iterable of dict {"id": str, "payload": {...}, "vector": [floats]}
+
+    Points are sent in pages of page_size, with up to `parallel` pages in flight
+    at once; only those pages are materialized, so vectors can be a generator.
+    With wait=False pages are acknowledged before indexing and the final page is
+    sent with wait=True as a consistency barrier (Qdrant applies a collection's
+    updates in order). Returns {"points", "pages", "page_seconds", "seconds"}.
+    """
+    page_size = page_size or QDRANT_UPSERT_PAGE_SIZE
+    parallel = max(1, parallel or QDRANT_UPSERT_PARALLEL)
+    wait = QDRANT_UPSERT_WAIT if wait is None else wait
+
+    iterator = iter(vectors)
+    first_page = list(itertools.islice(iterator, page_size))
+    if not first_page:
+        return {"points": 0, "pages": 0, "page_seconds": [], "seconds": 0.0}
     
     client = get_client()
     
     # Ensure collection exists
-    vector_size = len(vectors[0]["vector"]) if vectors else 1536
-    ensure_collection(namespace, vector_size)
-    
-    # Convert to Qdrant format
-    points = []
-    for v in vectors:
-        points.append({
-            "id": v["id"],
-            "vector": v["vector"],
-            "payload": v.get("payload", {})
-        })
+    vector_size = len(first_page[0]["vector"])
+    ensure_collection(namespace, vector_size, quantization)
     
+    started = time.perf_counter()
+    page_seconds = []
+    points = 0
     try:
-        from qdrant_client.models import PointStruct
-        # Convert to PointStruct format
-        point_structs = [
-            PointStruct(
-                id=point["id"],
-                vector=point["vector"],
-                payload=point["payload"]
-            ) for point in points
-        ]
-        client.upsert(collection_name=namespace, points=point_structs)
-        print(f"✓ Upserted {len(points)} points to collection: {namespace}")
+        next_page = list(itertools.islice(iterator, page_size))
+        if not next_page:
+            # single page: nothing to pipeline
+            page_seconds.append(_upsert_page(client, namespace, first_page, True, quantization))
+            points = len(first_page)
+        else:
+            with ThreadPoolExecutor(max_workers=parallel) as executor:
+                in_flight = []
+                page = first_page
+                # keep the last page back so it can serve as the barrier
+                while next_page:
+                    if len(in_flight) >= parallel:
+                        page_seconds.append(in_flight.pop(0).result())
+                    in_flight.append(executor.submit(_upsert_page, client, namespace, page, wait, quantization))
+                    points += len(page)
+                    page, next_page = next_page, list(itertools.islice(iterator, page_size))
+                for future in in_flight:
+                    page_seconds.append(future.result())
+            page_seconds.append(_upsert_page(client, namespace, page, True, quantization))
+            points += len(page)
     except Exception as e:
         error_msg = f"Error upserting vectors to Qdrant: {e}"
         print(f"✗ {error_msg}")
@@ -90,6 +256,110 @@ def upsert_vectors(namespace: str, vectors: list):
             raise ConnectionError(f"Could not connect to Qdrant at {QDRANT_URL}. Make sure Qdrant is running.")
         raise Exception(error_msg)
 
+    seconds = time.perf_counter() - started
+    timings = ", ".join(f"{t * 1000:.0f}ms" for t in page_seconds)
+    print(f"✓ Upserted {points} points to collection: {collection_for(namespace, vector_size, quantization)} in {len(page_seconds)} page(s) "
+          f"({seconds:.2f}s; per page: {timings})")
+    return {"points": points, "pages": len(page_seconds), "page_seconds": page_seconds, "seconds": seconds}
+
+def delete_points(namespace: str, ids: list, vector_size: int = 1536, quantization: str = "none"):
+    """Delete points by id (no-op for an empty list)"""
+    if not ids:
+        return
+    from qdrant_client.models import PointIdsList
+    client = get_client()
+    collection = collection_for(namespace, vector_size, quantization)
+    try:
+        client.delete(collection_name=collection, points_selector=PointIdsList(points=list(ids)))
+        print(f"✓ Deleted {len(ids)} points from collection: {collection}")
+    except Exception as e:
+        error_msg = f"Error deleting vectors from Qdrant: {e}"
+        print(f"✗ {error_msg}")
+        if "Connection" in str(e) or "refused" in str(e).lower():
+            raise ConnectionError(f"Could not connect to Qdrant at {QDRANT_URL}. Make sure Qdrant is running.")
+        raise Exception(error_msg)
+
+def search_vectors(namespace: str, query_vector: list, k: int = 4, quantization: str = "none",
+                   rescore: bool = True):
+    """Nearest neighbours of query_vector within a namespace; [] if nothing was ingested yet.
+
+    For int8 storage, rescore re-ranks oversampled candidates against the full vectors.
+    """
+    client = get_client()
+    collection = collection_for(namespace, len(query_vector), quantization)
+    try:
+        return client.query_points(
+            collection_name=collection,
+            query=query_vector,
+            query_filter=namespace_filter(namespace),
+            search_params=_search_params(quantization, rescore),
+            limit=k
+        ).points
+    except Exception as e:
+        if is_missing_collection_error(e):
+            _forget(collection)
+            return []
+        raise
+
+def _search_params(quantization: str, rescore: bool):
+    if quantization != "int8":
+        return None
+    from qdrant_client.models import QuantizationSearchParams, SearchParams
+    return SearchParams(quantization=QuantizationSearchParams(rescore=rescore, oversampling=2.0))
+
+async def asearch_vectors(namespace: str, query_vector: list, k: int = 4, quantization: str = "none",
+                          rescore: bool = True):
+    """Async search_vectors"""
+    collection = collection_for(namespace, len(query_vector), quantization)
+    try:
+        response = await get_async_client().query_points(
+            collection_name=collection,
+            query=query_vector,
+            query_filter=namespace_filter(namespace),
+            search_params=_search_params(quantization, rescore),
+            limit=k
+        )
+        return response.points
+    except Exception as e:
+        if is_missing_collection_error(e):
+            _forget(collection)
+            return []
+        raise
+
+def copy_collection_to_shared(namespace: str, batch_size: int = 256, delete_source: bool = False,
+                              quantization: str = "none") -> int:
+    """Copy a per-chatbot collection into its shared collection; returns the number of points copied"""
+    from qdrant_client.models import PointStruct
+    client = get_client()
+    if not client.collection_exists(namespace):
+        return 0
+    copied = 0
+    target = None
+    offset = None
+    while True:
+        points, offset = client.scroll(
+            collection_name=namespace, limit=batch_size, offset=offset, with_payload=True, with_vectors=True
+        )
+        if not points:
+            break
+        if target is None:
+            target = shared_collection_name(namespace, len(points[0].vector), quantization)
+            _ensure_collection(target, len(points[0].vector), True, quantization)
+        client.upsert(
+            collection_name=target,
+            points=[PointStruct(id=p.id, vector=p.vector, payload={**(p.payload or {}), "vector_namespace": namespace})
+                    for p in points],
+            wait=True,
+        )
+        copied += len(points)
+        if offset is None:
+            break
+    if delete_source:
+        client.delete_collection(namespace)
+        _forget(namespace)
+    print(f"✓ Copied {copied} points from {namespace} to {target}")
+    return copied
+
 def retrieve_top_k(namespace: str, query_text: str, k: int = 4):
     # This is now handled by ingestion/services.py search_similar
     # Keeping for backward compatibility
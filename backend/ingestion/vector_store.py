@@ -0,0 +1,82 @@
+# vector-store interface; the backend is selected with settings.VECTOR_BACKEND ("qdrant" or "numpy")
+import asyncio
+import threading
+from collections import namedtuple
+from typing import Iterable, List
+from django.conf import settings
+
+# common shape of search hits (qdrant's ScoredPoint has the same attributes)
+SearchResult = namedtuple("SearchResult", ["id", "score", "payload"])
+
+class VectorStore:
+    """Storage for embedded chunks, partitioned by chatbot vector namespace.
+
+    quantization is the namespace's storage mode: "none" (float32), "float16" or
+    "int8" (scalar quantization; rescore re-ranks candidates with full vectors).
+    """
+
+    name = ""
+
+    def ensure_namespace(self, namespace: str, vector_size: int = 1536, quantization: str = "none"):
+        raise NotImplementedError
+
+    def upsert(self, namespace: str, vectors: Iterable[dict], quantization: str = "none") -> dict:
+        """vectors: iterable of {"id": str, "payload": {...}, "vector": [floats]}"""
+        raise NotImplementedError
+
+    def delete(self, namespace: str, ids: list, vector_size: int = 1536, quantization: str = "none"):
+        raise NotImplementedError
+
+    def search(self, namespace: str, query_vector: List[float], k: int = 4, quantization: str = "none",
+               rescore: bool = True) -> list:
+        """Top-k hits (objects with id, score and payload), best first; [] for an empty namespace"""
+        raise NotImplementedError
+
+    async def asearch(self, namespace: str, query_vector: List[float], k: int = 4, quantization: str = "none",
+                      rescore: bool = True) -> list:
+        """Async search; backends without a native async client run search in a worker thread"""
+        return await asyncio.to_thread(self.search, namespace, query_vector, k, quantization, rescore)
+
+class QdrantVectorStore(VectorStore):
+    name = "qdrant"
+
+    def ensure_namespace(self, namespace, vector_size=1536, quantization="none"):
+        from .vector_client import ensure_collection
+        ensure_collection(namespace, vector_size, quantization)
+
+    def upsert(self, namespace, vectors, quantization="none"):
+        from .vector_client import upsert_vectors
+        return upsert_vectors(namespace, vectors, quantization=quantization)
+
+    def delete(self, namespace, ids, vector_size=1536, quantization="none"):
+        from .vector_client import delete_points
+        delete_points(namespace, ids, vector_size, quantization)
+
+    def search(self, namespace, query_vector, k=4, quantization="none", rescore=True):
+        from .vector_client import search_vectors
+        return search_vectors(namespace, query_vector, k, quantization, rescore)
+
+    async def asearch(self, namespace, query_vector, k=4, quantization="none", rescore=True):
+        from .vector_client import asearch_vectors
+        return await asearch_vectors(namespace, query_vector, k, quantization, rescore)
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+def get_vector_store(backend: str = None) -> VectorStore:
+    """Get the process-wide vector store for backend (default: settings.VECTOR_BACKEND)"""
+    backend = backend or getattr(settings, "VECTOR_BACKEND", "qdrant")
+    store = _stores.get(backend)
+    if store is None:
+        with _stores_lock:
+            store = _stores.get(backend)
+            if store is None:
+                if backend == "qdrant":
+                    store = QdrantVectorStore()
+                elif backend == "numpy":
+                    from .numpy_store import NumpyVectorStore
+                    store = NumpyVectorStore(getattr(settings, "NUMPY_VECTOR_DIR", "vector_index"))
+                else:
+                    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+                _stores[backend] = store
+    return store
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 08:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tenants', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='tenant',
+            name='instructions',
+            field=models.TextField(blank=True, default=''),
+        ),
+    ]
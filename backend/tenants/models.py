@@ -23,6 +23,8 @@ class Tenant(models.Model):
     is_active = models.BooleanField(default=True)
     # autogenerated workspace key (optional)
     workspace_key = models.CharField(max_length=64, unique=True, default=gen_key)
+    # instructions shared by all of the tenant's chatbots (sent after each chatbot's system prompt)
+    instructions = models.TextField(blank=True, default="")
 
     def __str__(self):
         return self.name
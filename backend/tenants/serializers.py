@@ -29,4 +29,4 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 class TenantSerializer(serializers.ModelSerializer):
     class Meta:
         model = Tenant
-        fields = ("id","name","workspace_key","created_at","is_active")
+        fields = ("id","name","workspace_key","instructions","created_at","is_active")
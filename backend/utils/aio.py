@@ -0,0 +1,22 @@
+# helpers for async code paths
+import asyncio
+import weakref
+from typing import Callable
+
+_per_loop = weakref.WeakKeyDictionary()
+
+def loop_singleton(name: str, factory: Callable[[], object]):
+    """One shared object per running event loop.
+
+    Async clients keep connections bound to the loop they were created on; under
+    ASGI there is a single long-lived loop, but sync entry points (management
+    commands, WSGI running async views) get a fresh loop per call.
+    """
+    loop = asyncio.get_running_loop()
+    objects = _per_loop.get(loop)
+    if objects is None:
+        objects = _per_loop[loop] = {}
+    obj = objects.get(name)
+    if obj is None:
+        obj = objects[name] = factory()
+    return obj
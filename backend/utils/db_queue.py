@@ -0,0 +1,80 @@
+# database-table job queue helpers (no external broker needed)
+import threading
+import time
+from typing import Callable, Optional
+from django.db import close_old_connections
+
+def claim_next(queryset, claim_field: str = "status", **updates):
+    """Atomically claim the oldest row in queryset.
+
+    Claiming is a conditional UPDATE on the row's current claim_field value, so
+    concurrent workers (threads or processes) never get the same row. Works on
+    every database backend, including SQLite.
+    """
+    model = queryset.model
+    for obj in queryset.order_by("pk")[:20]:
+        current = getattr(obj, claim_field)
+        claimed = model.objects.filter(pk=obj.pk, **{claim_field: current}).update(**updates)
+        if claimed:
+            obj.refresh_from_db()
+            return obj
+    return None
+
+class WorkerPool:
+    """Pool of threads that repeatedly claim and handle queue items.
+
+    claim() returns the next item or None; handle(item) processes it. Workers
+    sleep for poll_interval when the queue is empty.
+    """
+
+    def __init__(self, name: str, claim: Callable[[], Optional[object]], handle: Callable[[object], None],
+                 workers: int = 2, poll_interval: float = 1.0):
+        self.name = name
+        self.claim = claim
+        self.handle = handle
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._stop = threading.Event()
+        self._threads = []
+
+    def _run(self):
+        while not self._stop.is_set():
+            item = None
+            try:
+                close_old_connections()
+                item = self.claim()
+                if item is not None:
+                    self.handle(item)
+            except Exception as e:
+                print(f"✗ {self.name} worker error: {e}")
+                import traceback
+                traceback.print_exc()
+            finally:
+                close_old_connections()
+            if item is None:
+                self._stop.wait(self.poll_interval)
+
+    def start(self, daemon: bool = True):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"{self.name}-{i}", daemon=daemon)
+            t.start()
+            self._threads.append(t)
+        print(f"✓ Started {self.workers} {self.name} worker(s)")
+        return self
+
+    def stop(self, timeout: float = None):
+        self._stop.set()
+        for t in self._threads:
+            t.join(timeout)
+        self._threads = []
+
+    def run_forever(self):
+        """Start the workers and block until interrupted"""
+        self.start(daemon=True)
+        try:
+            while not self._stop.is_set():
+                time.sleep(0.5)
+        except KeyboardInterrupt:
+            print(f"Stopping {self.name} workers...")
+        finally:
+            self.stop()
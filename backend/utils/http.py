@@ -0,0 +1,107 @@
+# shared outbound HTTP: one keep-alive connection pool per upstream per process (per event loop for async)
+import threading
+import weakref
+from typing import Dict
+import httpx
+from django.conf import settings
+
+# upstream -> settings name of its timeout (seconds)
+UPSTREAM_TIMEOUTS = {
+    "openai": "OPENAI_HTTP_TIMEOUT",
+    "qdrant": "QDRANT_HTTP_TIMEOUT",
+    "graph": "GRAPH_API_HTTP_TIMEOUT",
+}
+
+_clients: Dict[str, httpx.Client] = {}
+# every client per upstream, for pool_stats() (weak: async clients die with their event loop)
+_registered: Dict[str, weakref.WeakSet] = {}
+_lock = threading.Lock()
+_requests = {}
+
+def http2_enabled() -> bool:
+    if not getattr(settings, "HTTP2_ENABLED", True):
+        return False
+    try:
+        import h2  # noqa: F401  (httpx needs it for HTTP/2)
+        return True
+    except ImportError:
+        return False
+
+def upstream_timeout(upstream: str) -> float:
+    return float(getattr(settings, UPSTREAM_TIMEOUTS.get(upstream, ""), None) or getattr(settings, "HTTP_TIMEOUT", 30))
+
+def upstream_limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=getattr(settings, "HTTP_POOL_MAX_CONNECTIONS", 100),
+        max_keepalive_connections=getattr(settings, "HTTP_POOL_MAX_KEEPALIVE", 20),
+        keepalive_expiry=getattr(settings, "HTTP_POOL_KEEPALIVE_EXPIRY", 30.0),
+    )
+
+def client_options(upstream: str) -> dict:
+    """httpx client options for an upstream (also used for clients created by SDKs, e.g. Qdrant)"""
+    return {"timeout": upstream_timeout(upstream), "limits": upstream_limits(), "http2": http2_enabled()}
+
+def _request_hook(upstream: str, is_async: bool = False):
+    def count(request):
+        with _lock:
+            _requests[upstream] = _requests.get(upstream, 0) + 1
+
+    async def acount(request):
+        count(request)
+    return acount if is_async else count
+
+def register_client(upstream: str, client):
+    """Include a client in pool_stats() and count its requests (also for clients created inside SDKs)"""
+    hooks = client.event_hooks
+    hooks["request"] = list(hooks.get("request", [])) + [_request_hook(upstream, isinstance(client, httpx.AsyncClient))]
+    client.event_hooks = hooks
+    with _lock:
+        _registered.setdefault(upstream, weakref.WeakSet()).add(client)
+
+def get_http_client(upstream: str) -> httpx.Client:
+    """Process-wide pooled client for upstream ("openai", "qdrant", "graph", ...)"""
+    client = _clients.get(upstream)
+    if client is None or client.is_closed:
+        with _lock:
+            client = _clients.get(upstream)
+            if client is None or client.is_closed:
+                client = httpx.Client(event_hooks={"request": [_request_hook(upstream)]}, **client_options(upstream))
+                _clients[upstream] = client
+                _registered.setdefault(upstream, weakref.WeakSet()).add(client)
+    return client
+
+def get_async_http_client(upstream: str) -> httpx.AsyncClient:
+    """Pooled async client for upstream, one per running event loop"""
+    from utils.aio import loop_singleton
+
+    def create():
+        client = httpx.AsyncClient(**client_options(upstream))
+        register_client(upstream, client)
+        return client
+    return loop_singleton(f"http:{upstream}", create)
+
+def _pool_connections(client):
+    # httpx keeps its httpcore pool private; report what it exposes and skip clients it doesn't
+    pool = getattr(getattr(client, "_transport", None), "_pool", None)
+    return list(getattr(pool, "connections", []) or [])
+
+def pool_stats() -> Dict[str, dict]:
+    """Per upstream: requests sent, open connections and how many are idle or using HTTP/2"""
+    with _lock:
+        clients = {upstream: list(items) for upstream, items in _registered.items()}
+        requests = dict(_requests)
+    stats = {}
+    for upstream, items in clients.items():
+        open_clients = [c for c in items if not c.is_closed]
+        connections = [conn for c in open_clients for conn in _pool_connections(c)]
+        idle = sum(1 for conn in connections if conn.is_idle())
+        stats[upstream] = {
+            "clients": len(open_clients),
+            "requests": requests.get(upstream, 0),
+            "connections": len(connections),
+            "active": len(connections) - idle,
+            "idle": idle,
+            "http2": sum(1 for conn in connections if "HTTP/2" in repr(conn)),
+            "max_connections": upstream_limits().max_connections,
+        }
+    return stats
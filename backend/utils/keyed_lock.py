@@ -0,0 +1,30 @@
+# per-key mutual exclusion for threads (locks exist only while held or waited on)
+import contextlib
+import threading
+from typing import Dict, Hashable
+
+class KeyedLock:
+    """Serialize work per key (e.g. per conversation) while different keys run in parallel"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks: Dict[Hashable, list] = {}  # key -> [lock, users]
+
+    @contextlib.contextmanager
+    def hold(self, key: Hashable):
+        with self._lock:
+            entry = self._locks.get(key)
+            if entry is None:
+                entry = self._locks[key] = [threading.Lock(), 0]
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._locks[key]
+
+    def __len__(self):
+        return len(self._locks)
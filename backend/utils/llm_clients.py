@@ -1,20 +1,115 @@
 import os
-from openai import OpenAI
+import threading
+from typing import AsyncIterator, Tuple
+from openai import AsyncOpenAI, OpenAI
+from utils.aio import loop_singleton
+from utils.http import get_async_http_client, get_http_client, upstream_timeout
 from django.conf import settings
 
-def ask_llm(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini"):
+_usage_lock = threading.Lock()
+_usage = {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0}
+
+def _record_usage(usage) -> dict:
+    details = getattr(usage, "prompt_tokens_details", None)
+    result = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+    with _usage_lock:
+        _usage["calls"] += 1
+        for key, value in result.items():
+            _usage[key] += value
+    return result
+
+def llm_usage_stats() -> dict:
+    """Token totals of this process; cached_tokens are prompt tokens served from the provider's prompt cache"""
+    with _usage_lock:
+        stats = dict(_usage)
+    stats["uncached_prompt_tokens"] = stats["prompt_tokens"] - stats["cached_tokens"]
+    stats["cached_ratio"] = stats["cached_tokens"] / stats["prompt_tokens"] if stats["prompt_tokens"] else 0.0
+    return stats
+
+def _api_key():
     api_key = os.getenv("OPENAI_API_KEY", settings.OPENAI_API_KEY if hasattr(settings, "OPENAI_API_KEY") else None)
     if not api_key:
         raise ValueError("OPENAI_API_KEY is not set")
-    
-    client = OpenAI(api_key=api_key)
-    
+    return api_key
+
+def _payload_messages(messages: list, system_prompt: str = None) -> list:
     payload_messages = []
     if system_prompt:
         payload_messages.append({"role": "system", "content": system_prompt})
     for m in messages:
         # m expected {'role','content'}
         payload_messages.append({"role": m.get("role"), "content": m.get("content")})
-    
-    response = client.chat.completions.create(model=model, messages=payload_messages)
-    return response.choices[0].message.content
+    return payload_messages
+
+def _finish(response) -> Tuple[str, dict]:
+    usage = _record_usage(response.usage) if getattr(response, "usage", None) else {}
+    if usage:
+        print(f"LLM prompt tokens: {usage['prompt_tokens']} ({usage['cached_tokens']} cached), "
+              f"completion tokens: {usage['completion_tokens']}")
+    return response.choices[0].message.content, usage
+
+_client = None
+_client_lock = threading.Lock()
+
+def get_openai_client() -> OpenAI:
+    """Process-wide OpenAI client on the shared "openai" connection pool"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = OpenAI(api_key=_api_key(), http_client=get_http_client("openai"),
+                                 timeout=upstream_timeout("openai"))
+    return _client
+
+def get_async_openai_client() -> AsyncOpenAI:
+    """AsyncOpenAI client for the running event loop, on its shared "openai" connection pool"""
+    api_key = _api_key()
+    return loop_singleton("openai", lambda: AsyncOpenAI(api_key=api_key, http_client=get_async_http_client("openai"),
+                                                        timeout=upstream_timeout("openai")))
+
+def complete_chat(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini",
+                  cache_key: str = None) -> Tuple[str, dict]:
+    """Run a chat completion; returns (reply, usage) with cached vs. uncached prompt tokens.
+
+    cache_key is sent as prompt_cache_key so requests sharing a prompt prefix
+    (e.g. the same chatbot) are routed to the same prompt cache.
+    """
+    client = get_openai_client()
+    extra = {"extra_body": {"prompt_cache_key": cache_key}} if cache_key else {}
+    response = client.chat.completions.create(model=model, messages=_payload_messages(messages, system_prompt),
+                                              **extra)
+    return _finish(response)
+
+async def acomplete_chat(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini",
+                         cache_key: str = None) -> Tuple[str, dict]:
+    """Async complete_chat (one AsyncOpenAI client per event loop)"""
+    client = get_async_openai_client()
+    extra = {"extra_body": {"prompt_cache_key": cache_key}} if cache_key else {}
+    response = await client.chat.completions.create(model=model, messages=_payload_messages(messages, system_prompt),
+                                                    **extra)
+    return _finish(response)
+
+async def astream_chat(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini",
+                      cache_key: str = None) -> AsyncIterator[str]:
+    """Stream a chat completion as text deltas (usage is recorded from the final chunk)"""
+    client = get_async_openai_client()
+    extra = {"extra_body": {"prompt_cache_key": cache_key}} if cache_key else {}
+    stream = await client.chat.completions.create(model=model, messages=_payload_messages(messages, system_prompt),
+                                                  stream=True, stream_options={"include_usage": True}, **extra)
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+        if getattr(chunk, "usage", None):
+            usage = _record_usage(chunk.usage)
+            print(f"LLM prompt tokens: {usage['prompt_tokens']} ({usage['cached_tokens']} cached), "
+                  f"completion tokens: {usage['completion_tokens']}")
+
+def ask_llm(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini", cache_key: str = None):
+    return complete_chat(messages, system_prompt, model, cache_key)[0]
+
+async def aask_llm(messages: list, system_prompt: str = None, model: str = "gpt-4o-mini", cache_key: str = None):
+    return (await acomplete_chat(messages, system_prompt, model, cache_key))[0]
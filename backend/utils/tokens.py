@@ -0,0 +1,25 @@
+# token counting helpers (tiktoken is optional, falls back to a chars/4 estimate)
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+_encoding = None
+
+def _get_encoding():
+    global _encoding
+    if _encoding is None and tiktoken is not None:
+        try:
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"Warning: Could not load tiktoken encoding: {e}")
+    return _encoding
+
+def estimate_tokens(text: str) -> int:
+    """Return the (approximate) number of tokens in text"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
@@ -103,6 +103,10 @@ export const chatbotAPI = {
     })
     return response.data
   },
+  getIngestionJob: async (chatbotId, jobId) => {
+    const response = await api.get(`/chatbot/${chatbotId}/ingest/${jobId}/`)
+    return response.data
+  },
   sendMessage: async (webhookKey, message, senderId) => {
     const response = await api.post(`/chatbot/webhook/${webhookKey}/`, {
       message,